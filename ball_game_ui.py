@@ -1,5 +1,4 @@
 import math
-import random
 import cv2
 import numpy as np
 import pandas as pd
@@ -10,9 +9,13 @@ from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLabel, QPushBut
 from PyQt5.QtCore import Qt, pyqtSignal, QTimer, QThread, pyqtSlot
 from PyQt5.QtGui import QPixmap, QFont, QImage
 from cvzone.HandTrackingModule import HandDetector
+from hand_tracking import GatedHandDetector, SkeletonRenderer, print_gate_stats
+from session_recorder import start_session_recording
 import cvzone
 import os
 from db_utils import db
+from db_writer import print_write_result
+from ball_physics import BallPhysics
 
 # Higher resolution for better visibility
 WEBCAM_WIDTH = 640
@@ -27,13 +30,16 @@ class BallGameThread(QThread):
     def __init__(self):
         super().__init__()
         self.running = False
+        self.recorder = None
         self.detector = None
+        # Draws the detected hand skeleton, set enabled=False for headless scoring
+        self.skeleton = SkeletonRenderer()
         self.patient_name = ""
-        # Start the ball in the center of the screen with integer coordinates
-        self.ball_pos = [int(WEBCAM_WIDTH // 2), int(WEBCAM_HEIGHT // 2)]
-        self.speed_x = 7  # Reduce initial speed for easier gameplay
-        self.speed_y = 7
-        self.score = [0, 0]
+        # Ball movement and scoring run on a fixed timestep, independent of frame rate
+        self.physics = BallPhysics()
+        self.ball_pos = self.physics.render_position()
+        self.speed_x, self.speed_y = self.physics.vel
+        self.score = self.physics.score
         self.game_over = False
         self.images = {}
         
@@ -128,7 +134,7 @@ class BallGameThread(QThread):
         try:
             print("Initializing hand detector...")
             # Lower detection confidence threshold for better detection in varied conditions
-            self.detector = HandDetector(detectionCon=0.5, maxHands=2)
+            self.detector = GatedHandDetector(HandDetector(detectionCon=0.5, maxHands=2))
             print("Hand detector initialized successfully")
         except Exception as e:
             print(f"Error initializing hand detector: {e}")
@@ -193,10 +199,16 @@ class BallGameThread(QThread):
         game_duration = 60  # Extended to 60 seconds for better gameplay
         last_frame_time = time.time()  # Track when we last processed a frame
         target_frame_time = 1.0 / 30  # Target 30 fps (33ms per frame)
+        last_physics_time = time.perf_counter()  # Clock for advancing the ball physics
         
         # For smooth display, maintain the last good frame
         last_good_frame = None
         
+        # Optional session recording, fed from the frame signal inside this thread
+        self.recorder = start_session_recording("Ball", self.patient_name)
+        if self.recorder:
+            self.change_pixmap_signal.connect(self.recorder.submit, Qt.DirectConnection)
+        
         self.running = True
         print("Starting game loop...")
         while self.running:
@@ -242,9 +254,14 @@ class BallGameThread(QThread):
             frame_count += 1
             process_hands = (frame_count % PROCESS_EVERY_N_FRAME == 0)
             
+            # Measure real elapsed time so ball speed doesn't depend on frame rate
+            now = time.perf_counter()
+            frame_time = now - last_physics_time
+            last_physics_time = now
+            
             # Update game state - ignore the game_over return value as we're using timer now
             img, self.ball_pos, self.speed_x, self.speed_y, self.score, _ = self.update_game(
-                img, process_hands)
+                img, process_hands, frame_time)
             
             # Emit score update (but not too frequently to avoid GUI thread overload)
             if frame_count % 5 == 0:
@@ -277,7 +294,8 @@ class BallGameThread(QThread):
                     self.change_pixmap_signal.emit(img)
                     
                     # Update the patient's score in database
-                    self.update_ball_score(self.patient_name, final_score)
+                    self.update_ball_score(self.patient_name, final_score,
+                                           {"duration_s": round(elapsed_time, 1), "frames": frame_count})
                     
                     # Signal game over
                     self.game_over_signal.emit(final_score)
@@ -292,8 +310,16 @@ class BallGameThread(QThread):
             self.change_pixmap_signal.emit(img)
         
         # Release resources
+        if self.recorder:
+            self.change_pixmap_signal.disconnect(self.recorder.submit)
+            self.recorder.close()
+            self.recorder = None
+        
         print("Releasing camera resources...")
         cap.release()
+        print_gate_stats("Ball game", self.detector)
+        # Release the database connection this thread used for the score update
+        db.close_thread_connection()
         print("Game thread finished")
     
     def create_static_overlays(self):
@@ -322,8 +348,14 @@ class BallGameThread(QThread):
             cv2.rectangle(self.base_frame, (width-160, 10), (width-10, 40), 
                          (40, 40, 40), cv2.FILLED)
             
-    def update_game(self, frame, process_hands=True):
-        """Update game state and draw game elements"""
+    def update_game(self, frame, process_hands=True, frame_time=0.0):
+        """Update game state and draw game elements
+        
+        Args:
+            frame: The camera frame to draw on
+            process_hands: Whether to run hand detection on this frame
+            frame_time: Wall-clock seconds since the previous frame, fed to the physics
+        """
         # Ensure we have a valid frame
         if frame is None:
             return frame, self.ball_pos, self.speed_x, self.speed_y, self.score, True
@@ -368,7 +400,8 @@ class BallGameThread(QThread):
         hands = []
         if process_hands:
             try:
-                hands, frame = self.detector.findHands(frame, flipType=False, draw=True)
+                hands = self.detector.detect(frame, flipType=False)
+                self.skeleton.draw(frame, hands)
                 
                 # Draw more visible hand landmarks for better feedback
                 if hands:
@@ -409,7 +442,7 @@ class BallGameThread(QThread):
                 cv2.putText(frame, "Hand detection error - trying to recover", 
                           (20, 70), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
         
-        # Handle hand detection and bat positioning
+        # Place paddles from the detected hands
         if hands:
             for hand in hands:
                 try:
@@ -424,92 +457,51 @@ class BallGameThread(QThread):
                     # Set paddle position with the hand center
                     y1 = y - h1 // 2
                     y1 = np.clip(y1, 20, WEBCAM_HEIGHT - h1 - 20)
-
-                    if hand['type'] == "Left":
-                        try:
-                            left_bat = self.images["left_bat"]
-                            # Check dimensions before overlay
-                            if y1 + left_bat.shape[0] <= frame.shape[0]:
-                                frame = cvzone.overlayPNG(frame, left_bat, (20, y1))
-                            else:
-                                # Draw a simple rectangle as fallback
-                                cv2.rectangle(frame, (20, y1), (20 + 20, y1 + 80), (0, 255, 0), -1)
-                        except Exception as e:
-                            print(f"Error drawing left bat: {e}")
-                            # Fallback to simple rectangle
-                            cv2.rectangle(frame, (20, y1), (20 + 20, y1 + 80), (0, 255, 0), -1)
-                            
-                        # Handle collision - increased hit zone for better gameplay
-                        # Expanded paddle hit zone by 10 pixels in each direction
-                        paddle_left = 15  # Slightly before the visible paddle
-                        paddle_right = 20 + w1 + 10  # Slightly after the visible paddle
-                        paddle_top = y1 - 10  # Slightly above the visible paddle
-                        paddle_bottom = y1 + h1 + 10  # Slightly below the visible paddle
-                        
-                        if paddle_left < self.ball_pos[0] < paddle_right and paddle_top < self.ball_pos[1] < paddle_bottom:
-                            if self.speed_x < 0:  # Only bounce if ball is moving toward the paddle
-                                self.speed_x = -self.speed_x
-                                # Add slight random vertical variation for more interesting gameplay
-                                self.speed_y += random.uniform(-1, 1)
-                                # Make sure vertical speed doesn't get too extreme
-                                self.speed_y = np.clip(self.speed_y, -10, 10)
-                                
-                                self.ball_pos[0] += 20
-                                self.score[0] += 1
-
-                    if hand['type'] == "Right":
-                        try:
-                            right_bat = self.images["right_bat"]
-                            # Check dimensions before overlay
-                            if y1 + right_bat.shape[0] <= frame.shape[0]:
-                                frame = cvzone.overlayPNG(frame, right_bat, (WEBCAM_WIDTH - 40, y1))
-                            else:
-                                # Draw a simple rectangle as fallback
-                                cv2.rectangle(frame, (WEBCAM_WIDTH - 40, y1), (WEBCAM_WIDTH - 40 + 20, y1 + 80), (0, 255, 0), -1)
-                        except Exception as e:
-                            print(f"Error drawing right bat: {e}")
-                            # Fallback to simple rectangle
-                            cv2.rectangle(frame, (WEBCAM_WIDTH - 40, y1), (WEBCAM_WIDTH - 40 + 20, y1 + 80), (0, 255, 0), -1)
-                            
-                        # Handle collision - increased hit zone for better gameplay
-                        # Expanded paddle hit zone by 10 pixels in each direction
-                        paddle_left = WEBCAM_WIDTH - 40 - 30 - 10  # Slightly before the visible paddle 
-                        paddle_right = WEBCAM_WIDTH - 40 + 10  # Slightly after the visible paddle
-                        paddle_top = y1 - 10  # Slightly above the visible paddle
-                        paddle_bottom = y1 + h1 + 10  # Slightly below the visible paddle
-                        
-                        if paddle_left < self.ball_pos[0] < paddle_right and paddle_top < self.ball_pos[1] < paddle_bottom:
-                            if self.speed_x > 0:  # Only bounce if ball is moving toward the paddle
-                                self.speed_x = -self.speed_x
-                                # Add slight random vertical variation for more interesting gameplay
-                                self.speed_y += random.uniform(-1, 1)
-                                # Make sure vertical speed doesn't get too extreme
-                                self.speed_y = np.clip(self.speed_y, -10, 10)
-                                
-                                self.ball_pos[0] -= 20
-                                self.score[1] += 1
+                    
+                    if hand['type'] in ("Left", "Right"):
+                        self.physics.set_paddle(hand['type'], y1)
                 except Exception as e:
                     print(f"Error handling bat: {e}")
         
-        # Move the Ball
-        if self.ball_pos[1] >= WEBCAM_HEIGHT - 40 or self.ball_pos[1] <= 20:
-            self.speed_y = -self.speed_y
-
-        # Update ball position and ensure they stay as integers
-        self.ball_pos[0] += self.speed_x
-        self.ball_pos[1] += self.speed_y
-        
-        # Make sure ball position values are integers
-        self.ball_pos[0] = int(self.ball_pos[0])
-        self.ball_pos[1] = int(self.ball_pos[1])
-        
-        # Keep ball within horizontal boundaries (bounce off sides if no paddle)
-        if self.ball_pos[0] < 40:
-            self.ball_pos[0] = 40
-            self.speed_x = abs(self.speed_x)  # Reverse direction
-        elif self.ball_pos[0] > WEBCAM_WIDTH - 40:
-            self.ball_pos[0] = WEBCAM_WIDTH - 40
-            self.speed_x = -abs(self.speed_x)  # Reverse direction
+        # Advance the fixed-timestep simulation by the time since the last frame
+        # (collisions are swept inside the physics steps, so low fps can't tunnel)
+        self.physics.advance(frame_time)
+        self.ball_pos = self.physics.render_position()
+        self.speed_x, self.speed_y = self.physics.vel
+        self.score = self.physics.score
+        
+        # Draw the paddles that are still in play
+        left_y = self.physics.active_paddle("Left")
+        if left_y is not None:
+            y1 = int(left_y)
+            try:
+                left_bat = self.images["left_bat"]
+                # Check dimensions before overlay
+                if y1 + left_bat.shape[0] <= frame.shape[0]:
+                    frame = cvzone.overlayPNG(frame, left_bat, (20, y1))
+                else:
+                    # Draw a simple rectangle as fallback
+                    cv2.rectangle(frame, (20, y1), (20 + 20, y1 + 80), (0, 255, 0), -1)
+            except Exception as e:
+                print(f"Error drawing left bat: {e}")
+                # Fallback to simple rectangle
+                cv2.rectangle(frame, (20, y1), (20 + 20, y1 + 80), (0, 255, 0), -1)
+        
+        right_y = self.physics.active_paddle("Right")
+        if right_y is not None:
+            y1 = int(right_y)
+            try:
+                right_bat = self.images["right_bat"]
+                # Check dimensions before overlay
+                if y1 + right_bat.shape[0] <= frame.shape[0]:
+                    frame = cvzone.overlayPNG(frame, right_bat, (WEBCAM_WIDTH - 40, y1))
+                else:
+                    # Draw a simple rectangle as fallback
+                    cv2.rectangle(frame, (WEBCAM_WIDTH - 40, y1), (WEBCAM_WIDTH - 40 + 20, y1 + 80), (0, 255, 0), -1)
+            except Exception as e:
+                print(f"Error drawing right bat: {e}")
+                # Fallback to simple rectangle
+                cv2.rectangle(frame, (WEBCAM_WIDTH - 40, y1), (WEBCAM_WIDTH - 40 + 20, y1 + 80), (0, 255, 0), -1)
 
         # Draw the ball
         try:
@@ -566,21 +558,21 @@ class BallGameThread(QThread):
         self.running = False
         self.wait()
     
-    def update_ball_score(self, patient_name, score):
-        """Update the ball score in the database"""
+    def update_ball_score(self, patient_name, score, data=None):
+        """Update the ball score in the database, with optional session data"""
         try:
             print(f"Updating ball score for {patient_name} to {score}")
             # Find patient by name in the database
-            patient_df = db.get_patient_by_name(patient_name)
+            patients = db.search_patients(patient_name)
             
-            if not patient_df.empty:
-                # Get the first matching patient's ID
-                patient_id = patient_df.iloc[0]['id']
+            if patients:
+                # Get the best matching patient's ID
+                patient_id = patients[0].id
                 print(f"Found patient ID: {patient_id}")
                 
-                # Update the score in the database
-                db.update_assessment_score(patient_id, "ball", score)
-                print(f"Successfully updated ball score to {score} for patient ID {patient_id}")
+                # Queue the score for the database writer so the game never waits on disk
+                print_write_result(db.submit_assessment_score(patient_id, "ball", score, data),
+                                   f"ball score {score} for patient ID {patient_id}")
                 return True
             else:
                 print(f"Error: No patient found with name {patient_name}")
@@ -0,0 +1,154 @@
+"""
+Fixed-timestep simulation core for the ball bouncing game.
+
+The camera loop runs at whatever rate the machine manages, so moving the ball
+a fixed number of pixels per processed frame made ball speed (and therefore
+the score) depend on hardware, and let the ball tunnel through a bat when the
+frame rate dropped. BallPhysics instead advances the ball in fixed steps of
+simulated time, sweeps the ball path against the paddle faces in every step
+and exposes an interpolated position for drawing.
+"""
+
+import random
+
+# Playing field, matching the webcam resolution used by the ball game
+FIELD_WIDTH = 640
+FIELD_HEIGHT = 480
+
+# Physics runs at 120 Hz regardless of the camera or render frame rate
+PHYSICS_HZ = 120
+PHYSICS_DT = 1.0 / PHYSICS_HZ
+# Never simulate more than this much time per frame (e.g. after a stall)
+MAX_FRAME_TIME = 0.25
+
+# Speeds in pixels per second (the old loop moved 7 px per frame at ~30 fps)
+BALL_SPEED_X = 210.0
+BALL_SPEED_Y = 210.0
+MAX_SPEED_Y = 300.0
+BOUNCE_JITTER_Y = 30.0
+
+# Vertical limits of the ball and side walls behind the paddles
+TOP_WALL = 20
+BOTTOM_WALL = FIELD_HEIGHT - 40
+LEFT_WALL = 40
+RIGHT_WALL = FIELD_WIDTH - 40
+
+# Paddle faces the ball is swept against, including the expanded hit zone
+LEFT_PADDLE_FACE = 50
+RIGHT_PADDLE_FACE = FIELD_WIDTH - 80
+PADDLE_HEIGHT = 80
+PADDLE_MARGIN = 10
+# How long a paddle stays in play after its hand was last detected
+PADDLE_HOLD_TIME = 0.5
+
+
+class BallPhysics:
+    """Ball and paddle state advanced with a fixed timestep"""
+
+    def __init__(self, seed=None):
+        """Initialize the simulation with the ball in the center of the field
+
+        Args:
+            seed: Optional seed for the bounce jitter so sessions can be replayed
+        """
+        self.rng = random.Random(seed)
+        self.pos = [FIELD_WIDTH / 2.0, FIELD_HEIGHT / 2.0]
+        self.prev_pos = list(self.pos)
+        self.vel = [BALL_SPEED_X, BALL_SPEED_Y]
+        self.score = [0, 0]
+        self.sim_time = 0.0
+        self.accumulator = 0.0
+        # Top y coordinate of each paddle and the sim time it was last seen
+        self.paddles = {"Left": None, "Right": None}
+        self.paddle_seen = {"Left": 0.0, "Right": 0.0}
+
+    def set_paddle(self, side, top_y):
+        """Place a paddle from the latest hand detection"""
+        self.paddles[side] = float(top_y)
+        self.paddle_seen[side] = self.sim_time
+
+    def active_paddle(self, side):
+        """Return the paddle top y if the paddle is still in play, else None"""
+        top = self.paddles.get(side)
+        if top is None:
+            return None
+        if self.sim_time - self.paddle_seen[side] > PADDLE_HOLD_TIME:
+            return None
+        return top
+
+    def advance(self, frame_time):
+        """Advance the simulation by the wall-clock time since the last frame
+
+        Returns:
+            list: Paddle sides ("Left"/"Right") that hit the ball during this frame
+        """
+        self.accumulator += min(max(frame_time, 0.0), MAX_FRAME_TIME)
+        hits = []
+        while self.accumulator >= PHYSICS_DT:
+            self.prev_pos = list(self.pos)
+            hits.extend(self.step(PHYSICS_DT))
+            self.sim_time += PHYSICS_DT
+            self.accumulator -= PHYSICS_DT
+        return hits
+
+    def step(self, dt):
+        """Move the ball by one fixed step with swept paddle and wall collisions"""
+        hits = []
+        x0, y0 = self.pos
+        x1 = x0 + self.vel[0] * dt
+        y1 = y0 + self.vel[1] * dt
+
+        # Top and bottom walls
+        if y1 <= TOP_WALL:
+            y1 = 2 * TOP_WALL - y1
+            self.vel[1] = abs(self.vel[1])
+        elif y1 >= BOTTOM_WALL:
+            y1 = 2 * BOTTOM_WALL - y1
+            self.vel[1] = -abs(self.vel[1])
+
+        # Paddle faces: find where the path crosses the face plane this step
+        if self.vel[0] < 0 and x0 >= LEFT_PADDLE_FACE > x1:
+            if self._paddle_covers("Left", x0, y0, x1, y1, LEFT_PADDLE_FACE):
+                x1 = 2 * LEFT_PADDLE_FACE - x1
+                self._bounce(1)
+                self.score[0] += 1
+                hits.append("Left")
+        elif self.vel[0] > 0 and x0 <= RIGHT_PADDLE_FACE < x1:
+            if self._paddle_covers("Right", x0, y0, x1, y1, RIGHT_PADDLE_FACE):
+                x1 = 2 * RIGHT_PADDLE_FACE - x1
+                self._bounce(-1)
+                self.score[1] += 1
+                hits.append("Right")
+
+        # Side walls behind the paddles (a missed ball still comes back)
+        if x1 < LEFT_WALL:
+            x1 = 2 * LEFT_WALL - x1
+            self.vel[0] = abs(self.vel[0])
+        elif x1 > RIGHT_WALL:
+            x1 = 2 * RIGHT_WALL - x1
+            self.vel[0] = -abs(self.vel[0])
+
+        self.pos = [x1, y1]
+        return hits
+
+    def _paddle_covers(self, side, x0, y0, x1, y1, face_x):
+        """Check if the paddle covers the point where the ball crosses its face"""
+        top = self.active_paddle(side)
+        if top is None:
+            return False
+        t = (face_x - x0) / (x1 - x0)
+        cross_y = y0 + (y1 - y0) * t
+        return top - PADDLE_MARGIN <= cross_y <= top + PADDLE_HEIGHT + PADDLE_MARGIN
+
+    def _bounce(self, direction):
+        """Send the ball back with a little vertical variation"""
+        self.vel[0] = direction * abs(self.vel[0])
+        self.vel[1] += self.rng.uniform(-BOUNCE_JITTER_Y, BOUNCE_JITTER_Y)
+        self.vel[1] = max(-MAX_SPEED_Y, min(MAX_SPEED_Y, self.vel[1]))
+
+    def render_position(self):
+        """Ball position interpolated between the last two physics steps"""
+        alpha = self.accumulator / PHYSICS_DT
+        x = self.prev_pos[0] + (self.pos[0] - self.prev_pos[0]) * alpha
+        y = self.prev_pos[1] + (self.pos[1] - self.prev_pos[1]) * alpha
+        return [int(round(x)), int(round(y))]
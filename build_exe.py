@@ -43,48 +43,14 @@ def ensure_database_exists():
     if not db_path.exists():
         print("SQLite database not found. Creating one with sample data...")
         try:
-            # First try to import and run the dedicated script
-            try:
-                from create_database import create_database
-                create_database()
-                return True
-            except ImportError:
-                print("Could not import create_database module. Creating simple database...")
-                
-            # If that fails, create a simple database directly
+            # Create the schema through the migrations so it matches the app
             conn = sqlite3.connect(db_path)
-            cursor = conn.cursor()
-            
-            # Create basic patients table
-            cursor.execute('''
-            CREATE TABLE IF NOT EXISTS patients (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                age INTEGER,
-                gender TEXT,
-                speech_score REAL,
-                emoji_score REAL,
-                snake_score REAL,
-                ball_score REAL
-            )
-            ''')
-            
-            # Add some sample data
-            patients = [
-                ('John Smith', 68, 'Male', 75.5, 82.0, 65.0, 70.0),
-                ('Mary Johnson', 72, 'Female', 68.0, 75.5, 60.0, 62.5),
-                ('Robert Davis', 65, 'Male', 80.0, 78.5, 72.0, 75.0)
-            ]
-            
-            cursor.executemany('''
-            INSERT INTO patients 
-            (name, age, gender, speech_score, emoji_score, snake_score, ball_score)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', patients)
-            
-            conn.commit()
+            from db_migrations import migrate
+            migrate(conn)
+            from create_database import seed_sample_data
+            seed_sample_data(conn)
             conn.close()
-            print("Simple database created successfully.")
+            print("Database created successfully.")
             return True
             
         except Exception as e:
@@ -191,10 +157,17 @@ def build_exe():
         images_dir.mkdir(exist_ok=True)
         data_params.append(f"--add-data={images_dir}{os.pathsep}images")
     
-    # Ensure SQLite database exists and add it to the package
+    # Ensure SQLite database exists and add a snapshot of it to the package;
+    # the app may be running, and a plain file copy could miss the WAL
     if ensure_database_exists():
-        db_path = Path("neurowell.db").absolute()
-        print(f"Adding SQLite database: {db_path}")
+        from db_snapshot import take_snapshot
+        db_path = (spec_dir / "neurowell.db").absolute()
+        try:
+            report = take_snapshot("neurowell.db", db_path)
+            print(f"Adding SQLite database snapshot: {db_path} ({report.pages} pages)")
+        except Exception as e:
+            print(f"Error taking database snapshot, adding the database file itself: {e}")
+            db_path = Path("neurowell.db").absolute()
         data_params.append(f"--add-data={db_path}{os.pathsep}.")
     else:
         print("WARNING: Could not create or find SQLite database.")
@@ -2,6 +2,59 @@ import sqlite3
 import os
 from pathlib import Path
 
+# Hot queries and the index each is expected to use (matched as a prefix)
+HOT_QUERIES = [
+    ("Patient history",
+     "SELECT * FROM assessment_results WHERE patient_id = ? ORDER BY assessment_date DESC",
+     (1,), "idx_assessment_results_patient_date"),
+    ("Patient history by type",
+     "SELECT * FROM assessment_results WHERE patient_id = ? AND assessment_type = ? "
+     "ORDER BY assessment_date DESC",
+     (1, "Snake"), "idx_assessment_results_patient_type_date"),
+    ("Assessments between dates",
+     "SELECT * FROM assessment_results WHERE patient_id = ? "
+     "AND assessment_date >= ? AND assessment_date < ? ORDER BY assessment_date",
+     (1, 1680307200000, 1682899200000), "idx_assessment_results_patient_date"),
+    ("Category history",
+     "SELECT * FROM assessment_results WHERE patient_id = ? AND category = ? "
+     "ORDER BY assessment_date DESC",
+     (1, "Balance"), "idx_assessment_results_patient_category_date"),
+    ("Rehabilitation plans",
+     "SELECT * FROM rehabilitation_plans WHERE patient_id = ? ORDER BY created_date DESC",
+     (1,), "idx_rehabilitation_plans_patient_created"),
+    ("Plan exercises",
+     "SELECT * FROM exercises WHERE plan_id = ?",
+     (1,), "idx_exercises_plan"),
+    ("Delete patient history",
+     "DELETE FROM assessment_results WHERE patient_id = ?",
+     (1,), "idx_assessment_results_patient"),
+    ("Patient name search",
+     "SELECT p.* FROM patients_fts JOIN patients p ON p.id = patients_fts.rowid "
+     "WHERE patients_fts MATCH ? ORDER BY patients_fts.rank LIMIT 100",
+     ('"john"',), "patients_fts"),
+]
+
+def check_query_plans(cursor):
+    """Run EXPLAIN QUERY PLAN on the hot queries and check they use their indexes
+    
+    Returns:
+        list: (description, ok, plan text) per query
+    """
+    results = []
+    for description, query, params, expected_index in HOT_QUERIES:
+        try:
+            cursor.execute(f"EXPLAIN QUERY PLAN {query}", params)
+        except sqlite3.OperationalError as e:
+            results.append((description, False, f"unavailable: {e}"))
+            continue
+        plan = " | ".join(row[3] for row in cursor.fetchall())
+        # FTS5 tables show up as a virtual table scan driven by the MATCH
+        uses_index = (f"INDEX {expected_index}" in plan
+                      or f"SCAN {expected_index} VIRTUAL TABLE INDEX" in plan)
+        needs_sort = "TEMP B-TREE" in plan
+        results.append((description, uses_index and not needs_sort, plan))
+    return results
+
 def check_database():
     """Check the database structure and contents"""
     db_path = Path("neurowell.db")
@@ -21,6 +74,10 @@ def check_database():
         integrity = cursor.fetchone()[0]
         print(f"Integrity check: {integrity}")
         
+        # Check schema version
+        cursor.execute("PRAGMA user_version")
+        print(f"Schema version: {cursor.fetchone()[0]}")
+        
         # Get list of tables
         cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
         tables = [table[0] for table in cursor.fetchall()]
@@ -34,6 +91,11 @@ def check_database():
             for col in columns:
                 print(f"  {col[1]} ({col[2]})")
         
+        # Check the hot queries use their indexes
+        print("\nQuery plans:")
+        for description, ok, plan in check_query_plans(cursor):
+            print(f"  [{'OK' if ok else 'SLOW'}] {description}: {plan}")
+        
         # Check number of records in each table
         for table in tables:
             cursor.execute(f"SELECT COUNT(*) FROM {table}")
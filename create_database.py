@@ -1,16 +1,16 @@
 import os
 import sqlite3
 from pathlib import Path
+from db_migrations import migrate, iso_to_ms_sql
 
-def create_database():
+def create_database(db_path="neurowell.db"):
     """
     Create and pre-seed a SQLite database for the NeuroWell application.
     """
     print("Creating NeuroWell SQLite Database")
     print("=================================")
     
-    # Define database path
-    db_path = Path("neurowell.db")
+    db_path = Path(db_path)
     
     # Check if database already exists
     if db_path.exists():
@@ -21,68 +21,21 @@ def create_database():
             return
         else:
             print("Overwriting existing database...")
+            db_path.unlink()
     
-    # Create the database and connect to it
+    # Create the database and bring the schema to the current version
     conn = sqlite3.connect(db_path)
+    migrate(conn)
+    seed_sample_data(conn)
+    conn.close()
+    
+    print(f"Database created successfully at {db_path.absolute()}")
+    print("Ready to be used with the NeuroWell application.")
+
+def seed_sample_data(conn):
+    """Insert the sample patients, assessments, plans and exercises"""
     cursor = conn.cursor()
     
-    # Create patients table
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS patients (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT NOT NULL,
-        age INTEGER,
-        gender TEXT,
-        speech_score REAL,
-        emoji_score REAL,
-        snake_score REAL,
-        ball_score REAL,
-        created_date TEXT,
-        last_assessment TEXT
-    )
-    ''')
-    
-    # Create assessment_results table for detailed assessment data
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS assessment_results (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        patient_id INTEGER,
-        assessment_type TEXT,
-        score REAL,
-        details TEXT,
-        assessment_date TEXT,
-        FOREIGN KEY (patient_id) REFERENCES patients (id)
-    )
-    ''')
-    
-    # Create rehabilitation_plans table
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS rehabilitation_plans (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        patient_id INTEGER,
-        plan_name TEXT,
-        description TEXT,
-        created_date TEXT,
-        status TEXT,
-        FOREIGN KEY (patient_id) REFERENCES patients (id)
-    )
-    ''')
-    
-    # Create exercises table
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS exercises (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        plan_id INTEGER,
-        exercise_name TEXT,
-        description TEXT,
-        frequency TEXT,
-        duration TEXT,
-        completed BOOLEAN DEFAULT 0,
-        FOREIGN KEY (plan_id) REFERENCES rehabilitation_plans (id)
-    )
-    ''')
-    
-    # Pre-seed the database with sample data
     print("Adding sample patients...")
     
     # Sample patients data
@@ -136,10 +89,11 @@ def create_database():
                     date
                 ))
     
-    cursor.executemany('''
+    # Dates are stored as milliseconds since the Unix epoch
+    cursor.executemany(f'''
     INSERT INTO assessment_results
     (patient_id, assessment_type, score, details, assessment_date)
-    VALUES (?, ?, ?, ?, ?)
+    VALUES (?, ?, ?, ?, {iso_to_ms_sql("?")})
     ''', assessment_results)
     
     # Sample rehabilitation plans
@@ -158,10 +112,10 @@ def create_database():
         (10, 'General Rehabilitation', 'General rehabilitation program', '2023-04-20', 'Active')
     ]
     
-    cursor.executemany('''
+    cursor.executemany(f'''
     INSERT INTO rehabilitation_plans
     (patient_id, plan_name, description, created_date, status)
-    VALUES (?, ?, ?, ?, ?)
+    VALUES (?, ?, ?, {iso_to_ms_sql("?")}, ?)
     ''', rehab_plans)
     
     # Sample exercises
@@ -203,12 +157,7 @@ def create_database():
     VALUES (?, ?, ?, ?, ?, ?)
     ''', exercises)
     
-    # Commit changes and close connection
     conn.commit()
-    conn.close()
-    
-    print(f"Database created successfully at {db_path.absolute()}")
-    print("Ready to be used with the NeuroWell application.")
 
 if __name__ == "__main__":
     create_database() 
\ No newline at end of file
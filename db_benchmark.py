@@ -0,0 +1,764 @@
+"""
+Latency benchmark for the DatabaseManager methods.
+
+Runs every public DatabaseManager method against a scratch copy of the
+database and prints per-call latency. With --compare, each method is also run
+with a new connection opened for every call (how the manager used to work), so
+the two connection strategies can be compared side by side. The read cache
+is off for these runs; --cache runs them again with it on.
+
+With --mixed, reader and writer threads hammer the database at the same time
+under each settings profile (e.g. the legacy rollback journal versus WAL) and
+the throughput and latency of both sides are reported.
+
+With --indexes, a synthetic database with a million assessment rows is built
+and the hot history queries are timed before and after the index migration.
+
+With --writes, the same score records are stored one call at a time, with one
+bulk executemany call and through the background writer thread.
+
+With --imports, synthetic patient and history CSV files are loaded with the
+bulk importer, with and without deferred indexes, and compared with inserting
+one row per call.
+
+With --timestamps, one-month range queries over a synthetic history are timed
+and the table and index sizes measured with TEXT dates and again after the
+migration to integer epoch milliseconds.
+
+With --scale, databases of increasing size are generated with db_generate
+and, for each, every method is timed and the concurrent reader/writer
+workload run. The latency percentiles and throughput are written to a JSON
+file, and compared with an earlier results file given as --baseline, which
+flags methods that have become slower.
+
+Usage:
+    python db_benchmark.py [--db neurowell.db] [--repeat 200] [--compare | --cache]
+    python db_benchmark.py --mixed [--profiles legacy balanced] [--seconds 5]
+    python db_benchmark.py --indexes [--rows 1000000] [--patients 10000]
+    python db_benchmark.py --writes 5000 [--profile balanced]
+    python db_benchmark.py --imports 100000
+    python db_benchmark.py --timestamps [--rows 1000000] [--patients 10000]
+    python db_benchmark.py --scale [--sizes 1000 10000 100000 1000000] [--baseline baseline.json]
+"""
+
+import argparse
+import contextlib
+import csv
+import io
+import json
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from db_utils import DatabaseManager, DB_PROFILES, DEFAULT_PROFILE, to_epoch_ms
+from db_cache import CACHE_SIZE
+from db_migrations import migrate, iso_to_ms_sql, SCHEMA_VERSION
+from check_database import HOT_QUERIES, check_query_plans
+from db_import import import_patients_csv, import_history_csv
+from db_export import export_history_csv
+from db_generate import generate_database
+
+# Methods that read or write every row; --scale calls them fewer times
+BULK_METHODS = ("get_all_patients", "fetch_patients", "iter_patients", "patient_columns",
+                "export_patient_data_to_csv", "export_history_csv")
+SCALE_BULK_REPEAT = 5
+# Average assessment results per patient in the --scale databases
+SCALE_ROWS_PER_PATIENT = 20
+# A method is a regression if its p50 grows by more than the tolerance and this many microseconds
+REGRESSION_MIN_US = 50
+
+
+class PerCallConnectionManager(DatabaseManager):
+    """DatabaseManager that opens a new connection for every call"""
+
+    def get_connection(self):
+        # Closed by the garbage collector as soon as the method returns
+        return self._open_connection()
+
+
+def time_calls(func, repeat, setup=None, warmup=10):
+    """Call func repeat times and return the per-call latencies in seconds
+
+    Args:
+        func: The callable to time
+        repeat: Number of timed calls
+        setup: Optional untimed callable whose return value is passed to func
+        warmup: Untimed calls made first so imports and caches are warm
+    """
+    timings = []
+    # Silence the methods' debug printing so it doesn't dominate the timings
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(warmup):
+            func(*(setup() if setup else ()))
+        for _ in range(repeat):
+            args = setup() if setup else ()
+            start = time.perf_counter()
+            func(*args)
+            timings.append(time.perf_counter() - start)
+    return timings
+
+
+def summarize(timings):
+    """Latency statistics in microseconds"""
+    ordered = sorted(timings)
+    return {
+        "calls": len(ordered),
+        "mean_us": statistics.fmean(ordered) * 1e6,
+        "p50_us": ordered[len(ordered) // 2] * 1e6,
+        "p95_us": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1e6,
+        "p99_us": ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1e6,
+    }
+
+
+def method_workloads(manager, work_dir):
+    """(name, func, setup) for every public DatabaseManager method"""
+    conn = manager.get_connection()
+    patient_id = conn.execute("SELECT id FROM patients ORDER BY id LIMIT 1").fetchone()[0]
+    patient_name = conn.execute("SELECT name FROM patients WHERE id = ?", (patient_id,)).fetchone()[0]
+    plan_id = manager.create_rehabilitation_plan(patient_id, "Benchmark plan", "Benchmark")
+    exercise_id = manager.add_exercise_to_plan(plan_id, "Benchmark exercise", "", "Daily", "5 minutes")
+    csv_path = str(Path(work_dir) / "patients_export.csv")
+    history_path = str(Path(work_dir) / "history_export.csv")
+
+    def new_patient():
+        with contextlib.redirect_stdout(io.StringIO()):
+            return (manager.add_patient("Benchmark Delete", 70, "Female"),)
+
+    def flushed():
+        manager.writer.flush()
+        return ()
+
+    def new_patients():
+        with contextlib.redirect_stdout(io.StringIO()):
+            return ([manager.add_patient("Benchmark Delete", 70, "Female") for _ in range(10)],)
+
+    return [
+        ("get_all_patients", manager.get_all_patients, None),
+        ("fetch_patients", manager.fetch_patients, None),
+        ("iter_patients", lambda: sum(1 for _ in manager.iter_patients()), None),
+        ("patient_columns", manager.patient_columns, None),
+        ("get_patients_page", lambda: manager.get_patients_page(limit=50), None),
+        ("get_patient_by_id", lambda: manager.get_patient_by_id(patient_id), None),
+        ("fetch_patient", lambda: manager.fetch_patient(patient_id), None),
+        ("get_patient_by_name", lambda: manager.get_patient_by_name(patient_name[:4]), None),
+        ("search_patients", lambda: manager.search_patients(patient_name[:4]), None),
+        ("get_patient_assessment_history",
+         lambda: manager.get_patient_assessment_history(patient_id), None),
+        ("get_patient_assessment_history (type)",
+         lambda: manager.get_patient_assessment_history(patient_id, "Snake"), None),
+        ("fetch_assessment_history", lambda: manager.fetch_assessment_history(patient_id), None),
+        ("fetch_assessment_history (type)",
+         lambda: manager.fetch_assessment_history(patient_id, "Snake"), None),
+        ("get_assessments_between",
+         lambda: manager.get_assessments_between(patient_id, "2023-01-01", "2024-01-01"), None),
+        ("get_metric_history", lambda: manager.get_metric_history(patient_id, "Physio", "reach"), None),
+        ("fetch_assessment_summary", lambda: manager.fetch_assessment_summary(patient_id), None),
+        ("get_score_trend", lambda: manager.get_score_trend(patient_id, "Snake"), None),
+        ("get_rehabilitation_plans", lambda: manager.get_rehabilitation_plans(patient_id), None),
+        ("fetch_rehabilitation_plans", lambda: manager.fetch_rehabilitation_plans(patient_id), None),
+        ("get_exercises_for_plan", lambda: manager.get_exercises_for_plan(plan_id), None),
+        ("fetch_plan_exercises", lambda: manager.fetch_plan_exercises(plan_id), None),
+        ("add_patient", lambda: manager.add_patient("Benchmark Patient", 70, "Male"), None),
+        ("update_assessment_score",
+         lambda: manager.update_assessment_score(patient_id, "Snake", 50), None),
+        ("update_assessment_scores_bulk (10)",
+         lambda: manager.update_assessment_scores_bulk([(patient_id, "Ball", 50)] * 10), None),
+        ("update_detailed_assessment",
+         lambda: manager.update_detailed_assessment(patient_id, "Physio", 3, "Benchmark", "Balance"), None),
+        # What the calling thread pays to queue a write; the previous one is
+        # committed first, untimed. --writes measures the writer's throughput.
+        ("submit_assessment_score",
+         lambda: manager.submit_assessment_score(patient_id, "Snake", 50), flushed),
+        ("submit_assessment_scores_bulk (10)",
+         lambda: manager.submit_assessment_scores_bulk([(patient_id, "Ball", 50)] * 10), flushed),
+        ("submit_detailed_assessment",
+         lambda: manager.submit_detailed_assessment(patient_id, "Physio", 3, "Benchmark", "Balance"), flushed),
+        ("create_rehabilitation_plan",
+         lambda: manager.create_rehabilitation_plan(patient_id, "Plan", "Benchmark"), None),
+        ("add_exercise_to_plan",
+         lambda: manager.add_exercise_to_plan(plan_id, "Exercise", "", "Daily", "5 minutes"), None),
+        ("toggle_exercise_completion", lambda: manager.toggle_exercise_completion(exercise_id), None),
+        ("refresh_rollups", manager.refresh_rollups, None),
+        ("export_patient_data_to_csv", lambda: manager.export_patient_data_to_csv(csv_path), None),
+        ("export_history_csv", lambda: export_history_csv(manager, history_path), None),
+        ("delete_patient", manager.delete_patient, new_patient),
+        ("delete_patients (10)", manager.delete_patients, new_patients),
+    ]
+
+
+def run_benchmark(manager_class, source_db, repeat, profile=None, cache_size=0, bulk_repeat=None):
+    """Benchmark every method on a scratch copy of source_db
+
+    The read cache is off unless cache_size is given, so the timings are of
+    the queries themselves. If bulk_repeat is given, BULK_METHODS are only
+    called that many times.
+    """
+    with tempfile.TemporaryDirectory() as work_dir:
+        db_copy = Path(work_dir) / "benchmark.db"
+        shutil.copyfile(source_db, db_copy)
+        with contextlib.redirect_stdout(io.StringIO()):
+            manager = manager_class(db_copy, profile=profile, cache_size=cache_size)
+        results = {}
+        for name, func, setup in method_workloads(manager, work_dir):
+            if bulk_repeat and name in BULK_METHODS:
+                results[name] = summarize(time_calls(func, min(repeat, bulk_repeat), setup, warmup=1))
+            else:
+                results[name] = summarize(time_calls(func, repeat, setup))
+        if cache_size:
+            stats = manager.cache_stats()
+            print(f"Read cache: {stats['hits']} hits, {stats['misses']} misses "
+                  f"({stats['hit_rate']:.0%}), {stats['stale']} invalidated")
+        manager.close()
+    return results
+
+
+def run_mixed_workload(source_db, profile, seconds, readers, writers):
+    """Run reader and writer threads against one database for a fixed time
+
+    Readers alternate between the home table query and a history lookup, as
+    HomeUI and ResultUI do; writers record scores like the game threads.
+    """
+    with tempfile.TemporaryDirectory() as work_dir:
+        db_copy = Path(work_dir) / "benchmark.db"
+        shutil.copyfile(source_db, db_copy)
+        with contextlib.redirect_stdout(io.StringIO()):
+            manager = DatabaseManager(db_copy, profile=profile, cache_size=0)
+        patient_ids = [row[0] for row in manager.get_connection().execute("SELECT id FROM patients")]
+
+        stop = threading.Event()
+        read_times, write_times, errors = [], [], []
+        lock = threading.Lock()
+
+        def reader(worker):
+            local = []
+            i = worker
+            while not stop.is_set():
+                start = time.perf_counter()
+                if i % 2:
+                    manager.get_all_patients()
+                else:
+                    manager.get_patient_assessment_history(patient_ids[i % len(patient_ids)])
+                local.append(time.perf_counter() - start)
+                i += 1
+            with lock:
+                read_times.extend(local)
+            manager.close_thread_connection()
+
+        def writer(worker):
+            local = []
+            i = worker
+            while not stop.is_set():
+                start = time.perf_counter()
+                if not manager.update_assessment_score(patient_ids[i % len(patient_ids)], "Snake", i % 100):
+                    errors.append(i)
+                local.append(time.perf_counter() - start)
+                i += 1
+            with lock:
+                write_times.extend(local)
+            manager.close_thread_connection()
+
+        threads = ([threading.Thread(target=reader, args=(n,)) for n in range(readers)]
+                   + [threading.Thread(target=writer, args=(n,)) for n in range(writers)])
+        with contextlib.redirect_stdout(io.StringIO()):
+            for thread in threads:
+                thread.start()
+            time.sleep(seconds)
+            stop.set()
+            for thread in threads:
+                thread.join()
+        manager.close()
+
+    reads, writes = summarize(read_times or [0]), summarize(write_times or [0])
+    return {
+        "profile": profile,
+        "reads_per_s": len(read_times) / seconds,
+        "writes_per_s": len(write_times) / seconds,
+        "read_p50_us": reads["p50_us"],
+        "read_p95_us": reads["p95_us"],
+        "write_p50_us": writes["p50_us"],
+        "write_p95_us": writes["p95_us"],
+        "write_errors": len(errors),
+    }
+
+
+def print_mixed_results(results):
+    """Print the mixed workload comparison table"""
+    header = (f"{'profile':<12} {'reads/s':>9} {'writes/s':>9} {'read p50':>9} {'read p95':>9} "
+              f"{'write p50':>10} {'write p95':>10} {'errors':>7}")
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(f"{r['profile']:<12} {r['reads_per_s']:>9.0f} {r['writes_per_s']:>9.0f} "
+              f"{r['read_p50_us']:>9.0f} {r['read_p95_us']:>9.0f} "
+              f"{r['write_p50_us']:>10.0f} {r['write_p95_us']:>10.0f} {r['write_errors']:>7}")
+
+
+def build_synthetic_database(path, patients, rows, schema_version=SCHEMA_VERSION):
+    """Create a database with random patients and assessment history"""
+    conn = sqlite3.connect(path)
+    with contextlib.redirect_stdout(io.StringIO()):
+        migrate(conn, target_version=schema_version)
+    rng = random.Random(42)
+    types = ["Speech", "Emoji", "Snake", "Ball", "Physio"]
+    # Dates are TEXT before schema version 8 and epoch milliseconds from then on
+    date_param = "?" if schema_version < 8 else iso_to_ms_sql("?")
+    with conn:
+        conn.executemany("INSERT INTO patients (name, age, gender) VALUES (?, ?, ?)",
+                         ((f"Patient {i:06d}", rng.randint(40, 90), rng.choice(["Male", "Female"]))
+                          for i in range(patients)))
+        conn.executemany(
+            "INSERT INTO assessment_results (patient_id, assessment_type, score, details, assessment_date) "
+            f"VALUES (?, ?, ?, ?, {date_param})",
+            ((rng.randint(1, patients), rng.choice(types), rng.uniform(0, 100), "Synthetic",
+              f"20{rng.randint(20, 25)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d} "
+              f"{rng.randint(8, 18):02d}:{rng.randint(0, 59):02d}:{rng.randint(0, 59):02d}")
+             for _ in range(rows)))
+        conn.executemany("INSERT INTO rehabilitation_plans (patient_id, plan_name, created_date, status) "
+                         f"VALUES (?, 'Plan', {date_param}, 'Active')",
+                         ((i % patients + 1, "2024-01-01") for i in range(patients * 2)))
+        conn.executemany("INSERT INTO exercises (plan_id, exercise_name, completed) VALUES (?, 'Exercise', 0)",
+                         ((i % (patients * 2) + 1,) for i in range(patients * 6)))
+    return conn
+
+
+def time_hot_queries(conn, repeat):
+    """Mean latency in microseconds of each HOT_QUERIES entry"""
+    results = {}
+    for description, query, params, _ in HOT_QUERIES:
+        timings = []
+        for i in range(repeat):
+            # Spread the lookups over different patients/plans
+            args = params
+            if isinstance(params[0], int):
+                args = (i * 7919 % 1000 + 1,) + tuple(params[1:])
+            start = time.perf_counter()
+            try:
+                conn.execute(query, args).fetchall()
+            except sqlite3.OperationalError:
+                # e.g. the name search table before its migration has run
+                break
+            timings.append(time.perf_counter() - start)
+            if conn.in_transaction:
+                conn.rollback()
+        results[description] = summarize(timings)["mean_us"] if timings else None
+    return results
+
+
+def run_index_benchmark(rows, patients, repeat):
+    """Time the hot queries on a large synthetic database without and with indexes"""
+    with tempfile.TemporaryDirectory() as work_dir:
+        path = Path(work_dir) / "synthetic.db"
+        start = time.perf_counter()
+        conn = build_synthetic_database(path, patients, rows, schema_version=1)
+        print(f"Built {rows} assessment rows for {patients} patients in {time.perf_counter() - start:.1f}s")
+
+        before = time_hot_queries(conn, repeat)
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            migrate(conn)
+        print(f"Index migration took {time.perf_counter() - start:.1f}s")
+        after = time_hot_queries(conn, repeat)
+
+        header = f"{'query':<28} {'no index us':>12} {'indexed us':>12} {'speedup':>9}"
+        print(header)
+        print("-" * len(header))
+        for description in before:
+            if before[description] is None or after[description] is None:
+                # Query needs a table the older schema doesn't have
+                after_us = "n/a" if after[description] is None else f"{after[description]:.1f}"
+                print(f"{description:<28} {'n/a':>12} {after_us:>12}")
+                continue
+            print(f"{description:<28} {before[description]:>12.1f} {after[description]:>12.1f} "
+                  f"{before[description] / after[description]:>8.0f}x")
+        for description, ok, plan in check_query_plans(conn.cursor()):
+            if not ok:
+                print(f"WARNING: {description} does not use its index: {plan}")
+        conn.close()
+
+
+# Objects whose size --timestamps reports
+TIMESTAMP_OBJECTS = ("assessment_results", "idx_assessment_results_patient_date",
+                     "idx_assessment_results_patient_type_date")
+
+
+def object_pages(conn, name):
+    """Pages used by a table or index, None if SQLite was built without dbstat"""
+    try:
+        return conn.execute("SELECT COUNT(*) FROM dbstat WHERE name = ?", (name,)).fetchone()[0]
+    except sqlite3.OperationalError:
+        return None
+
+
+def time_range_queries(conn, repeat, patients, to_bound):
+    """Mean latency in microseconds of one-month history range queries
+
+    to_bound converts a "YYYY-MM-DD HH:MM:SS" bound to the stored date type.
+    """
+    queries = {
+        "One month of history": "SELECT * FROM assessment_results WHERE patient_id = ? "
+                                "AND assessment_date >= ? AND assessment_date < ? "
+                                "ORDER BY assessment_date",
+        "One month of one type": "SELECT * FROM assessment_results WHERE patient_id = ? "
+                                 "AND assessment_type = 'Snake' AND assessment_date >= ? "
+                                 "AND assessment_date < ? ORDER BY assessment_date",
+        "Results in one month": "SELECT COUNT(*) FROM assessment_results WHERE patient_id = ? "
+                                "AND assessment_date >= ? AND assessment_date < ?",
+    }
+    results = {}
+    for description, query in queries.items():
+        timings = []
+        for i in range(repeat):
+            month = i % 12 + 1
+            start = f"2023-{month:02d}-01 00:00:00"
+            end = f"2023-{month + 1:02d}-01 00:00:00" if month < 12 else "2024-01-01 00:00:00"
+            args = (i * 7919 % patients + 1, to_bound(start), to_bound(end))
+            begin = time.perf_counter()
+            conn.execute(query, args).fetchall()
+            timings.append(time.perf_counter() - begin)
+        results[description] = summarize(timings)["mean_us"]
+    return results
+
+
+def run_timestamp_benchmark(rows, patients, repeat):
+    """Compare date range queries and storage of TEXT dates with epoch-millisecond integers"""
+    with tempfile.TemporaryDirectory() as work_dir:
+        path = Path(work_dir) / "synthetic.db"
+        start = time.perf_counter()
+        # Schema 7 is the last one with TEXT dates
+        conn = build_synthetic_database(path, patients, rows, schema_version=7)
+        # Same statistics and packed pages as the migrated tables get
+        conn.execute("ANALYZE")
+        conn.execute("VACUUM")
+        print(f"Built {rows} assessment rows for {patients} patients in {time.perf_counter() - start:.1f}s")
+
+        text_times = time_range_queries(conn, repeat, patients, lambda bound: bound)
+        text_pages = {name: object_pages(conn, name) for name in TIMESTAMP_OBJECTS}
+        text_size = path.stat().st_size
+
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            migrate(conn)
+        print(f"Timestamp migration took {time.perf_counter() - start:.1f}s")
+        conn.close()
+        conn = sqlite3.connect(path)
+        conn.execute("VACUUM")
+        int_times = time_range_queries(conn, repeat, patients, to_epoch_ms)
+        int_pages = {name: object_pages(conn, name) for name in TIMESTAMP_OBJECTS}
+        int_size = path.stat().st_size
+        conn.close()
+
+    header = f"{'query':<40} {'text us':>10} {'integer us':>11} {'speedup':>8}"
+    print(header)
+    print("-" * len(header))
+    for description in text_times:
+        print(f"{description:<40} {text_times[description]:>10.1f} {int_times[description]:>11.1f} "
+              f"{text_times[description] / int_times[description]:>7.2f}x")
+    print()
+    header = f"{'pages':<40} {'text':>10} {'integer':>11} {'saved':>8}"
+    print(header)
+    print("-" * len(header))
+    for name in TIMESTAMP_OBJECTS:
+        if text_pages[name] is None or int_pages[name] is None:
+            continue
+        print(f"{name:<40} {text_pages[name]:>10} {int_pages[name]:>11} "
+              f"{1 - int_pages[name] / text_pages[name]:>7.0%}")
+    print(f"{'database file (bytes)':<40} {text_size:>10} {int_size:>11} {1 - int_size / text_size:>7.0%}")
+
+
+def run_write_benchmark(source_db, count, profile=None):
+    """Throughput of recording count scores one by one, in bulk and through the writer thread"""
+    with tempfile.TemporaryDirectory() as work_dir:
+        db_copy = Path(work_dir) / "benchmark.db"
+        shutil.copyfile(source_db, db_copy)
+        with contextlib.redirect_stdout(io.StringIO()):
+            manager = DatabaseManager(db_copy, profile=profile)
+        patient_ids = manager.patient_columns(("id",))["id"]
+        types = ["Speech", "Emoji", "Snake", "Ball", "Physio"]
+        records = [(patient_ids[i % len(patient_ids)], types[i % len(types)], i % 100)
+                   for i in range(count)]
+
+        results = {}
+        start = time.perf_counter()
+        for record in records:
+            manager.update_assessment_score(*record)
+        results["update_assessment_score"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        manager.update_assessment_scores_bulk(records)
+        results["update_assessment_scores_bulk"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        futures = [manager.submit_assessment_score(*record) for record in records]
+        submitted = time.perf_counter() - start
+        for future in futures:
+            future.result()
+        results["submit_assessment_score"] = time.perf_counter() - start
+        manager.close()
+
+    header = f"{'method':<32} {'records/s':>12} {'total ms':>10}"
+    print(f"{count} score records, profile {profile or DEFAULT_PROFILE}")
+    print(header)
+    print("-" * len(header))
+    for name, seconds in results.items():
+        print(f"{name:<32} {count / seconds:>12.0f} {seconds * 1000:>10.1f}")
+    print(f"(queueing all {count} writes took {submitted * 1000:.1f} ms of the caller's time)")
+    return results
+
+
+def run_import_benchmark(source_db, rows, profile=None):
+    """Rows per second of the bulk CSV importer, against inserting one row per call"""
+    rng = random.Random(42)
+    types = ["Speech", "Emoji", "Snake", "Ball", "Physio"]
+    patients = max(rows // 10, 1)
+    results = {}
+    with tempfile.TemporaryDirectory() as work_dir:
+        patients_csv = Path(work_dir) / "patients.csv"
+        history_csv = Path(work_dir) / "history.csv"
+        with open(patients_csv, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["Name", "Age", "Gender", "Speech Score", "Ball Score"])
+            writer.writerows((f"Imported {i:07d}", rng.randint(40, 90), rng.choice("MF"),
+                              rng.randint(0, 100), rng.randint(0, 100)) for i in range(patients))
+        with open(history_csv, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["Patient", "Type", "Score", "Date"])
+            writer.writerows((f"Imported {rng.randrange(patients):07d}", rng.choice(types),
+                              round(rng.uniform(0, 100), 1),
+                              f"20{rng.randint(20, 25)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}")
+                             for _ in range(rows))
+
+        for defer in (True, False):
+            db_copy = Path(work_dir) / f"import_{defer}.db"
+            shutil.copyfile(source_db, db_copy)
+            with contextlib.redirect_stdout(io.StringIO()):
+                manager = DatabaseManager(db_copy, profile=profile)
+            label = "deferred indexes" if defer else "live indexes"
+            report = import_patients_csv(manager, patients_csv, defer_indexes=defer)
+            results[f"import_patients_csv ({label})"] = (report.imported, report.seconds)
+            report = import_history_csv(manager, history_csv, defer_indexes=defer)
+            results[f"import_history_csv ({label})"] = (report.imported, report.seconds)
+            manager.close()
+
+        # One committed insert per row, how records were added before
+        db_copy = Path(work_dir) / "per_row.db"
+        shutil.copyfile(source_db, db_copy)
+        with contextlib.redirect_stdout(io.StringIO()):
+            manager = DatabaseManager(db_copy, profile=profile)
+        count = min(rows, 2000)
+        start = time.perf_counter()
+        patient_ids = [manager.add_patient(f"Imported {i:07d}", 60, "Male") for i in range(count)]
+        results["add_patient"] = (count, time.perf_counter() - start)
+        start = time.perf_counter()
+        for i in range(count):
+            manager.update_detailed_assessment(patient_ids[i], types[i % len(types)], i % 100, "Imported")
+        results["update_detailed_assessment"] = (count, time.perf_counter() - start)
+        manager.close()
+
+    header = f"{'method':<42} {'rows':>9} {'rows/s':>10} {'total s':>9}"
+    print(f"Import of {patients} patients and {rows} assessment results, profile {profile or DEFAULT_PROFILE}")
+    print(header)
+    print("-" * len(header))
+    for name, (count, seconds) in results.items():
+        print(f"{name:<42} {count:>9} {count / seconds:>10.0f} {seconds:>9.2f}")
+    return results
+
+
+def compare_results(results, baseline, tolerance):
+    """Regressions of a --scale run against an earlier one
+
+    A method has regressed if its p50 latency grew by more than tolerance
+    (a fraction) and by more than REGRESSION_MIN_US; the concurrent workload
+    if its reads or writes per second fell by more than tolerance. Sizes and
+    methods missing from either run are skipped.
+
+    Returns:
+        list: One description per regression
+    """
+    regressions = []
+    for size, current in results["sizes"].items():
+        before = baseline.get("sizes", {}).get(size)
+        if not before:
+            continue
+        for name, stats in current["methods"].items():
+            old = before["methods"].get(name)
+            if old and (stats["p50_us"] > old["p50_us"] * (1 + tolerance)
+                        and stats["p50_us"] - old["p50_us"] > REGRESSION_MIN_US):
+                regressions.append(f"{size} rows, {name}: p50 {old['p50_us']:.0f} -> {stats['p50_us']:.0f} us")
+        for rate in ("reads_per_s", "writes_per_s"):
+            old = before.get("concurrent", {}).get(rate)
+            new = current["concurrent"][rate]
+            if old and new < old * (1 - tolerance):
+                regressions.append(f"{size} rows, concurrent {rate.replace('_per_s', '')}: "
+                                   f"{old:.0f} -> {new:.0f} per second")
+    return regressions
+
+
+def run_scale_benchmark(sizes, repeat, profile, seconds, readers, writers, output, baseline=None,
+                        tolerance=0.25):
+    """Benchmark every method and the concurrent workload on databases of each size
+
+    Args:
+        sizes: Assessment results in each generated database
+        repeat: Timed calls per method (SCALE_BULK_REPEAT for BULK_METHODS)
+        profile: Settings profile, the default if None
+        seconds, readers, writers: Concurrent workload, as for --mixed
+        output: JSON file the results are written to
+        baseline: Optional JSON file of an earlier run to compare with
+        tolerance: Slowdown allowed before a result is flagged, as a fraction
+
+    Returns:
+        list: Regressions found against the baseline
+    """
+    profile = profile or DEFAULT_PROFILE
+    results = {
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "profile": profile,
+        "repeat": repeat,
+        "readers": readers,
+        "writers": writers,
+        "sizes": {},
+    }
+    with tempfile.TemporaryDirectory() as work_dir:
+        for size in sizes:
+            path = Path(work_dir) / f"scale_{size}.db"
+            report = generate_database(path, patients=max(size // SCALE_ROWS_PER_PATIENT, 10),
+                                       assessments_per_patient=SCALE_ROWS_PER_PATIENT)
+            print(f"\n{report.assessments} assessment results for {report.patients} patients "
+                  f"(generated in {report.seconds:.1f}s)")
+            methods = run_benchmark(DatabaseManager, path, repeat, profile, bulk_repeat=SCALE_BULK_REPEAT)
+            concurrent = run_mixed_workload(path, profile, seconds, readers, writers)
+            print_results(methods)
+            print()
+            print_mixed_results([concurrent])
+            results["sizes"][str(size)] = {
+                "patients": report.patients,
+                "assessments": report.assessments,
+                "methods": methods,
+                "concurrent": concurrent,
+            }
+            path.unlink()
+
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {output}")
+    if not baseline:
+        return []
+    with open(baseline) as f:
+        regressions = compare_results(results, json.load(f), tolerance)
+    if regressions:
+        print(f"{len(regressions)} regressions against {baseline}:")
+        for regression in regressions:
+            print(f"  {regression}")
+    else:
+        print(f"No regressions against {baseline}")
+    return regressions
+
+
+def print_results(results, baseline=None, baseline_label="per-call mean"):
+    """Print a latency table, with the speedup over baseline if given"""
+    header = f"{'method':<40} {'mean us':>10} {'p50 us':>10} {'p95 us':>10} {'p99 us':>10}"
+    if baseline:
+        header += f" {baseline_label:>14} {'speedup':>8}"
+    print(header)
+    print("-" * len(header))
+    for name, stats in results.items():
+        line = (f"{name:<40} {stats['mean_us']:>10.1f} {stats['p50_us']:>10.1f} {stats['p95_us']:>10.1f} "
+                f"{stats['p99_us']:>10.1f}")
+        if baseline:
+            before = baseline[name]["mean_us"]
+            line += f" {before:>14.1f} {before / stats['mean_us']:>7.2f}x"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark DatabaseManager methods")
+    parser.add_argument("--db", default="neurowell.db", help="Database to copy for the benchmark")
+    parser.add_argument("--repeat", type=int, default=200, help="Timed calls per method")
+    parser.add_argument("--compare", action="store_true",
+                        help="Also run with a new connection per call and show the speedup")
+    parser.add_argument("--profile", choices=sorted(DB_PROFILES),
+                        help="Settings profile for the per-method benchmark")
+    parser.add_argument("--mixed", action="store_true",
+                        help="Run the concurrent read/write workload instead")
+    parser.add_argument("--profiles", nargs="+", default=["legacy", "balanced"],
+                        choices=sorted(DB_PROFILES), help="Profiles to compare with --mixed")
+    parser.add_argument("--seconds", type=float, default=5, help="Duration of each mixed run")
+    parser.add_argument("--readers", type=int, default=3, help="Reader threads for --mixed")
+    parser.add_argument("--writers", type=int, default=2, help="Writer threads for --mixed")
+    parser.add_argument("--indexes", action="store_true",
+                        help="Time the hot queries on a large synthetic database before/after indexing")
+    parser.add_argument("--timestamps", action="store_true",
+                        help="Compare date range queries and sizes with TEXT and integer dates")
+    parser.add_argument("--rows", type=int, default=1_000_000,
+                        help="Assessment rows for --indexes and --timestamps")
+    parser.add_argument("--patients", type=int, default=10_000,
+                        help="Patients for --indexes and --timestamps")
+    parser.add_argument("--writes", type=int, metavar="COUNT",
+                        help="Time recording COUNT scores one by one, in bulk and via the writer thread")
+    parser.add_argument("--cache", action="store_true",
+                        help="Run the per-method benchmark with the read cache on and show the speedup")
+    parser.add_argument("--imports", type=int, metavar="ROWS",
+                        help="Time bulk importing ROWS assessment results (and ROWS/10 patients) from CSV")
+    parser.add_argument("--scale", action="store_true",
+                        help="Time every method and the mixed workload on generated databases of --sizes")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000, 1_000_000],
+                        help="Assessment results in each --scale database")
+    parser.add_argument("--output", default="benchmark_results.json", help="JSON results file for --scale")
+    parser.add_argument("--baseline", help="Earlier --scale results file to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Slowdown over the baseline flagged as a regression (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    if args.scale:
+        regressions = run_scale_benchmark(args.sizes, args.repeat, args.profile, args.seconds, args.readers,
+                                          args.writers, args.output, args.baseline, args.tolerance)
+        # Non-zero exit status so a build script can fail on regressions
+        if regressions:
+            sys.exit(1)
+        return
+
+    if args.imports:
+        run_import_benchmark(args.db, args.imports, args.profile)
+        return
+
+    if args.writes:
+        run_write_benchmark(args.db, args.writes, args.profile)
+        return
+
+    if args.timestamps:
+        run_timestamp_benchmark(args.rows, args.patients, args.repeat)
+        return
+
+    if args.indexes:
+        run_index_benchmark(args.rows, args.patients, min(args.repeat, 50))
+        return
+
+    if args.mixed:
+        print_mixed_results([run_mixed_workload(args.db, profile, args.seconds, args.readers, args.writers)
+                             for profile in args.profiles])
+        return
+
+    if args.cache:
+        results = run_benchmark(DatabaseManager, args.db, args.repeat, args.profile, CACHE_SIZE)
+        baseline = run_benchmark(DatabaseManager, args.db, args.repeat, args.profile)
+        print_results(results, baseline, "uncached mean")
+        return
+
+    results = run_benchmark(DatabaseManager, args.db, args.repeat, args.profile)
+    baseline = (run_benchmark(PerCallConnectionManager, args.db, args.repeat, args.profile)
+                if args.compare else None)
+    print_results(results, baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""
+Read-through query cache for DatabaseManager.
+
+The screens ask for the same rows over and over: every patient dropdown
+loads the first page of patients, and the result, physio and details screens
+and the game score writers all look the same patient up by name. QueryCache
+keeps the most recently used results, keyed by method name and arguments.
+
+Invalidation works by table generations. Each cached method declares the
+tables it reads, and every write through DatabaseManager bumps the
+generation of the tables it changed once it has committed. A cached entry
+remembers the generations it was read at and is discarded when any of them
+has moved on. Derived tables (assessment_summary, assessment_rollups,
+patients_fts) follow the base table they are computed from.
+
+Only writes made through the manager are seen. Code that writes to the
+database directly, or another process, must call invalidate_cache().
+"""
+
+import functools
+import threading
+from collections import OrderedDict
+
+# Results kept by default before the least recently used is evicted
+CACHE_SIZE = 512
+# Results with more rows than this are returned but not kept (bulk reads and exports)
+CACHE_MAX_ROWS = 500
+
+# Base tables whose generations invalidate cached reads
+TABLES = ("patients", "assessment_results", "rehabilitation_plans", "exercises")
+
+
+def _result_rows(value):
+    """Number of rows in a query result, for CACHE_MAX_ROWS"""
+    patients = getattr(value, "patients", None)
+    if patients is not None:
+        return len(patients)
+    try:
+        return len(value) if not isinstance(value, tuple) else 1
+    except TypeError:
+        return 1
+
+
+def _copy_result(value):
+    """Copy of a cached result that the caller can modify without corrupting the cache
+
+    Lists, DataFrames and arrays are copied, and so are those held by a
+    record (a PatientPage's patients, a ScoreTrend's arrays); immutable
+    values are shared.
+    """
+    if isinstance(value, list):
+        return list(value)
+    if isinstance(value, tuple):
+        return value._make(map(_copy_result, value)) if hasattr(value, "_make") else value
+    copy = getattr(value, "copy", None)
+    return copy() if callable(copy) else value
+
+
+class QueryCache:
+    """Bounded LRU cache of query results, invalidated by per-table generations"""
+
+    def __init__(self, maxsize=CACHE_SIZE, max_rows=CACHE_MAX_ROWS):
+        """Initialize the cache
+
+        Args:
+            maxsize: Maximum number of results kept, 0 disables the cache
+            max_rows: Results with more rows than this are not kept
+        """
+        self.maxsize = maxsize
+        self.max_rows = max_rows
+        self.entries = OrderedDict()
+        self.generations = dict.fromkeys(TABLES, 0)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.evictions = 0
+
+    def snapshot(self, tables):
+        """Current generations of the given tables"""
+        return tuple(self.generations[table] for table in tables)
+
+    def get(self, key, tables):
+        """Look up a result
+
+        Returns:
+            tuple: (True, value) on a hit, (False, generations to store the
+            result under) on a miss
+        """
+        with self.lock:
+            generations = self.snapshot(tables)
+            entry = self.entries.get(key)
+            if entry is not None:
+                if entry[0] == generations:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return True, entry[1]
+                # One of the tables was written since the result was read
+                del self.entries[key]
+                self.stale += 1
+            self.misses += 1
+            return False, generations
+
+    def put(self, key, generations, value):
+        """Store a result read at the given generations"""
+        if self.maxsize <= 0 or _result_rows(value) > self.max_rows:
+            return
+        with self.lock:
+            self.entries[key] = (generations, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def bump(self, tables=TABLES):
+        """Invalidate every cached result that read any of the tables"""
+        with self.lock:
+            for table in tables:
+                self.generations[table] += 1
+
+    def clear(self):
+        """Drop every cached result"""
+        with self.lock:
+            self.entries.clear()
+            for table in self.generations:
+                self.generations[table] += 1
+
+    def stats(self):
+        """Hit, miss and eviction counts since the cache was created"""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "stale": self.stale,
+            "evictions": self.evictions,
+            "size": len(self.entries),
+            "maxsize": self.maxsize,
+        }
+
+
+def cached(*tables):
+    """Cache a DatabaseManager read method's results until one of the tables is written
+
+    The method's name and arguments make up the key. Calls with unhashable
+    arguments (e.g. a dict of filters) bypass the cache.
+    """
+    def decorator(method):
+        name = method.__name__
+
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            cache = self.cache
+            if cache.maxsize <= 0:
+                return method(self, *args, **kwargs)
+            key = (name, args, tuple(sorted(kwargs.items())))
+            try:
+                hash(key)
+            except TypeError:
+                return method(self, *args, **kwargs)
+            found, value = cache.get(key, tables)
+            if not found:
+                generations = value
+                value = method(self, *args, **kwargs)
+                cache.put(key, generations, value)
+            return _copy_result(value)
+        return wrapper
+    return decorator
@@ -0,0 +1,273 @@
+"""
+Streaming exports of the NeuroWell database.
+
+Exports read the database through a cursor in fixed-size chunks and write
+each chunk before fetching the next, so memory use stays the same whether a
+clinic has a hundred history rows or millions. Patients can be written to the
+legacy CSV layout. The assessment history can be written to CSV, or to a .npz
+file of columnar blocks for analytics with numpy.
+
+Every export takes an optional progress(done, total) callback. Returning
+False from it stops the export early. The exports are meant to run on a
+background thread, where DatabaseManager gives them their own connection.
+"""
+
+import csv
+import json
+import zipfile
+from db_migrations import iso_to_ms_sql, ms_to_iso_sql
+
+# Rows fetched from the cursor and written per chunk
+EXPORT_CHUNK_SIZE = 10_000
+
+# Column headers expected by the legacy code, in file order
+PATIENT_EXPORT_HEADERS = {
+    'name': 'Name',
+    'age': 'Age',
+    'gender': 'Gender',
+    'speech_score': 'Speech Score',
+    'emoji_score': 'Emoji Score',
+    'snake_score': 'Snake Score',
+    'ball_score': 'Ball Score'
+}
+
+HISTORY_EXPORT_COLUMNS = ("id", "patient_id", "assessment_type", "score", "details",
+                          "assessment_date", "category", "details_json")
+# numpy dtype of each history column in .npz exports. Text columns are
+# fixed-width unicode arrays, sized per block. Dates keep their stored
+# millisecond precision.
+HISTORY_NPZ_DTYPES = {
+    "id": "int64",
+    "patient_id": "int64",
+    "assessment_type": "U",
+    "score": "float64",
+    "details": "U",
+    "assessment_date": "datetime64[ms]",
+    "category": "U",
+    "details_json": "U",
+}
+# Stands for a missing id in integer .npz columns; results whose patient
+# was deleted before foreign keys cascaded have no patient_id
+NPZ_MISSING_ID = -1
+
+
+def _history_filters(patient_ids=None, assessment_type=None, start_date=None, end_date=None):
+    """WHERE clause and parameters for the assessment history filters
+
+    Args:
+        patient_ids: Only results of these patients
+        assessment_type: Only results of this type, matched case-insensitively
+        start_date: Only results on or after this "YYYY-MM-DD" date
+        end_date: Only results on or before this "YYYY-MM-DD" date
+    """
+    conditions = []
+    params = []
+    if patient_ids is not None:
+        # One JSON parameter instead of one per ID, so any number of IDs fits
+        conditions.append("patient_id IN (SELECT value FROM json_each(?))")
+        params.append(json.dumps([int(patient_id) for patient_id in patient_ids]))
+    if assessment_type is not None:
+        conditions.append("assessment_type = ? COLLATE NOCASE")
+        params.append(assessment_type)
+    # Dates are stored as epoch milliseconds; the bounds are converted once
+    if start_date is not None:
+        conditions.append(f"assessment_date >= {iso_to_ms_sql('?')}")
+        params.append(start_date)
+    if end_date is not None:
+        day_after = iso_to_ms_sql("date(?, '+1 day')")
+        conditions.append(f"assessment_date < {day_after}")
+        params.append(end_date)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    return where, params
+
+
+def count_history(manager, **filters):
+    """Number of assessment results matching the filters"""
+    where, params = _history_filters(**filters)
+    return manager.get_connection().execute(
+        f"SELECT COUNT(*) FROM assessment_results {where}", params).fetchone()[0]
+
+
+def iter_history_chunks(manager, chunk_size=EXPORT_CHUNK_SIZE, iso_dates=True, **filters):
+    """Yield the matching assessment results as lists of row tuples, in id order
+
+    The query runs once and its cursor is read chunk_size rows at a time, so
+    only one chunk is held in memory. Dates are "YYYY-MM-DD HH:MM:SS" text,
+    or the stored epoch milliseconds if iso_dates is False.
+    """
+    where, params = _history_filters(**filters)
+    columns = HISTORY_EXPORT_COLUMNS
+    if iso_dates:
+        columns = [f"{ms_to_iso_sql(column)} AS {column}" if column == "assessment_date" else column
+                   for column in columns]
+    cursor = manager.get_connection().execute(f"""
+    SELECT {', '.join(columns)} FROM assessment_results
+    {where}
+    ORDER BY id
+    """, params)
+    try:
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                return
+            yield rows
+    finally:
+        cursor.close()
+
+
+def _report(progress, done, total):
+    """Call the progress callback; returns False if the export should stop"""
+    return progress is None or progress(done, total) is not False
+
+
+def export_patients_csv(manager, output_path, progress=None, chunk_size=EXPORT_CHUNK_SIZE, **filters):
+    """Write patients to a CSV file with the legacy column headers
+
+    Args:
+        manager: DatabaseManager to read from
+        output_path: CSV file to write
+        progress: Optional progress(done, total) callback
+        chunk_size: Patients read per query
+        **filters: Patient filters of DatabaseManager.get_patients_page
+
+    Returns:
+        int: Number of patients written
+    """
+    total = manager.get_patients_page(limit=1, order_by="id", **filters).total
+    written = 0
+    with open(output_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(PATIENT_EXPORT_HEADERS.values())
+        cursor = None
+        while True:
+            page = manager.get_patients_page(cursor, chunk_size, "id", with_total=False, **filters)
+            writer.writerows([getattr(patient, column) for column in PATIENT_EXPORT_HEADERS]
+                             for patient in page.patients)
+            written += len(page.patients)
+            if not _report(progress, written, total) or page.next_cursor is None:
+                break
+            cursor = page.next_cursor
+    return written
+
+
+def export_history_csv(manager, output_path, progress=None, chunk_size=EXPORT_CHUNK_SIZE, **filters):
+    """Write assessment results to a CSV file
+
+    Args:
+        manager: DatabaseManager to read from
+        output_path: CSV file to write
+        progress: Optional progress(done, total) callback
+        chunk_size: Rows fetched and written at a time
+        **filters: patient_ids, assessment_type, start_date and end_date
+
+    Returns:
+        int: Number of results written
+    """
+    total = count_history(manager, **filters)
+    written = 0
+    with open(output_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(HISTORY_EXPORT_COLUMNS)
+        for rows in iter_history_chunks(manager, chunk_size, **filters):
+            writer.writerows(rows)
+            written += len(rows)
+            if not _report(progress, written, total):
+                break
+    return written
+
+
+def export_history_npz(manager, output_path, progress=None, chunk_size=EXPORT_CHUNK_SIZE, **filters):
+    """Write assessment results to a .npz file of columnar blocks
+
+    Each chunk becomes one array per column, named "<column>_<block>" (for
+    example "score_00003"), written into the archive as soon as it is read.
+    Missing scores are NaN, missing ids NPZ_MISSING_ID (-1) and missing
+    text an empty string. Use
+    load_history_npz() to get whole columns back.
+
+    Args:
+        manager: DatabaseManager to read from
+        output_path: .npz file to write
+        progress: Optional progress(done, total) callback
+        chunk_size: Rows per block
+        **filters: patient_ids, assessment_type, start_date and end_date
+
+    Returns:
+        int: Number of results written
+    """
+    import numpy as np
+    total = count_history(manager, **filters)
+    written = 0
+    with zipfile.ZipFile(output_path, "w", zipfile.ZIP_STORED, allowZip64=True) as archive:
+        for block, rows in enumerate(iter_history_chunks(manager, chunk_size, False, **filters)):
+            for column, values in zip(HISTORY_EXPORT_COLUMNS, zip(*rows)):
+                dtype = HISTORY_NPZ_DTYPES[column]
+                if dtype == "U":
+                    array = np.array(["" if value is None else value for value in values], dtype=dtype)
+                elif dtype.startswith("datetime64"):
+                    # Integers are read as milliseconds since the epoch; None becomes NaT
+                    array = np.array(["NaT" if value is None else value for value in values], dtype=dtype)
+                elif dtype == "float64":
+                    array = np.array([np.nan if value is None else value for value in values], dtype=dtype)
+                else:
+                    array = np.array([NPZ_MISSING_ID if value is None else value for value in values],
+                                     dtype=dtype)
+                with archive.open(f"{column}_{block:05d}.npy", "w", force_zip64=True) as f:
+                    np.lib.format.write_array(f, array, allow_pickle=False)
+            written += len(rows)
+            if not _report(progress, written, total):
+                break
+    return written
+
+
+def load_history_npz(path, columns=HISTORY_EXPORT_COLUMNS):
+    """Read a history .npz export back as a dict of whole numpy columns"""
+    import numpy as np
+    with np.load(path) as blocks:
+        # Block numbers are zero-padded, so name order is block order
+        names = sorted(blocks.files)
+        result = {}
+        for column in columns:
+            arrays = [blocks[name] for name in names if name.rsplit("_", 1)[0] == column]
+            result[column] = np.concatenate(arrays) if arrays else np.array([], dtype=HISTORY_NPZ_DTYPES[column])
+        return result
+
+if __name__ == "__main__":
+    import argparse
+    from pathlib import Path
+    from db_utils import DatabaseManager
+
+    parser = argparse.ArgumentParser(description="Export NeuroWell data")
+    parser.add_argument("table", choices=["patients", "history"], help="What to export")
+    parser.add_argument("output", help="Output file; history ending in .npz is written as numpy blocks")
+    parser.add_argument("--db", default="neurowell.db", help="Database to export from")
+    parser.add_argument("--patients", type=int, nargs="+", help="Only these patient IDs (history)")
+    parser.add_argument("--type", help="Only this assessment type (history)")
+    parser.add_argument("--since", help="Only results on or after this YYYY-MM-DD date (history)")
+    parser.add_argument("--until", help="Only results on or before this YYYY-MM-DD date (history)")
+    parser.add_argument("--snapshot", action="store_true",
+                        help="Export from an online snapshot, for a database the app is writing to")
+    args = parser.parse_args()
+
+    def print_progress(done, total):
+        print(f"\r{done}/{total} rows", end="", flush=True)
+
+    snapshot_dir = None
+    if args.snapshot:
+        import tempfile
+        from db_snapshot import take_snapshot
+        snapshot_dir = tempfile.TemporaryDirectory()
+        snapshot = take_snapshot(args.db, Path(snapshot_dir.name) / "snapshot.db").path
+        manager = DatabaseManager(snapshot, read_only=True)
+    else:
+        manager = DatabaseManager(args.db)
+    if args.table == "patients":
+        count = export_patients_csv(manager, args.output, print_progress)
+    else:
+        export = export_history_npz if args.output.endswith(".npz") else export_history_csv
+        count = export(manager, args.output, print_progress, patient_ids=args.patients,
+                       assessment_type=args.type, start_date=args.since, end_date=args.until)
+    print(f"\nExported {count} rows to {args.output}")
+    manager.close()
+    if snapshot_dir:
+        snapshot_dir.cleanup()
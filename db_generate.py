@@ -0,0 +1,319 @@
+"""
+Synthetic NeuroWell databases at clinic scale.
+
+create_database.py seeds ten sample patients. This module fills a database
+with any number of made-up patients, assessment histories, rehabilitation
+plans and exercises, so the screens and the database layer can be tried
+with the data volumes of a real clinic. It never prompts.
+
+Every column is generated with numpy for a batch of rows at a time and
+written with executemany in one transaction. As in db_import, the history
+indexes and per-row triggers are dropped during the load and rebuilt once
+at the end. Generation is seeded, so the same arguments give the same data.
+
+A million results (50,000 patients) take about 15 seconds, roughly 65,000
+results/s. The time is spent in SQLite: about 5s inserting the history,
+3s rebuilding its indexes and 2.5s rebuilding assessment_summary. Building
+the rows in Python takes under a second, so larger batches don't help.
+
+Scores follow a recovery curve per patient and assessment type: a baseline,
+a gain that is approached with a patient-specific time constant, and
+session-to-session noise. Sessions are spread over the patient's time in
+treatment, during clinic hours.
+
+Usage:
+    python db_generate.py synthetic.db [--patients 50000] [--assessments 20] [--force]
+    python db_generate.py :memory: --patients 100000   # time generation only
+"""
+
+import contextlib
+import io
+import sqlite3
+import time
+from collections import namedtuple
+from pathlib import Path
+from db_migrations import migrate, rebuild_assessment_summary
+from db_import import drop_deferred, update_latest_scores
+
+# History rows generated and inserted per batch
+GENERATE_BATCH_SIZE = 100_000
+
+# Assessment types in the proportions the stations record them
+ASSESSMENT_TYPE_WEIGHTS = {"Speech": 0.2, "Emoji": 0.2, "Snake": 0.2, "Ball": 0.2, "Physio": 0.2}
+# Physio results are recorded per range-of-motion category
+PHYSIO_CATEGORIES = ("Upper Extremity", "Lower Extremity", "Trunk/Core")
+# Types played in front of the camera, whose sessions have a frame count
+CAMERA_TYPES = ("Emoji", "Snake", "Ball")
+CAMERA_FPS = 30
+
+FIRST_NAMES = ("James", "Mary", "Robert", "Patricia", "John", "Jennifer", "Michael", "Linda",
+               "William", "Elizabeth", "David", "Barbara", "Richard", "Susan", "Joseph", "Jessica",
+               "Thomas", "Sarah", "Charles", "Karen", "Ahmed", "Fatima", "Wei", "Mei", "Raj",
+               "Priya", "Carlos", "Lucia", "Olga", "Ivan")
+LAST_NAMES = ("Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller", "Davis",
+              "Rodriguez", "Martinez", "Hernandez", "Lopez", "Wilson", "Anderson", "Thomas",
+              "Taylor", "Moore", "Jackson", "Martin", "Lee", "Khan", "Chen", "Patel", "Kim",
+              "Nguyen", "Singh", "Ivanova", "Rossi", "Muller", "Silva")
+
+# (exercise_name, description, frequency, duration) assigned to generated plans
+EXERCISE_LIBRARY = (
+    ("Finger Tapping", "Tap each finger to your thumb 10 times", "Daily", "5 minutes"),
+    ("Wrist Flexion", "Gently bend your wrist forward and backward 15 times", "Daily", "5 minutes"),
+    ("Object Manipulation", "Practice picking up and manipulating small objects", "Daily", "10 minutes"),
+    ("Articulation Exercises", "Practice specific sounds and words", "Twice daily", "15 minutes"),
+    ("Reading Aloud", "Read passages aloud with emphasis on clarity", "Daily", "10 minutes"),
+    ("Memory Games", "Card matching and other memory exercises", "3 times per week", "20 minutes"),
+    ("Ball Catching", "Practice catching balls of different sizes", "3 times per week", "10 minutes"),
+    ("Standing on One Foot", "Practice balancing on one foot", "Daily", "5 minutes per foot"),
+    ("Walking Heel to Toe", "Walk in a straight line placing heel to toe", "Daily", "10 minutes"),
+    ("Buttoning Exercise", "Practice buttoning and unbuttoning clothes", "Daily", "5 minutes"),
+)
+PLAN_NAMES = ("Motor Skills Improvement", "Speech Recovery Program", "Cognitive Enhancement",
+              "Hand-Eye Coordination", "Balance Improvement", "General Rehabilitation")
+PLAN_STATUS_WEIGHTS = {"Active": 0.6, "Completed": 0.3, "Paused": 0.1}
+
+DAY_MS = 86_400_000
+
+# Rows written by a generation run, and how long it took
+GenerateReport = namedtuple("GenerateReport", ("patients", "assessments", "plans", "exercises", "seconds"))
+
+
+def _choice(rng, options, size):
+    """Indexes into options drawn with the weights of an {option: weight} dict"""
+    import numpy as np
+    weights = np.array(list(options.values()), dtype=float)
+    return rng.choice(len(options), size=size, p=weights / weights.sum())
+
+
+def _rows(*columns):
+    """Row tuples for executemany from equal-length numpy columns"""
+    return zip(*(column.tolist() for column in columns))
+
+
+def _generate_patients(rng, conn, count, first_id, start_day, days):
+    """Insert count patients; returns their first day in treatment and recovery parameters"""
+    import numpy as np
+    ids = np.arange(first_id, first_id + count)
+    names = (np.array(FIRST_NAMES, dtype=object)[rng.integers(len(FIRST_NAMES), size=count)] + " "
+             + np.array(LAST_NAMES, dtype=object)[rng.integers(len(LAST_NAMES), size=count)])
+    # Stroke rehabilitation patients are mostly older adults
+    ages = np.clip(rng.normal(67, 12, count), 18, 99).round().astype(np.int64)
+    genders = np.array(["Male", "Female"], dtype=object)[rng.integers(2, size=count)]
+    # Patients join throughout the period, leaving each at least a month of treatment
+    joined = start_day + rng.integers(0, max(days - 30, 1), size=count)
+    created = np.datetime_as_string(joined.astype("datetime64[D]"), unit="D").astype(object)
+    conn.executemany("INSERT INTO patients (id, name, age, gender, created_date) VALUES (?, ?, ?, ?, ?)",
+                     _rows(ids, names, ages, genders, created))
+
+    types = len(ASSESSMENT_TYPE_WEIGHTS)
+    recovery = {
+        # Starting score per patient and type: a patient level plus a per-type offset
+        "baseline": rng.normal(45, 12, (count, 1)) + rng.normal(0, 6, (count, types)),
+        "gain": np.clip(rng.normal(25, 10, (count, 1)), 0, None) * rng.uniform(0.6, 1.2, (count, types)),
+        "tau_days": rng.uniform(20, 150, (count, 1)),
+        "noise": rng.uniform(3, 8, (count, 1)),
+    }
+    return joined, recovery
+
+
+def _generate_history(rng, conn, ids, joined, recovery, per_patient, end_day):
+    """Insert per_patient results (on average) for each patient; returns the number inserted"""
+    import numpy as np
+    counts = rng.poisson(per_patient, len(ids))
+    patient = np.repeat(np.arange(len(ids)), counts)
+    total = len(patient)
+    if not total:
+        return 0
+
+    # Session times: sorted uniform offsets into each patient's time in treatment,
+    # during clinic hours (08:00 to 18:00)
+    span = np.maximum(end_day - joined, 1)[patient]
+    offset = rng.uniform(0, 1, total) * span
+    order = np.lexsort((offset, patient))
+    offset = offset[order]
+    day = joined[patient] + np.floor(offset).astype(np.int64)
+    date_ms = day * DAY_MS + rng.integers(8 * 3_600_000, 18 * 3_600_000, total)
+
+    kind = _choice(rng, ASSESSMENT_TYPE_WEIGHTS, total)
+    progress = 1 - np.exp(-offset / recovery["tau_days"][patient, 0])
+    score = (recovery["baseline"][patient, kind] + recovery["gain"][patient, kind] * progress
+             + rng.normal(0, 1, total) * recovery["noise"][patient, 0])
+    score = np.clip(score, 0, 100).round(1)
+
+    type_names = np.array(list(ASSESSMENT_TYPE_WEIGHTS), dtype=object)[kind]
+    details = np.array([f"Assessment on {name}" for name in ASSESSMENT_TYPE_WEIGHTS], dtype=object)[kind]
+    physio = type_names == "Physio"
+    category = np.full(total, None, dtype=object)
+    category[physio] = np.array(PHYSIO_CATEGORIES, dtype=object)[rng.integers(len(PHYSIO_CATEGORIES),
+                                                                              size=int(physio.sum()))]
+    details[physio] = category[physio] + " ROM Assessment"
+    duration = rng.normal(60, 8, total).clip(20, 120).round(1)
+    frames = np.full(total, None, dtype=object)
+    camera = np.isin(type_names, CAMERA_TYPES)
+    frames[camera] = (duration[camera] * CAMERA_FPS).astype(np.int64)
+
+    # details_json is formatted here: building it with json_object() in the
+    # INSERT took a third of the load
+    details_json = [f'{{"category": "{c}"}}' if c is not None
+                    else f'{{"duration_s": {d}, "frames": {f}}}' if f is not None
+                    else f'{{"duration_s": {d}}}'
+                    for c, d, f in zip(category.tolist(), duration.tolist(), frames.tolist())]
+
+    ids = ids[patient]
+    conn.executemany("""
+    INSERT INTO assessment_results
+    (patient_id, assessment_type, score, details, assessment_date, details_json)
+    VALUES (?, ?, ?, ?, ?, ?)
+    """, zip(ids.tolist(), type_names.tolist(), score.tolist(), details.tolist(), date_ms.tolist(),
+             details_json))
+    return total
+
+
+def _generate_plans(rng, conn, ids, joined, plans_per_patient, exercises_per_plan):
+    """Insert plans and their exercises; returns (plans, exercises) inserted"""
+    import numpy as np
+    patient = np.repeat(ids, plans_per_patient)
+    first_day = np.repeat(joined, plans_per_patient)
+    first_plan = conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM rehabilitation_plans").fetchone()[0]
+    plan_ids = np.arange(first_plan, first_plan + len(patient))
+    names = np.array(PLAN_NAMES, dtype=object)[rng.integers(len(PLAN_NAMES), size=len(patient))]
+    created_ms = (first_day + rng.integers(0, 14, len(patient))) * DAY_MS + 10 * 3_600_000
+    status = np.array(list(PLAN_STATUS_WEIGHTS), dtype=object)[_choice(rng, PLAN_STATUS_WEIGHTS, len(patient))]
+    conn.executemany("""
+    INSERT INTO rehabilitation_plans (id, patient_id, plan_name, description, created_date, status)
+    VALUES (?, ?, ?, ?, ?, ?)
+    """, _rows(plan_ids, patient, names, names + " for patient " + patient.astype(str).astype(object),
+               created_ms, status))
+
+    plan = np.repeat(plan_ids, exercises_per_plan)
+    exercise = rng.integers(len(EXERCISE_LIBRARY), size=len(plan))
+    library = [np.array(column, dtype=object) for column in zip(*EXERCISE_LIBRARY)]
+    completed = (rng.uniform(0, 1, len(plan)) < 0.4).astype(np.int64)
+    conn.executemany("""
+    INSERT INTO exercises (plan_id, exercise_name, description, frequency, duration, completed)
+    VALUES (?, ?, ?, ?, ?, ?)
+    """, _rows(plan, *(column[exercise] for column in library), completed))
+    return len(plan_ids), len(plan)
+
+
+def populate(conn, patients=10_000, assessments_per_patient=20, plans_per_patient=1,
+             exercises_per_plan=4, start_date="2023-01-01", days=730, seed=42,
+             batch_size=GENERATE_BATCH_SIZE):
+    """Add synthetic patients with their history, plans and exercises to a migrated database
+
+    Runs as one transaction. New patients get ids after any existing ones.
+
+    Args:
+        conn: sqlite3 connection to a database at the current schema version,
+            e.g. DatabaseManager.get_connection()
+        patients: Number of patients
+        assessments_per_patient: Average number of results per patient
+            (each patient's count is Poisson distributed)
+        plans_per_patient: Rehabilitation plans per patient
+        exercises_per_plan: Exercises per plan
+        start_date: First day patients can join, "YYYY-MM-DD"
+        days: Length of the period the history covers
+        seed: Random seed
+        batch_size: Approximate history rows generated and inserted at a time
+
+    Returns:
+        GenerateReport: Rows inserted per table and seconds taken
+    """
+    import numpy as np
+    start = time.perf_counter()
+    rng = np.random.default_rng(seed)
+    start_day = int(np.datetime64(start_date, "D").astype(np.int64))
+    end_day = start_day + days
+    patients_per_batch = max(batch_size // max(assessments_per_patient, 1), 1)
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        deferred = {}
+        for table in ("patients", "assessment_results", "rehabilitation_plans", "exercises"):
+            deferred.update(drop_deferred(conn, table))
+        first_id = conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM patients").fetchone()[0]
+
+        assessments = plans = exercises = 0
+        for batch_start in range(0, patients, patients_per_batch):
+            count = min(patients_per_batch, patients - batch_start)
+            ids = np.arange(first_id + batch_start, first_id + batch_start + count)
+            joined, recovery = _generate_patients(rng, conn, count, int(ids[0]), start_day, days)
+            assessments += _generate_history(rng, conn, ids, joined, recovery, assessments_per_patient,
+                                             end_day)
+            added_plans, added_exercises = _generate_plans(rng, conn, ids, joined, plans_per_patient,
+                                                           exercises_per_plan)
+            plans += added_plans
+            exercises += added_exercises
+
+        # Indexes first, the summary rebuild looks up each patient's latest result
+        for sql in deferred.values():
+            conn.execute(sql)
+        if "patients_fts_insert" in deferred:
+            conn.execute("INSERT INTO patients_fts (rowid, name) SELECT id, name FROM patients WHERE id >= ?",
+                         (first_id,))
+        if "assessment_summary_insert" in deferred:
+            rebuild_assessment_summary(conn, "patient_id >= ?", (first_id,))
+        update_latest_scores(conn, f"id >= {int(first_id)}")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    conn.execute("ANALYZE")
+    return GenerateReport(patients, assessments, plans, exercises, time.perf_counter() - start)
+
+
+def generate_database(path, overwrite=False, **options):
+    """Create a database file (or ":memory:") and fill it with populate()
+
+    Args:
+        path: Database file to create, or ":memory:"
+        overwrite: Replace an existing file instead of raising FileExistsError
+        **options: Arguments of populate()
+
+    Returns:
+        GenerateReport: Rows inserted per table and seconds taken
+    """
+    if str(path) != ":memory:":
+        path = Path(path)
+        if path.exists():
+            if not overwrite:
+                raise FileExistsError(f"Database already exists at {path}")
+            path.unlink()
+    conn = sqlite3.connect(path)
+    try:
+        # Bulk loading settings: nothing here needs to survive a crash mid-way
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=OFF")
+        with contextlib.redirect_stdout(io.StringIO()):
+            migrate(conn)
+        return populate(conn, **options)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Generate a synthetic NeuroWell database")
+    parser.add_argument("path", help='Database file to create, or ":memory:"')
+    parser.add_argument("--patients", type=int, default=10_000, help="Number of patients")
+    parser.add_argument("--assessments", type=int, default=20, help="Average results per patient")
+    parser.add_argument("--plans", type=int, default=1, help="Rehabilitation plans per patient")
+    parser.add_argument("--exercises", type=int, default=4, help="Exercises per plan")
+    parser.add_argument("--start", default="2023-01-01", help="First day of the history, YYYY-MM-DD")
+    parser.add_argument("--days", type=int, default=730, help="Days of history")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed")
+    parser.add_argument("--force", action="store_true", help="Overwrite an existing file")
+    args = parser.parse_args()
+
+    try:
+        report = generate_database(args.path, args.force, patients=args.patients,
+                                   assessments_per_patient=args.assessments, plans_per_patient=args.plans,
+                                   exercises_per_plan=args.exercises, start_date=args.start,
+                                   days=args.days, seed=args.seed)
+    except FileExistsError as e:
+        print(f"{e}; use --force to overwrite it")
+    else:
+        print(f"Generated {report.patients} patients, {report.assessments} assessment results, "
+              f"{report.plans} plans and {report.exercises} exercises in {report.seconds:.1f}s "
+              f"({report.assessments / report.seconds:,.0f} results/s)")
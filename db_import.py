@@ -0,0 +1,449 @@
+"""
+Bulk import of patients and assessment history from CSV files.
+
+Clinics moving to NeuroWell bring spreadsheets of thousands of patients and
+years of scores. add_patient and update_assessment_score commit once per row,
+so this module streams the CSV with pandas in batches instead. Each batch is
+validated and normalized with vectorized column operations, and the valid
+rows are inserted with executemany. The whole import is one transaction, and
+by default the target table's indexes and per-row triggers (name search and
+assessment summary) are dropped first and caught up once at the end, which is much cheaper than
+updating them row by row. If anything
+fails, the transaction rolls back and the indexes come back with it.
+
+Rows that fail validation are skipped and, if a rejects file is given,
+written to it with their line number and the reason.
+
+Patient files use the columns of the legacy export (Name, Age, Gender,
+Speech Score, ...) or the database column names. History files need a
+patient_id or a patient name, an assessment type, a score and a date, and may
+have details, a category and a details_json object. A "[Category] " prefix
+on the details, as older exports have, is moved into details_json.
+
+Usage:
+    python db_import.py patients clinic_patients.csv [--rejects rejected.csv]
+    python db_import.py history clinic_scores.csv [--db neurowell.db] [--keep-indexes]
+"""
+
+import csv
+import json
+import time
+from collections import namedtuple
+from db_migrations import rebuild_assessment_summary, ms_to_iso_sql
+
+# CSV rows validated and inserted per batch
+IMPORT_BATCH_SIZE = 5000
+
+# Scores are percentages
+MIN_SCORE = 0
+MAX_SCORE = 100
+MAX_AGE = 130
+
+# Headers are lower-cased with spaces turned into underscores, then renamed
+# with these aliases, so "Speech Score", "Patient" and "Date" are understood
+HEADER_ALIASES = {
+    "patient": "name",
+    "patient_name": "name",
+    "type": "assessment_type",
+    "assessment": "assessment_type",
+    "date": "assessment_date",
+}
+
+GENDERS = {"m": "Male", "male": "Male", "f": "Female", "female": "Female"}
+
+PATIENT_IMPORT_COLUMNS = ("name", "age", "gender", "speech_score", "emoji_score",
+                          "snake_score", "ball_score", "physio_score", "created_date")
+HISTORY_IMPORT_COLUMNS = ("patient_id", "assessment_type", "score", "details", "details_json",
+                          "assessment_date")
+
+# Assessment types the application writes, used to normalize their spelling
+ASSESSMENT_TYPES = ("Speech", "Emoji", "Snake", "Ball", "Physio")
+
+# Per-row insert triggers replaced by one catch-up statement after a bulk
+# import: the patient name search index and the assessment summary
+DEFERRED_TRIGGERS = ("patients_fts_insert", "assessment_summary_insert")
+
+# Result of an import; rows_per_second counts imported and rejected rows
+ImportReport = namedtuple("ImportReport", ("imported", "rejected", "seconds", "rows_per_second"))
+
+
+def _normalize_headers(frame):
+    """Rename the columns of a CSV chunk to database column names"""
+    columns = [str(column).strip().lower().replace(" ", "_") for column in frame.columns]
+    frame.columns = [HEADER_ALIASES.get(column, column) for column in columns]
+    return frame
+
+
+class _Rejects:
+    """Collects the reason each row of a chunk was rejected, first reason wins"""
+
+    def __init__(self, frame):
+        import pandas as pd
+        self.reasons = pd.Series("", index=frame.index, dtype=object)
+
+    def add(self, mask, reason):
+        self.reasons[mask & (self.reasons == "")] = reason
+
+    @property
+    def valid(self):
+        return self.reasons == ""
+
+
+def _numbers(frame, column, rejects, low, high, label):
+    """Parse a numeric column, rejecting text and values outside [low, high]
+
+    Returns:
+        Series: float values, NaN where the cell was empty
+    """
+    import pandas as pd
+    raw = frame[column].str.strip() if column in frame else pd.Series("", index=frame.index)
+    values = pd.to_numeric(raw, errors="coerce")
+    rejects.add((raw != "") & values.isna(), f"invalid {label}")
+    rejects.add(values.notna() & ((values < low) | (values > high)), f"{label} out of range")
+    return values
+
+
+def _dates(frame, column, rejects, label, date_format=None):
+    """Parse a date column in any common format and convert it the way the database stores it
+
+    Returns:
+        Series: dates formatted with date_format, or epoch milliseconds
+        (naive times taken as UTC) if it is None; missing where the cell was empty
+    """
+    import pandas as pd
+    raw = frame[column].str.strip() if column in frame else pd.Series("", index=frame.index)
+    raw = raw.where(raw != "")
+    # ISO dates parse in one vectorized pass; only the rest go through the slower mixed parser
+    parsed = pd.to_datetime(raw, errors="coerce", format="ISO8601")
+    other = parsed.isna() & raw.notna()
+    if other.any():
+        parsed[other] = pd.to_datetime(raw[other], errors="coerce", format="mixed")
+    raw = raw.fillna("")
+    rejects.add((raw != "") & parsed.isna(), f"invalid {label}")
+    if date_format is None:
+        epoch = pd.Timestamp(0, tz=parsed.dt.tz)
+        return ((parsed - epoch) // pd.Timedelta(milliseconds=1)).astype("Int64")
+    return parsed.dt.strftime(date_format).where(parsed.notna(), None)
+
+
+def _text(frame, column):
+    """Stripped text column, "" if the column is missing"""
+    import pandas as pd
+    if column not in frame:
+        return pd.Series("", index=frame.index, dtype=object)
+    return frame[column].str.strip()
+
+
+def _names(frame):
+    """Patient names with runs of whitespace collapsed to one space"""
+    return _text(frame, "name").str.replace(r"\s+", " ", regex=True)
+
+
+def _clean_patients(frame, today):
+    """Validate and normalize a chunk of patient rows
+
+    Returns:
+        tuple: (list of row tuples in PATIENT_IMPORT_COLUMNS order, _Rejects)
+    """
+    import pandas as pd
+    rejects = _Rejects(frame)
+    name = _names(frame)
+    rejects.add(name == "", "missing name")
+    age = _numbers(frame, "age", rejects, 0, MAX_AGE, "age")
+    rejects.add(age.notna() & (age != age.round()), "invalid age")
+
+    gender = _text(frame, "gender")
+    gender = gender.str.lower().map(GENDERS).fillna(gender.str.title()).where(gender != "", None)
+
+    columns = {"name": name, "age": age.round().astype("Int64"), "gender": gender}
+    for score_column in PATIENT_IMPORT_COLUMNS[3:8]:
+        label = score_column.replace("_", " ")
+        columns[score_column] = _numbers(frame, score_column, rejects, MIN_SCORE, MAX_SCORE, label).fillna(0)
+    columns["created_date"] = _dates(frame, "created_date", rejects, "created date", "%Y-%m-%d").fillna(today)
+
+    clean = pd.DataFrame(columns)[rejects.valid].astype(object)
+    return list(clean.where(clean.notna(), None).itertuples(index=False, name=None)), rejects
+
+
+def _resolve_patients(conn, frame, rejects):
+    """Patient ID of each history row, from its patient_id or its exact patient name
+
+    Returns:
+        Series: patient IDs, NaN for rows that were rejected
+    """
+    import pandas as pd
+    if "patient_id" in frame:
+        raw = frame["patient_id"].str.strip()
+        ids = pd.to_numeric(raw, errors="coerce")
+        rejects.add(ids.isna() | (ids != ids.round()), "invalid patient_id")
+        wanted = ids.dropna().astype("int64").unique().tolist()
+        known = {row[0] for row in conn.execute(
+            "SELECT id FROM patients WHERE id IN (SELECT value FROM json_each(?))", (json.dumps(wanted),))}
+        rejects.add(ids.notna() & ~ids.isin(known), "unknown patient")
+        return ids
+
+    if "name" not in frame:
+        rejects.add(rejects.valid, "missing patient_id or patient name")
+        return pd.Series(float("nan"), index=frame.index)
+
+    names = _names(frame)
+    rejects.add(names == "", "missing patient name")
+    # Names aren't unique, so a name only identifies a patient if exactly one has it
+    matches = conn.execute("""
+    SELECT name, COUNT(*), MIN(id) FROM patients
+    WHERE name IN (SELECT value FROM json_each(?))
+    GROUP BY name
+    """, (json.dumps(names[names != ""].unique().tolist()),)).fetchall()
+    counts = names.map({name: count for name, count, _ in matches}).fillna(0)
+    rejects.add((names != "") & (counts == 0), "unknown patient")
+    rejects.add(counts > 1, "ambiguous patient name")
+    return names.map({name: patient_id for name, count, patient_id in matches if count == 1}).astype(float)
+
+
+def _details_json(frame, details, rejects):
+    """Structured details of each history row from its category and details_json columns
+
+    Returns:
+        tuple: (details text without any "[Category] " prefix, details_json text or None)
+    """
+    prefix = details.str.extract(r"(?s)^\[([^\]]+)\]\s*(.*)$")
+    has_prefix = prefix[0].notna()
+    details = details.where(~has_prefix, prefix[1])
+    category = _text(frame, "category")
+    category = category.where(category != "", prefix[0].fillna(""))
+
+    # Most rows have at most a category; only rows with details_json are parsed
+    text = category.map(lambda name: json.dumps({"category": name}) if name else None)
+    raw = _text(frame, "details_json")
+    invalid = []
+    for index in raw.index[raw != ""]:
+        try:
+            fields = json.loads(raw[index])
+        except ValueError:
+            fields = None
+        if not isinstance(fields, dict):
+            invalid.append(index)
+            continue
+        if category[index]:
+            fields["category"] = category[index]
+        text[index] = json.dumps(fields)
+    rejects.add(raw.index.isin(invalid), "invalid details_json")
+    return details, text
+
+
+def _clean_history(conn, frame):
+    """Validate and normalize a chunk of assessment history rows
+
+    Returns:
+        tuple: (list of row tuples in HISTORY_IMPORT_COLUMNS order, _Rejects)
+    """
+    import pandas as pd
+    rejects = _Rejects(frame)
+    patient_ids = _resolve_patients(conn, frame, rejects)
+
+    assessment_type = _text(frame, "assessment_type")
+    rejects.add(assessment_type == "", "missing assessment type")
+    # "ball" and "BALL" become "Ball"; other types are kept as written
+    known_types = {kind.lower(): kind for kind in ASSESSMENT_TYPES}
+    assessment_type = assessment_type.str.lower().map(known_types).fillna(assessment_type)
+
+    score = _numbers(frame, "score", rejects, MIN_SCORE, MAX_SCORE, "score")
+    rejects.add(score.isna(), "missing score")
+    assessment_date = _dates(frame, "assessment_date", rejects, "date")
+    rejects.add(assessment_date.isna(), "missing date")
+    details, details_json = _details_json(frame, _text(frame, "details"), rejects)
+
+    clean = pd.DataFrame({
+        "patient_id": patient_ids,
+        "assessment_type": assessment_type,
+        "score": score,
+        "details": details.where(details != "", None),
+        "details_json": details_json,
+        "assessment_date": assessment_date,
+    })[rejects.valid]
+    clean["patient_id"] = clean["patient_id"].astype("int64")
+    clean = clean.astype(object)
+    return list(clean.where(clean.notna(), None).itertuples(index=False, name=None)), rejects
+
+
+def drop_deferred(conn, table):
+    """Drop what a bulk insert into the table can rebuild once at the end
+
+    That is the table's secondary indexes and its DEFERRED_TRIGGERS. Run
+    the returned statements, then catch up the name search index and the
+    assessment summary, before committing.
+
+    Returns:
+        dict: name -> SQL statement that recreates each dropped object
+    """
+    objects = conn.execute(f"""
+    SELECT type, name, sql FROM sqlite_master
+    WHERE tbl_name = ? AND sql IS NOT NULL
+      AND (type = 'index' OR name IN ({', '.join('?' * len(DEFERRED_TRIGGERS))}))
+    """, (table,) + DEFERRED_TRIGGERS).fetchall()
+    for kind, name, _ in objects:
+        conn.execute(f"DROP {kind.upper()} {name}")
+    return {name: sql for _, name, sql in objects}
+
+
+def update_latest_scores(conn, patient_filter="id IN (SELECT id FROM temp.imported_patients)"):
+    """Copy each patient's latest score of each type from assessment_summary into their score columns
+
+    Args:
+        conn: Connection, inside the caller's transaction
+        patient_filter: SQL condition on patients selecting who to update;
+            by default the patients of the running import
+    """
+    for kind in ASSESSMENT_TYPES:
+        column = f"{kind.lower()}_score"
+        conn.execute(f"""
+        UPDATE patients SET {column} = (
+            SELECT latest_score FROM assessment_summary
+            WHERE patient_id = patients.id AND assessment_type = ?)
+        WHERE {patient_filter}
+          AND EXISTS (SELECT 1 FROM assessment_summary WHERE patient_id = patients.id AND assessment_type = ?)
+        """, (kind, kind))
+    conn.execute(f"""
+    UPDATE patients SET last_assessment = MAX(COALESCE(last_assessment, ''), (
+        SELECT {ms_to_iso_sql('MAX(latest_date)')} FROM assessment_summary WHERE patient_id = patients.id))
+    WHERE {patient_filter}
+    """)
+
+
+def _import_csv(manager, input_path, table, columns, clean, batch_size, rejects_path, defer_indexes):
+    """Stream a CSV file into a table; see import_patients_csv and import_history_csv"""
+    import pandas as pd
+    start = time.perf_counter()
+    imported = 0
+    rejected = 0
+    placeholders = ", ".join("?" * len(columns))
+    insert = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})"
+
+    conn = manager.get_connection()
+    rejects_file = open(rejects_path, "w", newline="") if rejects_path else None
+    rejects_writer = None
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        deferred = drop_deferred(conn, table) if defer_indexes else {}
+        # New rows get AUTOINCREMENT ids above every existing one
+        first_id = conn.execute(f"SELECT COALESCE(MAX(id), 0) + 1 FROM {table}").fetchone()[0]
+        if table == "assessment_results":
+            conn.execute("CREATE TEMP TABLE IF NOT EXISTS imported_patients (id INTEGER PRIMARY KEY)")
+            conn.execute("DELETE FROM temp.imported_patients")
+
+        # Everything is read as text so validation sees exactly what was in the file
+        chunks = pd.read_csv(input_path, dtype=str, keep_default_na=False, chunksize=batch_size,
+                             skipinitialspace=True)
+        for chunk in chunks:
+            frame = _normalize_headers(chunk)
+            rows, rejects = clean(conn, frame)
+            conn.executemany(insert, rows)
+            if table == "assessment_results":
+                conn.executemany("INSERT OR IGNORE INTO temp.imported_patients (id) VALUES (?)",
+                                 {(row[0],) for row in rows})
+            imported += len(rows)
+
+            invalid = ~rejects.valid
+            rejected += int(invalid.sum())
+            if rejects_file and invalid.any():
+                if rejects_writer is None:
+                    rejects_writer = csv.writer(rejects_file)
+                    rejects_writer.writerow(["line", "reason"] + list(chunk.columns))
+                # Line 1 is the header and the chunk index counts data rows from 0
+                for index, reason in rejects.reasons[invalid].items():
+                    rejects_writer.writerow([index + 2, reason] + chunk.loc[index].tolist())
+
+        # Indexes first, the summary rebuild looks up each patient's latest result
+        for sql in deferred.values():
+            conn.execute(sql)
+        if "patients_fts_insert" in deferred:
+            conn.execute("INSERT INTO patients_fts (rowid, name) SELECT id, name FROM patients WHERE id >= ?",
+                         (first_id,))
+        if "assessment_summary_insert" in deferred:
+            rebuild_assessment_summary(conn, "patient_id IN (SELECT id FROM temp.imported_patients)")
+        if table == "assessment_results":
+            update_latest_scores(conn)
+        conn.commit()
+        manager.invalidate_cache()
+    except Exception:
+        if conn.in_transaction:
+            conn.rollback()
+        raise
+    finally:
+        if rejects_file:
+            rejects_file.close()
+
+    seconds = time.perf_counter() - start
+    rate = (imported + rejected) / seconds if seconds > 0 else 0.0
+    return ImportReport(imported, rejected, seconds, rate)
+
+
+def import_patients_csv(manager, input_path, batch_size=IMPORT_BATCH_SIZE, rejects_path=None,
+                        defer_indexes=True):
+    """Import patients from a CSV file in one transaction
+
+    Missing scores are 0 and a missing created date is today. Genders "M"
+    and "F" (any case) become "Male" and "Female".
+
+    Args:
+        manager: DatabaseManager to import into
+        input_path: CSV file with at least a Name column
+        batch_size: Rows validated and inserted at a time
+        rejects_path: Optional CSV file for the rows that failed validation
+        defer_indexes: Drop the patients indexes and name search trigger during
+            the import, then rebuild the indexes and index the new names once
+
+    Returns:
+        ImportReport: (imported, rejected, seconds, rows_per_second)
+    """
+    today = time.strftime("%Y-%m-%d")
+    return _import_csv(manager, input_path, "patients", PATIENT_IMPORT_COLUMNS,
+                       lambda conn, frame: _clean_patients(frame, today),
+                       batch_size, rejects_path, defer_indexes)
+
+
+def import_history_csv(manager, input_path, batch_size=IMPORT_BATCH_SIZE, rejects_path=None,
+                       defer_indexes=True):
+    """Import assessment results from a CSV file in one transaction
+
+    Rows name their patient by patient_id, or by a patient name that exactly
+    one patient has. Afterwards each imported patient's score columns are set
+    to their latest score of each type.
+
+    Args:
+        manager: DatabaseManager to import into
+        input_path: CSV file with patient, assessment type, score and date columns
+        batch_size: Rows validated and inserted at a time
+        rejects_path: Optional CSV file for the rows that failed validation
+        defer_indexes: Drop the history indexes and the summary trigger during the
+            import, then rebuild the indexes and the imported patients' summaries once
+
+    Returns:
+        ImportReport: (imported, rejected, seconds, rows_per_second)
+    """
+    return _import_csv(manager, input_path, "assessment_results", HISTORY_IMPORT_COLUMNS,
+                       _clean_history, batch_size, rejects_path, defer_indexes)
+
+
+if __name__ == "__main__":
+    import argparse
+    from db_utils import DatabaseManager
+
+    parser = argparse.ArgumentParser(description="Bulk import NeuroWell data from CSV")
+    parser.add_argument("table", choices=["patients", "history"], help="What the file contains")
+    parser.add_argument("input", help="CSV file to import")
+    parser.add_argument("--db", default="neurowell.db", help="Database to import into")
+    parser.add_argument("--rejects", help="Write rejected rows and the reasons to this CSV file")
+    parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE, help="Rows per batch")
+    parser.add_argument("--keep-indexes", action="store_true",
+                        help="Update indexes and summaries row by row instead of rebuilding them at the end")
+    args = parser.parse_args()
+
+    manager = DatabaseManager(args.db)
+    importer = import_patients_csv if args.table == "patients" else import_history_csv
+    report = importer(manager, args.input, args.batch_size, args.rejects, not args.keep_indexes)
+    print(f"Imported {report.imported} rows, rejected {report.rejected}, "
+          f"in {report.seconds:.2f} s ({report.rows_per_second:.0f} rows/s)")
+    if report.rejected and not args.rejects:
+        print("Use --rejects FILE to see which rows were rejected and why")
+    manager.close()
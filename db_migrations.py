@@ -0,0 +1,681 @@
+"""
+Versioned schema migrations for the NeuroWell database.
+
+The schema version is kept in SQLite's PRAGMA user_version. Each migration
+step moves the database from version N-1 to N inside one transaction and bumps
+user_version in the same transaction, so a crash never leaves a half-applied
+step. Steps are written to be idempotent, which lets databases created by
+older versions of the application (user_version 0 but some tables present)
+go through the same path as brand-new files.
+
+Opening an up-to-date database costs a single PRAGMA user_version read.
+"""
+
+import sqlite3
+
+
+def iso_to_ms_sql(expression):
+    """SQL converting an ISO 8601 date/time expression to milliseconds since the Unix epoch (UTC)"""
+    return f"CAST(ROUND((julianday({expression}) - 2440587.5) * 86400000) AS INTEGER)"
+
+
+def ms_to_iso_sql(expression):
+    """SQL converting an epoch-milliseconds expression to "YYYY-MM-DD HH:MM:SS" text (UTC)"""
+    return f"strftime('%Y-%m-%d %H:%M:%S', {expression} / 1000, 'unixepoch')"
+
+
+def get_schema_version(conn):
+    """Return the schema version stored in the database"""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def _table_columns(conn, table):
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+
+
+def _add_missing_columns(conn, table, columns):
+    """Add (name, definition) columns that the table doesn't have yet"""
+    existing = _table_columns(conn, table)
+    for name, definition in columns:
+        if name not in existing:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {definition}")
+
+
+def migration_1_base_schema(conn):
+    """Create the four core tables, or fill in columns older databases lack"""
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS patients (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        age INTEGER,
+        gender TEXT,
+        speech_score REAL DEFAULT 0,
+        emoji_score REAL DEFAULT 0,
+        snake_score REAL DEFAULT 0,
+        ball_score REAL DEFAULT 0,
+        physio_score REAL DEFAULT 0,
+        created_date TEXT,
+        last_assessment TEXT
+    )
+    ''')
+    # Databases created by earlier versions of the application
+    _add_missing_columns(conn, "patients", [
+        ("physio_score", "REAL DEFAULT 0"),
+        ("created_date", "TEXT"),
+        ("last_assessment", "TEXT"),
+    ])
+
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS assessment_results (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        patient_id INTEGER,
+        assessment_type TEXT,
+        score REAL,
+        details TEXT,
+        assessment_date TEXT,
+        FOREIGN KEY (patient_id) REFERENCES patients (id)
+    )
+    ''')
+
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS rehabilitation_plans (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        patient_id INTEGER,
+        plan_name TEXT,
+        description TEXT,
+        created_date TEXT,
+        status TEXT,
+        FOREIGN KEY (patient_id) REFERENCES patients (id)
+    )
+    ''')
+
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS exercises (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        plan_id INTEGER,
+        exercise_name TEXT,
+        description TEXT,
+        frequency TEXT,
+        duration TEXT,
+        completed INTEGER DEFAULT 0,
+        FOREIGN KEY (plan_id) REFERENCES rehabilitation_plans (id)
+    )
+    ''')
+
+
+def migration_2_history_indexes(conn):
+    """Index the foreign keys and history lookups that used to scan whole tables"""
+    # Patient history filtered by type and ordered by date. Including score
+    # makes it covering for trend queries that only read date and score.
+    conn.execute('''
+    CREATE INDEX IF NOT EXISTS idx_assessment_results_patient_type_date
+    ON assessment_results (patient_id, assessment_type, assessment_date, score)
+    ''')
+    # Full patient history ordered by date, and deletes by patient_id
+    conn.execute('''
+    CREATE INDEX IF NOT EXISTS idx_assessment_results_patient_date
+    ON assessment_results (patient_id, assessment_date)
+    ''')
+    conn.execute('''
+    CREATE INDEX IF NOT EXISTS idx_rehabilitation_plans_patient_created
+    ON rehabilitation_plans (patient_id, created_date)
+    ''')
+    conn.execute('''
+    CREATE INDEX IF NOT EXISTS idx_exercises_plan
+    ON exercises (plan_id)
+    ''')
+    conn.execute("ANALYZE")
+
+
+def migration_3_patient_name_search(conn):
+    """Trigram full-text index on patient names, kept in sync by triggers
+
+    SQLite builds without FTS5 (or older than 3.34, without the trigram
+    tokenizer) skip this step, and name search falls back to LIKE.
+    """
+    try:
+        conn.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS patients_fts
+        USING fts5(name, content='patients', content_rowid='id', tokenize='trigram')
+        ''')
+    except sqlite3.OperationalError as e:
+        print(f"Full-text search unavailable, patient search will use LIKE: {e}")
+        return
+
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS patients_fts_insert AFTER INSERT ON patients BEGIN
+        INSERT INTO patients_fts (rowid, name) VALUES (new.id, new.name);
+    END
+    ''')
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS patients_fts_delete AFTER DELETE ON patients BEGIN
+        INSERT INTO patients_fts (patients_fts, rowid, name) VALUES ('delete', old.id, old.name);
+    END
+    ''')
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS patients_fts_update AFTER UPDATE OF name ON patients BEGIN
+        INSERT INTO patients_fts (patients_fts, rowid, name) VALUES ('delete', old.id, old.name);
+        INSERT INTO patients_fts (rowid, name) VALUES (new.id, new.name);
+    END
+    ''')
+    # Index the patients that already exist
+    conn.execute("INSERT INTO patients_fts (patients_fts) VALUES ('rebuild')")
+
+
+def _rebuild_table(conn, table, create_sql, columns, parent_check, expressions=None):
+    """Recreate a table from new DDL, keeping the rows whose parent still exists
+
+    SQLite can't add constraints to an existing table, so this follows the
+    documented create / copy / drop / rename procedure. It must run with
+    foreign key enforcement off, which migrate() takes care of.
+
+    expressions optionally maps column names to the SQL that computes their
+    new value from the old row, for columns that change type. An
+    AUTOINCREMENT counter is carried over, so the ids of deleted rows are
+    never handed out again.
+    """
+    expressions = expressions or {}
+    column_list = ", ".join(columns)
+    select_list = ", ".join(expressions.get(column, column) for column in columns)
+    conn.execute(create_sql.format(table=f"{table}_new"))
+    sequence = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (table,)).fetchone()
+    conn.execute(f"INSERT INTO {table}_new ({column_list}) SELECT {select_list} FROM {table} WHERE {parent_check}")
+    orphans = conn.execute(f"SELECT COUNT(*) FROM {table} WHERE NOT ({parent_check})").fetchone()[0]
+    if orphans:
+        print(f"Dropped {orphans} {table} rows that referred to deleted records")
+    conn.execute(f"DROP TABLE {table}")
+    conn.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+    if sequence is not None:
+        conn.execute("DELETE FROM sqlite_sequence WHERE name = ?", (table,))
+        conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)", (table, sequence[0]))
+
+
+def migration_4_cascading_foreign_keys(conn):
+    """Recreate the child tables with ON DELETE CASCADE foreign keys"""
+    _rebuild_table(conn, "assessment_results", '''
+    CREATE TABLE {table} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        patient_id INTEGER,
+        assessment_type TEXT,
+        score REAL,
+        details TEXT,
+        assessment_date TEXT,
+        FOREIGN KEY (patient_id) REFERENCES patients (id) ON DELETE CASCADE
+    )
+    ''', ("id", "patient_id", "assessment_type", "score", "details", "assessment_date"),
+        "patient_id IS NULL OR patient_id IN (SELECT id FROM patients)")
+
+    _rebuild_table(conn, "rehabilitation_plans", '''
+    CREATE TABLE {table} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        patient_id INTEGER,
+        plan_name TEXT,
+        description TEXT,
+        created_date TEXT,
+        status TEXT,
+        FOREIGN KEY (patient_id) REFERENCES patients (id) ON DELETE CASCADE
+    )
+    ''', ("id", "patient_id", "plan_name", "description", "created_date", "status"),
+        "patient_id IS NULL OR patient_id IN (SELECT id FROM patients)")
+
+    _rebuild_table(conn, "exercises", '''
+    CREATE TABLE {table} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        plan_id INTEGER,
+        exercise_name TEXT,
+        description TEXT,
+        frequency TEXT,
+        duration TEXT,
+        completed INTEGER DEFAULT 0,
+        FOREIGN KEY (plan_id) REFERENCES rehabilitation_plans (id) ON DELETE CASCADE
+    )
+    ''', ("id", "plan_id", "exercise_name", "description", "frequency", "duration", "completed"),
+        "plan_id IS NULL OR plan_id IN (SELECT id FROM rehabilitation_plans)")
+
+    # Dropping the old tables dropped their indexes; the cascades need them
+    migration_2_history_indexes(conn)
+
+    violation = conn.execute("PRAGMA foreign_key_check").fetchone()
+    if violation is not None:
+        raise sqlite3.IntegrityError(f"Foreign key violation after rebuilding tables: {violation}")
+
+
+def migration_5_patient_name_index(conn):
+    """Index patient names for keyset-paginated listings ordered by (name, id)"""
+    # The rowid is part of every index entry, so (name) also orders by id
+    conn.execute('''
+    CREATE INDEX IF NOT EXISTS idx_patients_name
+    ON patients (name)
+    ''')
+
+
+# Trigger statements shared by the assessment_summary triggers. ADD counts a
+# new history row into its summary row. REMOVE takes an old one out; count and
+# sums are O(1), while min/max/latest are only recomputed (from the patient's
+# indexed history) when the removed row was one of them. The latest result is
+# the one with the newest date, and the highest id among equal dates.
+#
+# The recompute compares types COLLATE NOCASE, like the summary's key, and
+# reads them from the NOCASE (patient_id, assessment_type, assessment_date,
+# score) index added by migration 11. Every statement matches on the summary
+# row's primary key, so REMOVE does nothing once that row is gone.
+_SUMMARY_ADD = '''
+    INSERT INTO assessment_summary
+    (patient_id, assessment_type, count, total, total_squares,
+     min_score, max_score, latest_score, latest_date, latest_result_id)
+    SELECT new.patient_id, new.assessment_type, 1, new.score, new.score * new.score,
+           new.score, new.score, new.score, new.assessment_date, new.id
+    WHERE new.patient_id IS NOT NULL AND new.assessment_type IS NOT NULL
+      AND new.score IS NOT NULL
+    ON CONFLICT (patient_id, assessment_type) DO UPDATE SET
+        count = count + 1,
+        total = total + excluded.total,
+        total_squares = total_squares + excluded.total_squares,
+        min_score = MIN(min_score, excluded.min_score),
+        max_score = MAX(max_score, excluded.max_score),
+        (latest_score, latest_date, latest_result_id) = (
+            SELECT excluded.latest_score, excluded.latest_date, excluded.latest_result_id
+            WHERE latest_date IS NULL
+               OR (excluded.latest_date, excluded.latest_result_id) > (latest_date, latest_result_id)
+            UNION ALL
+            SELECT latest_score, latest_date, latest_result_id
+            LIMIT 1);
+'''
+
+_SUMMARY_REMOVE = '''
+    UPDATE assessment_summary SET
+        count = count - 1,
+        total = total - old.score,
+        total_squares = total_squares - old.score * old.score
+    WHERE patient_id = old.patient_id AND assessment_type = old.assessment_type
+      AND old.score IS NOT NULL;
+    DELETE FROM assessment_summary
+    WHERE patient_id = old.patient_id AND assessment_type = old.assessment_type AND count <= 0;
+    UPDATE assessment_summary SET
+        (min_score, max_score) = (
+            SELECT MIN(score), MAX(score) FROM assessment_results
+            WHERE patient_id = old.patient_id AND assessment_type = old.assessment_type COLLATE NOCASE),
+        (latest_score, latest_date, latest_result_id) = (
+            SELECT score, assessment_date, id FROM assessment_results
+            WHERE patient_id = old.patient_id AND assessment_type = old.assessment_type COLLATE NOCASE
+              AND score IS NOT NULL
+            ORDER BY assessment_date DESC, id DESC LIMIT 1)
+    WHERE patient_id = old.patient_id AND assessment_type = old.assessment_type
+      AND old.score IS NOT NULL
+      AND (old.score <= min_score OR old.score >= max_score OR old.id = latest_result_id);
+'''
+
+
+def rebuild_assessment_summary(conn, patient_filter=None, params=()):
+    """Recompute assessment_summary rows from the history
+
+    Args:
+        conn: Connection, inside the caller's transaction
+        patient_filter: Optional SQL condition on patient_id, e.g.
+            "patient_id IN (SELECT id FROM temp.imported_patients)";
+            all patients are recomputed if not given
+        params: Parameters of patient_filter
+    """
+    condition = f"AND {patient_filter}" if patient_filter else ""
+    conn.execute(f'DELETE FROM assessment_summary WHERE 1 {condition}', params)
+    conn.execute(f'''
+    INSERT INTO assessment_summary
+    (patient_id, assessment_type, count, total, total_squares,
+     min_score, max_score, latest_score, latest_date, latest_result_id)
+    SELECT a.patient_id, a.assessment_type, a.count, a.total, a.total_squares,
+           a.min_score, a.max_score, r.score, r.assessment_date, r.id
+    FROM (
+        SELECT patient_id, assessment_type, COUNT(*) AS count, SUM(score) AS total,
+               SUM(score * score) AS total_squares, MIN(score) AS min_score, MAX(score) AS max_score
+        FROM assessment_results
+        WHERE patient_id IS NOT NULL AND assessment_type IS NOT NULL AND score IS NOT NULL
+          {condition}
+        GROUP BY patient_id, assessment_type COLLATE NOCASE
+    ) a
+    JOIN assessment_results r ON r.id = (
+        SELECT id FROM assessment_results
+        WHERE patient_id = a.patient_id AND assessment_type = a.assessment_type COLLATE NOCASE
+          AND score IS NOT NULL
+        ORDER BY assessment_date DESC, id DESC LIMIT 1)
+    ''', params)
+
+
+def _create_summary_table(conn, date_type="INTEGER"):
+    """Create assessment_summary; latest_date was TEXT before migration 8"""
+    conn.execute(f'''
+    CREATE TABLE IF NOT EXISTS assessment_summary (
+        patient_id INTEGER NOT NULL,
+        assessment_type TEXT NOT NULL COLLATE NOCASE,
+        count INTEGER NOT NULL,
+        total REAL NOT NULL,
+        total_squares REAL NOT NULL,
+        min_score REAL,
+        max_score REAL,
+        latest_score REAL,
+        latest_date {date_type},
+        latest_result_id INTEGER,
+        PRIMARY KEY (patient_id, assessment_type),
+        FOREIGN KEY (patient_id) REFERENCES patients (id) ON DELETE CASCADE
+    ) WITHOUT ROWID
+    ''')
+
+
+def _create_summary_triggers(conn):
+    """Triggers keeping assessment_summary in step with assessment_results"""
+    conn.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS assessment_summary_insert
+    AFTER INSERT ON assessment_results
+    BEGIN {_SUMMARY_ADD} END
+    ''')
+    conn.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS assessment_summary_delete
+    AFTER DELETE ON assessment_results
+    WHEN old.assessment_type IS NOT NULL
+    BEGIN {_SUMMARY_REMOVE} END
+    ''')
+    conn.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS assessment_summary_update
+    AFTER UPDATE OF patient_id, assessment_type, score, assessment_date ON assessment_results
+    BEGIN {_SUMMARY_REMOVE} {_SUMMARY_ADD} END
+    ''')
+    # Deleting a patient cascades to each of their results; clearing the
+    # summary first turns the REMOVE trigger on every one of them into a no-op
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS assessment_summary_patient_delete
+    BEFORE DELETE ON patients
+    BEGIN
+        DELETE FROM assessment_summary WHERE patient_id = old.id;
+    END
+    ''')
+
+
+def migration_6_assessment_summary(conn):
+    """Per patient and assessment type statistics kept up to date by triggers"""
+    # Games write "ball" while older code writes "Ball", so types are compared
+    # case-insensitively and share one summary row
+    _create_summary_table(conn, "TEXT")
+
+    rebuild_assessment_summary(conn)
+
+    _create_summary_triggers(conn)
+
+
+def _create_rollup_triggers(conn, source_columns):
+    """Triggers marking patients whose rolled-up history changed for a rebuild
+
+    source_columns lists the assessment_results columns a rollup row is
+    computed from; the category moved from details to details_json in migration 9.
+    """
+    for event in ("DELETE", f"UPDATE OF {source_columns}"):
+        name = "assessment_rollups_" + event.split()[0].lower()
+        conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {name}
+        AFTER {event} ON assessment_results
+        WHEN old.id <= (SELECT high_water FROM rollup_state WHERE id = 1)
+        BEGIN
+            DELETE FROM assessment_rollups WHERE patient_id = old.patient_id;
+            INSERT OR IGNORE INTO rollup_dirty_patients (patient_id) VALUES (old.patient_id);
+        END
+        ''')
+    # An update can also move a result to another patient
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS assessment_rollups_move
+    AFTER UPDATE OF patient_id ON assessment_results
+    WHEN old.id <= (SELECT high_water FROM rollup_state WHERE id = 1)
+         AND new.patient_id IS NOT old.patient_id
+    BEGIN
+        DELETE FROM assessment_rollups WHERE patient_id = new.patient_id;
+        INSERT OR IGNORE INTO rollup_dirty_patients (patient_id) VALUES (new.patient_id);
+    END
+    ''')
+
+
+def migration_7_assessment_rollups(conn):
+    """Day, week and month rollups of the assessment history for trend charts
+
+    The rollups are filled incrementally by DatabaseManager.refresh_rollups()
+    from a high-water mark on assessment_results.id. Changing or deleting a
+    result that was already rolled up drops that patient's rollups and marks
+    the patient for a rebuild on the next refresh.
+    """
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS assessment_rollups (
+        patient_id INTEGER NOT NULL,
+        assessment_type TEXT NOT NULL COLLATE NOCASE,
+        category TEXT NOT NULL,
+        granularity TEXT NOT NULL,
+        bucket TEXT NOT NULL,
+        count INTEGER NOT NULL,
+        total REAL NOT NULL,
+        min_score REAL,
+        max_score REAL,
+        PRIMARY KEY (patient_id, assessment_type, granularity, category, bucket),
+        FOREIGN KEY (patient_id) REFERENCES patients (id) ON DELETE CASCADE
+    ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS rollup_state (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        high_water INTEGER NOT NULL
+    )
+    ''')
+    conn.execute("INSERT OR IGNORE INTO rollup_state (id, high_water) VALUES (1, 0)")
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS rollup_dirty_patients (
+        patient_id INTEGER PRIMARY KEY
+    )
+    ''')
+
+    _create_rollup_triggers(conn, "patient_id, assessment_type, score, details, assessment_date")
+
+
+def _epoch_ms(column):
+    """Conversion of a text date column to epoch milliseconds, leaving integers as they are"""
+    return f"CASE WHEN typeof({column}) = 'integer' THEN {column} ELSE {iso_to_ms_sql(column)} END"
+
+
+def migration_8_epoch_millisecond_dates(conn):
+    """Store assessment and plan dates as INTEGER milliseconds since the Unix epoch
+
+    The dates were ISO 8601 text, which sorts and compares correctly only as
+    long as every writer uses exactly the same format. Integers compare
+    numerically, take 8 bytes or less instead of 19, and make date ranges
+    plain index range scans. The columns keep their names; the
+    assessment_results_iso and rehabilitation_plans_iso views show them as
+    text for ad hoc queries.
+    """
+    _rebuild_table(conn, "assessment_results", '''
+    CREATE TABLE {table} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        patient_id INTEGER,
+        assessment_type TEXT,
+        score REAL,
+        details TEXT,
+        assessment_date INTEGER,
+        FOREIGN KEY (patient_id) REFERENCES patients (id) ON DELETE CASCADE
+    )
+    ''', ("id", "patient_id", "assessment_type", "score", "details", "assessment_date"),
+        "patient_id IS NULL OR patient_id IN (SELECT id FROM patients)",
+        {"assessment_date": _epoch_ms("assessment_date")})
+
+    _rebuild_table(conn, "rehabilitation_plans", '''
+    CREATE TABLE {table} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        patient_id INTEGER,
+        plan_name TEXT,
+        description TEXT,
+        created_date INTEGER,
+        status TEXT,
+        FOREIGN KEY (patient_id) REFERENCES patients (id) ON DELETE CASCADE
+    )
+    ''', ("id", "patient_id", "plan_name", "description", "created_date", "status"),
+        "patient_id IS NULL OR patient_id IN (SELECT id FROM patients)",
+        {"created_date": _epoch_ms("created_date")})
+
+    # Dropping the old tables dropped their indexes and triggers
+    migration_2_history_indexes(conn)
+    conn.execute("DROP TABLE IF EXISTS assessment_summary")
+    _create_summary_table(conn)
+    rebuild_assessment_summary(conn)
+    _create_summary_triggers(conn)
+    _create_rollup_triggers(conn, "patient_id, assessment_type, score, details, assessment_date")
+
+    conn.execute(f'''
+    CREATE VIEW IF NOT EXISTS assessment_results_iso AS
+    SELECT id, patient_id, assessment_type, score, details,
+           {ms_to_iso_sql("assessment_date")} AS assessment_date
+    FROM assessment_results
+    ''')
+    conn.execute(f'''
+    CREATE VIEW IF NOT EXISTS rehabilitation_plans_iso AS
+    SELECT id, patient_id, plan_name, description,
+           {ms_to_iso_sql("created_date")} AS created_date, status
+    FROM rehabilitation_plans
+    ''')
+
+    violation = conn.execute("PRAGMA foreign_key_check").fetchone()
+    if violation is not None:
+        raise sqlite3.IntegrityError(f"Foreign key violation after rebuilding tables: {violation}")
+
+
+def migration_9_structured_details(conn):
+    """JSON details_json column with generated, indexed columns for its common keys
+
+    details_json holds an object such as {"category": "Balance",
+    "scores": {"reach": 62}, "duration_s": 60.0, "frames": 1800}. The
+    category, duration_s and frames keys are exposed as VIRTUAL generated
+    columns (SQLite 3.31 or newer), and (patient_id, category,
+    assessment_date) is indexed so per-category history is an index range scan.
+    The "[Category] " prefix that detailed assessments used to put in details
+    is moved into details_json.
+    """
+    _add_missing_columns(conn, "assessment_results", [
+        ("details_json", "TEXT CHECK (details_json IS NULL OR json_valid(details_json))"),
+        ("category", "TEXT GENERATED ALWAYS AS (json_extract(details_json, '$.category')) VIRTUAL"),
+        ("duration_s", "REAL GENERATED ALWAYS AS (json_extract(details_json, '$.duration_s')) VIRTUAL"),
+        ("frames", "INTEGER GENERATED ALWAYS AS (json_extract(details_json, '$.frames')) VIRTUAL"),
+    ])
+
+    # The categories don't change, so the existing rollups stay valid
+    conn.execute("DROP TRIGGER IF EXISTS assessment_rollups_update")
+    conn.execute('''
+    UPDATE assessment_results SET
+        details_json = json_object('category', substr(details, 2, instr(details, ']') - 2)),
+        details = ltrim(substr(details, instr(details, ']') + 1))
+    WHERE details_json IS NULL AND details LIKE '[%]%' AND instr(details, ']') > 2
+    ''')
+    _create_rollup_triggers(conn, "patient_id, assessment_type, score, details_json, assessment_date")
+
+    conn.execute('''
+    CREATE INDEX IF NOT EXISTS idx_assessment_results_patient_category_date
+    ON assessment_results (patient_id, category, assessment_date)
+    ''')
+    conn.execute("ANALYZE assessment_results")
+
+
+def migration_10_summary_trigger_lookups(conn):
+    """Recreate the summary triggers with indexed lookups and a patient delete trigger
+
+    The REMOVE step used to find a type's remaining history with COLLATE
+    NOCASE, scanning the patient's whole history for every deleted result, so
+    deleting a patient took time quadratic in the size of their history.
+    """
+    conn.execute("DROP TRIGGER IF EXISTS assessment_summary_delete")
+    conn.execute("DROP TRIGGER IF EXISTS assessment_summary_update")
+    _create_summary_triggers(conn)
+
+
+def migration_11_case_insensitive_type_index(conn):
+    """Index the history by type compared case-insensitively, as assessment_summary groups it
+
+    Migration 10 looked types up under three spellings with IN, which missed
+    results spelled any other way ("BALL"). The summary triggers go back to
+    COLLATE NOCASE, and this index keeps that comparison from scanning the
+    patient's whole history.
+    """
+    conn.execute('''
+    CREATE INDEX IF NOT EXISTS idx_assessment_results_patient_type_nocase_date
+    ON assessment_results (patient_id, assessment_type COLLATE NOCASE, assessment_date, score)
+    ''')
+    conn.execute("DROP TRIGGER IF EXISTS assessment_summary_delete")
+    conn.execute("DROP TRIGGER IF EXISTS assessment_summary_update")
+    _create_summary_triggers(conn)
+    conn.execute("ANALYZE assessment_results")
+
+
+def migration_12_rebuild_rollups(conn):
+    """Roll the whole history up again on the next refresh
+
+    Migration 8 rebuilt assessment_results without its AUTOINCREMENT
+    counter, so when the newest results had been deleted, new results could
+    get ids at or below the rollup high-water mark and were never rolled up.
+    """
+    conn.execute("DELETE FROM assessment_rollups")
+    conn.execute("DELETE FROM rollup_dirty_patients")
+    conn.execute("UPDATE rollup_state SET high_water = 0 WHERE id = 1")
+
+
+# Ordered migration steps: (version, description, function)
+MIGRATIONS = [
+    (1, "Base schema", migration_1_base_schema),
+    (2, "Indexes for patient history, plans and exercises", migration_2_history_indexes),
+    (3, "Full-text index on patient names", migration_3_patient_name_search),
+    (4, "Cascading foreign keys", migration_4_cascading_foreign_keys),
+    (5, "Index on patient names", migration_5_patient_name_index),
+    (6, "Assessment summary table", migration_6_assessment_summary),
+    (7, "Time-bucketed assessment rollups", migration_7_assessment_rollups),
+    (8, "Integer epoch-millisecond dates", migration_8_epoch_millisecond_dates),
+    (9, "Structured JSON assessment details", migration_9_structured_details),
+    (10, "Indexed lookups in the summary triggers", migration_10_summary_trigger_lookups),
+    (11, "Case-insensitive index on assessment types", migration_11_case_insensitive_type_index),
+    (12, "Rebuild assessment rollups", migration_12_rebuild_rollups),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def migrate(conn, target_version=SCHEMA_VERSION):
+    """Bring the database up to target_version
+
+    Returns:
+        tuple: (version before, version after)
+    """
+    start_version = get_schema_version(conn)
+    if start_version >= target_version:
+        return start_version, start_version
+
+    # Table rebuilds must not fire cascades, so foreign key enforcement is
+    # switched off for the duration (it can't change inside a transaction)
+    foreign_keys = conn.execute("PRAGMA foreign_keys").fetchone()[0]
+    conn.execute("PRAGMA foreign_keys = OFF")
+    try:
+        for version, description, step in MIGRATIONS:
+            if version > target_version:
+                break
+            # BEGIN IMMEDIATE takes the write lock up front, then re-check the
+            # version in case another process migrated while we were waiting
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if get_schema_version(conn) >= version:
+                    conn.rollback()
+                    continue
+                print(f"Applying database migration {version}: {description}")
+                step(conn)
+                conn.execute(f"PRAGMA user_version = {version}")
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+    finally:
+        conn.execute(f"PRAGMA foreign_keys = {'ON' if foreign_keys else 'OFF'}")
+
+    return start_version, get_schema_version(conn)
+
+
+if __name__ == "__main__":
+    import sys
+    path = sys.argv[1] if len(sys.argv) > 1 else "neurowell.db"
+    connection = sqlite3.connect(path)
+    before, after = migrate(connection)
+    print(f"{path}: schema version {before} -> {after}")
+    connection.close()
@@ -0,0 +1,158 @@
+"""
+Online snapshots of the NeuroWell database.
+
+Month-end reports and large exports read a lot of rows. Run against the live
+database they compete with the assessment stations for it, and copying the
+file while the app is running can catch a transaction half written or miss
+everything still in the WAL. DatabaseSnapshot copies the database with
+SQLite's online backup API on a background thread, SNAPSHOT_PAGES pages per
+step with a short pause between steps, so writers keep committing while it
+runs.
+
+In WAL mode the whole copy runs inside one read transaction on the source.
+The snapshot is the database exactly as it was when the copy started, and
+writes committed meanwhile (which go to the WAL) never force it to start
+over. With the legacy rollback journal that read transaction would hold
+writers off for the whole copy, so each step reads on its own instead and
+SQLite restarts the copy whenever another connection commits.
+
+The copy is written next to the target and renamed over it once complete,
+in rollback journal mode so that it can be opened read-only, e.g. with
+DatabaseManager(path, read_only=True).
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import CancelledError, Future
+from pathlib import Path
+
+# Pages copied per backup step (1 MiB at SQLite's default 4 KiB page size)
+SNAPSHOT_PAGES = 256
+# Seconds slept between steps, letting writers take the database
+SNAPSHOT_PAUSE = 0.005
+# Give up on a rollback journal database after this many restarts
+SNAPSHOT_MAX_RESTARTS = 10
+# Seconds the source connection waits for a lock
+SNAPSHOT_TIMEOUT = 30
+
+# A completed snapshot: where it is, its size, and what it took
+SnapshotReport = namedtuple("SnapshotReport", ("path", "pages", "steps", "restarts", "seconds"))
+
+
+def take_snapshot(source, target, pages=SNAPSHOT_PAGES, pause=SNAPSHOT_PAUSE, progress=None,
+                  cancel_event=None):
+    """Copy a live database to target without blocking its writers
+
+    Args:
+        source: Database file to copy
+        target: Snapshot file to create or replace
+        pages: Pages copied per step
+        pause: Seconds slept between steps
+        progress: Optional progress(copied_pages, total_pages) callback
+        cancel_event: Optional threading.Event that stops the copy when set
+
+    Returns:
+        SnapshotReport: The snapshot path, its size in pages, the number of
+        steps and restarts, and the seconds taken
+
+    Raises:
+        CancelledError: If cancel_event was set
+        RuntimeError: If a rollback journal database kept changing under the copy
+    """
+    start = time.perf_counter()
+    target = Path(target)
+    partial = target.with_name(target.name + ".partial")
+    if partial.exists():
+        partial.unlink()
+
+    # Read-only, so a snapshot can never change the source by accident
+    src = sqlite3.connect(f"{Path(source).resolve().as_uri()}?mode=ro", uri=True, timeout=SNAPSHOT_TIMEOUT)
+    dst = sqlite3.connect(partial)
+    state = {"steps": 0, "restarts": 0, "remaining": None, "total": 0}
+
+    def step(status, remaining, total):
+        if state["remaining"] is not None and remaining > state["remaining"]:
+            state["restarts"] += 1
+            if state["restarts"] > SNAPSHOT_MAX_RESTARTS:
+                raise RuntimeError(f"Snapshot restarted {state['restarts']} times by concurrent writes")
+        state.update(steps=state["steps"] + 1, remaining=remaining, total=total)
+        if cancel_event is not None and cancel_event.is_set():
+            # Raising from the callback makes sqlite3 abandon the backup
+            raise CancelledError()
+        if progress:
+            progress(total - remaining, total)
+
+    try:
+        if src.execute("PRAGMA journal_mode").fetchone()[0].lower() == "wal":
+            src.execute("BEGIN")
+            src.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+        src.backup(dst, pages=pages, progress=step, sleep=pause)
+        # A rollback journal copy can be opened read-only without -wal and -shm files
+        dst.execute("PRAGMA journal_mode=DELETE")
+        dst.close()
+        os.replace(partial, target)
+    except BaseException:
+        dst.close()
+        partial.unlink(missing_ok=True)
+        raise
+    finally:
+        src.close()
+    return SnapshotReport(target, state["total"], state["steps"], state["restarts"],
+                          time.perf_counter() - start)
+
+
+class DatabaseSnapshot(threading.Thread):
+    """Background thread that takes one snapshot with take_snapshot()
+
+    The outcome is delivered on future: a SnapshotReport, or the exception
+    that stopped the copy. copied and total show how far it has got.
+    """
+
+    def __init__(self, source, target, pages=SNAPSHOT_PAGES, pause=SNAPSHOT_PAUSE, progress=None):
+        """Initialize the snapshot thread; call start() to begin copying
+
+        Args:
+            source: Database file to copy
+            target: Snapshot file to create or replace
+            pages: Pages copied per step
+            pause: Seconds slept between steps
+            progress: Optional progress(copied_pages, total_pages) callback,
+                called on the snapshot thread
+        """
+        super().__init__(daemon=True, name="DatabaseSnapshot")
+        self.source = source
+        self.target = Path(target)
+        self.pages = pages
+        self.pause = pause
+        self.callback = progress
+        self.copied = 0
+        self.total = 0
+        self.future = Future()
+        self._cancel = threading.Event()
+
+    def _progress(self, copied, total):
+        self.copied, self.total = copied, total
+        if self.callback:
+            self.callback(copied, total)
+
+    def run(self):
+        self.future.set_running_or_notify_cancel()
+        try:
+            report = take_snapshot(self.source, self.target, self.pages, self.pause, self._progress,
+                                   self._cancel)
+        except BaseException as e:
+            self.future.set_exception(e)
+        else:
+            self.copied = self.total = report.pages
+            self.future.set_result(report)
+
+    def cancel(self):
+        """Stop the copy after the current step; the target is left untouched"""
+        self._cancel.set()
+
+    def result(self, timeout=None):
+        """Wait for the snapshot and return its SnapshotReport"""
+        return self.future.result(timeout)
@@ -1,267 +1,789 @@
 import sqlite3
 import os
-import pandas as pd
+import math
+import atexit
+import itertools
+import json
+import threading
+import weakref
+from datetime import datetime, timezone
+from collections import namedtuple
 from pathlib import Path
+from db_migrations import migrate, iso_to_ms_sql, ms_to_iso_sql, SCHEMA_VERSION
+from db_writer import DatabaseWriter
+from db_snapshot import DatabaseSnapshot, SNAPSHOT_PAGES, SNAPSHOT_PAUSE
+from db_cache import QueryCache, cached, CACHE_SIZE
+
+# Number of prepared statements each connection keeps compiled
+STATEMENT_CACHE_SIZE = 256
+# Seconds a connection waits for a lock held by another thread before failing
+BUSY_TIMEOUT = 30
+
+# Connection settings profiles. WAL lets readers (HomeUI, ResultUI) keep
+# reading while a game thread writes, and synchronous=NORMAL only syncs the
+# WAL at checkpoints instead of on every commit. "legacy" is SQLite's default
+# rollback journal, kept for comparison and for network drives without WAL
+# support. cache_size is negative to mean KiB rather than pages.
+DB_PROFILES = {
+    "legacy": {
+        "journal_mode": "DELETE",
+        "synchronous": "FULL",
+        "mmap_size": 0,
+        "cache_size": -2000,
+        "temp_store": "DEFAULT",
+    },
+    "safe": {
+        "journal_mode": "WAL",
+        "synchronous": "FULL",
+        "mmap_size": 0,
+        "cache_size": -8000,
+        "temp_store": "MEMORY",
+        "wal_autocheckpoint": 1000,
+        "journal_size_limit": 64 * 1024 * 1024,
+    },
+    "balanced": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "mmap_size": 64 * 1024 * 1024,
+        "cache_size": -16000,
+        "temp_store": "MEMORY",
+        "wal_autocheckpoint": 1000,
+        "journal_size_limit": 64 * 1024 * 1024,
+    },
+    "performance": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "mmap_size": 256 * 1024 * 1024,
+        "cache_size": -64000,
+        "temp_store": "MEMORY",
+        "wal_autocheckpoint": 4000,
+        "journal_size_limit": 256 * 1024 * 1024,
+    },
+}
+# Profile used when none is given, overridable with NEUROWELL_DB_PROFILE
+DEFAULT_PROFILE = os.environ.get("NEUROWELL_DB_PROFILE", "balanced")
+
+# Maximum number of patients returned by a name search
+SEARCH_LIMIT = 100
+# The trigram index can only match search terms of at least this many characters
+TRIGRAM_MIN_LENGTH = 3
+
+# Lightweight immutable rows for hot UI paths. namedtuple classes carry no
+# per-instance __dict__, so a record costs little more than the sqlite3 row
+# tuple it is built from. Columns are listed explicitly because databases
+# migrated from older versions have them in a different physical order.
+PATIENT_COLUMNS = ("id", "name", "age", "gender", "speech_score", "emoji_score",
+                   "snake_score", "ball_score", "physio_score", "created_date",
+                   "last_assessment")
+ASSESSMENT_COLUMNS = ("id", "patient_id", "assessment_type", "score", "details",
+                      "assessment_date", "category", "details_json")
+PLAN_COLUMNS = ("id", "patient_id", "plan_name", "description", "created_date", "status")
+EXERCISE_COLUMNS = ("id", "plan_id", "exercise_name", "description", "frequency",
+                    "duration", "completed")
+
+# assessment_date and plans' created_date are stored as INTEGER milliseconds
+# since the Unix epoch (UTC). Reads return them as "YYYY-MM-DD HH:MM:SS" text
+# so records look the same as before; filters and ORDER BY use the integers.
+NOW_MS = iso_to_ms_sql("'now'")
+ASSESSMENT_SELECT = ", ".join(f"{ms_to_iso_sql(column)} AS {column}" if column == "assessment_date" else column
+                              for column in ASSESSMENT_COLUMNS)
+PLAN_SELECT = ", ".join(f"{ms_to_iso_sql(column)} AS {column}" if column == "created_date" else column
+                        for column in PLAN_COLUMNS)
+
+# Default number of patients per page in get_patients_page
+PAGE_SIZE = 100
+
+# Patient IDs per DELETE statement in delete_patients
+DELETE_CHUNK_SIZE = 500
+
+# UPDATE ... RETURNING needs SQLite 3.35 or newer
+HAS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+# A ":memory:" database is opened under a name unique to its manager, so all
+# of the manager's threads share it. The memdb VFS (SQLite 3.36 or newer)
+# locks like a file and honours the busy timeout; older versions fall back
+# to shared cache, whose table locks fail at once instead of waiting.
+HAS_MEMDB = sqlite3.sqlite_version_info >= (3, 36, 0)
+_memory_database_numbers = itertools.count(1)
+
+# patients columns that hold the latest score of each assessment type
+SCORE_COLUMNS = ("speech_score", "emoji_score", "snake_score", "ball_score", "physio_score")
+# Tables a score write changes, whose cached reads it invalidates
+SCORE_WRITE_TABLES = ("patients", "assessment_results")
+
+# Statistics of one patient's results for one assessment type, read from the
+# trigger-maintained assessment_summary table. trend is latest_score - mean.
+AssessmentSummary = namedtuple("AssessmentSummary", (
+    "patient_id", "assessment_type", "count", "mean", "stddev", "min_score",
+    "max_score", "latest_score", "latest_date", "trend"))
+
+# Time buckets of the assessment_rollups table and the SQL expression that
+# gives a result's bucket start date. Weeks start on Monday.
+ROLLUP_BUCKETS = {
+    "day": "date(assessment_date / 1000, 'unixepoch')",
+    "week": "date(assessment_date / 1000, 'unixepoch', 'weekday 0', '-6 days')",
+    "month": "date(assessment_date / 1000, 'unixepoch', 'start of month')",
+}
+# Category of a result, from the generated column over details_json
+ROLLUP_CATEGORY = "COALESCE(category, '')"
+
+# One value of a structured sub-score over time, see get_metric_history
+MetricValue = namedtuple("MetricValue", ("result_id", "assessment_date", "value"))
+
+# Per-bucket trend of one assessment type as numpy arrays ready to plot:
+# bucket start dates (datetime64[D]), mean, number of results, lowest, highest
+ScoreTrend = namedtuple("ScoreTrend", ("bucket", "mean", "count", "min_score", "max_score"))
+
+# One page of a patient listing: the records, the total number of patients
+# matching the filters, and the cursor to pass for the next page (None at the end)
+PatientPage = namedtuple("PatientPage", ("patients", "total", "next_cursor"))
+
+PatientRecord = namedtuple("PatientRecord", PATIENT_COLUMNS)
+AssessmentRecord = namedtuple("AssessmentRecord", ASSESSMENT_COLUMNS)
+PlanRecord = namedtuple("PlanRecord", PLAN_COLUMNS)
+ExerciseRecord = namedtuple("ExerciseRecord", EXERCISE_COLUMNS)
+
+# Site name of a manager's own database in federated results, see DatabaseManager(sites=...)
+LOCAL_SITE = "local"
+# Patients and results read across a federation, led by the name of their site
+SitePatientRecord = namedtuple("SitePatientRecord", ("site",) + PATIENT_COLUMNS)
+SiteAssessmentRecord = namedtuple("SiteAssessmentRecord", ("site",) + ASSESSMENT_COLUMNS)
+# Statistics of one assessment type over the patients of a site, or of every
+# site together when site is None
+SiteSummary = namedtuple("SiteSummary", (
+    "site", "assessment_type", "patients", "count", "mean", "stddev", "min_score", "max_score"))
+
+def _database_uri(path, read_only=False):
+    """file: URI of a database path, for mode=ro connections and ATTACH"""
+    uri = Path(path).resolve().as_uri()
+    return f"{uri}?mode=ro" if read_only else uri
+
+def _memory_database_uri():
+    """file: URI of a new named in-memory database that every connection to it shares"""
+    name = f"neurowell-{os.getpid()}-{next(_memory_database_numbers)}"
+    if HAS_MEMDB:
+        return f"file:/{name}?vfs=memdb"
+    return f"file:{name}?mode=memory&cache=shared"
+
+def _mean_stddev(count, total, total_squares):
+    """Mean and population standard deviation from running sums"""
+    mean = total / count
+    return mean, math.sqrt(max(total_squares / count - mean * mean, 0.0))
+
+def _score_trend(rows):
+    """ScoreTrend from (bucket, count, total, min_score, max_score) rows in bucket order"""
+    import numpy as np
+    buckets, counts, totals, min_scores, max_scores = zip(*rows) if rows else ((),) * 5
+    counts = np.array(counts, dtype=np.int64)
+    return ScoreTrend(np.array(buckets, dtype="datetime64[D]"),
+                      np.array(totals, dtype=np.float64) / np.maximum(counts, 1),
+                      counts,
+                      np.array(min_scores, dtype=np.float64),
+                      np.array(max_scores, dtype=np.float64))
+
+def to_epoch_ms(value):
+    """Convert a date to milliseconds since the Unix epoch, as stored in the date columns
+
+    Args:
+        value: datetime (naive values are taken as UTC), date (midnight UTC),
+            ISO 8601 string such as "2024-03-01" or "2024-03-01 14:30:00",
+            or an int that is already in milliseconds
+
+    Returns:
+        int: Milliseconds since 1970-01-01 00:00 UTC
+    """
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if not isinstance(value, datetime):
+        value = datetime(value.year, value.month, value.day)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp() * 1000)
+
+def _details_json(category=None, data=None):
+    """details_json text for a result, None if there is nothing structured to store
+
+    Args:
+        category: Optional subcategory, stored as "category"
+        data: Optional dict of further fields, e.g. {"scores": {"reach": 62},
+            "duration_s": 60.0, "frames": 1800}
+    """
+    fields = dict(data or {})
+    if category:
+        fields["category"] = category
+    return json.dumps(fields) if fields else None
+
+class _ThreadConnection:
+    """Holds one thread's connection; the connection closes when the holder is freed"""
+    __slots__ = ("conn", "__weakref__")
+    
+    def __init__(self, conn):
+        self.conn = conn
 
 class DatabaseManager:
-    """Class to manage all database operations for the NeuroWell application"""
+    """Class to manage all database operations for the NeuroWell application
+    
+    Each thread gets one long-lived connection, created on first use and
+    reused by every method called from that thread. Connections are closed
+    when their thread exits, by close_thread_connection(), or by close() at
+    interpreter shutdown.
+    
+    Reads come in two flavours: get_* methods return pandas DataFrames for
+    analytics, fetch_* methods return lists of namedtuple records (and
+    patient_columns() plain column lists) without importing pandas.
     
-    def __init__(self, db_path="neurowell.db"):
-        """Initialize the database manager with the database path"""
+    Frequently repeated reads go through a QueryCache (see db_cache) that
+    every write made through the manager invalidates.
+    
+    A read-only manager (e.g. over a snapshot, see start_snapshot) opens its
+    connections with mode=ro. Its writes fail and report the error like any
+    other failed write.
+    
+    Given the databases of other sites, the manager federates them: every
+    connection attaches them read-only, and the *_all_sites methods read all
+    sites at once. Everything else, writes included, only uses db_path.
+    """
+    
+    def __init__(self, db_path="neurowell.db", profile=None, cache_size=CACHE_SIZE, read_only=False,
+                 site=LOCAL_SITE, sites=None):
+        """Initialize the database manager
+        
+        Args:
+            db_path: Path to the SQLite database file
+            profile: Name of a DB_PROFILES entry, defaults to DEFAULT_PROFILE
+            cache_size: Query results kept by the read cache, 0 to disable it
+            read_only: Open an existing database without migrating or writing to it
+            site: Name of this database's site in federated results
+            sites: Optional dict of other site names to their database files,
+                attached read-only (at most 9 with SQLite's default limits)
+        """
         self.db_path = Path(db_path)
-        self.ensure_db_exists()
-        self.ensure_tables_exist()
+        self.read_only = read_only
+        # An in-memory database lives until close(), held open by the anchor connection
+        self._memory_uri = None
+        self._memory_anchor = None
+        if str(db_path) == ":memory:":
+            if read_only:
+                raise ValueError("An in-memory database can't be opened read-only")
+            self._memory_uri = _memory_database_uri()
+            self._memory_anchor = sqlite3.connect(self._memory_uri, uri=True, check_same_thread=False)
+        self.site = site
+        self.sites = {name: Path(path) for name, path in (sites or {}).items()}
+        if site in self.sites:
+            raise ValueError(f"Site {site} is both the local database and an attached one")
+        missing = [str(path) for path in self.sites.values() if not path.exists()]
+        if missing:
+            raise FileNotFoundError(f"Site databases not found: {', '.join(missing)}")
+        # Schema each site's database is known by on this manager's connections
+        self._site_schemas = [(site, "main")] + [(name, f"site_{number}")
+                                                  for number, name in enumerate(self.sites, 1)]
+        self.profile = profile or DEFAULT_PROFILE
+        if self.profile not in DB_PROFILES:
+            raise ValueError(f"Unknown database profile: {self.profile}")
+        self._local = threading.local()
+        self._connections = weakref.WeakSet()
+        self._connections_lock = threading.Lock()
+        self._has_name_index = {}
+        self._writer = None
+        self.cache = QueryCache(cache_size)
+        self.ensure_schema()
+        atexit.register(self.close)
     
-    def ensure_db_exists(self):
-        """Ensure the database exists, create it if it doesn't"""
-        if not self.db_path.exists():
-            # Try to create the database using the create_database module
-            try:
-                from create_database import create_database
-                create_database()
-            except (ImportError, Exception) as e:
-                print(f"Error creating database: {e}")
-                self._create_minimal_db()
-    
-    def ensure_tables_exist(self):
-        """Check if all required tables exist and create them if they don't"""
+    def ensure_schema(self):
+        """Create or migrate the database schema to the current version
+        
+        For an up-to-date database this is a single PRAGMA user_version read.
+        A brand-new database file is also seeded with the sample patients, as
+        is an in-memory database, which every thread of the manager shares.
+        A read-only database is only checked, and a warning printed if it is
+        at an older version. So are the databases of attached sites.
+        """
+        # Checked before the first connection, which creates the file
+        is_new = self._memory_uri is not None or not self.db_path.exists()
         conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        # Get list of existing tables
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-        tables = [table[0] for table in cursor.fetchall()]
-        
-        print(f"Existing tables in database: {tables}")
-        
-        # Check if patients table exists
-        if 'patients' not in tables:
-            print("Creating missing patients table")
-            cursor.execute('''
-            CREATE TABLE IF NOT EXISTS patients (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                age INTEGER,
-                gender TEXT,
-                speech_score REAL,
-                emoji_score REAL,
-                snake_score REAL,
-                ball_score REAL,
-                physio_score REAL
-            )
-            ''')
+        for name, schema in self._site_schemas[1:]:
+            version = conn.execute(f"PRAGMA {schema}.user_version").fetchone()[0]
+            if version < SCHEMA_VERSION:
+                print(f"Warning: database of site {name} is at schema version {version}, "
+                      f"not {SCHEMA_VERSION}")
+        if self.read_only:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version < SCHEMA_VERSION:
+                print(f"Warning: read-only database {self.db_path} is at schema version {version}, "
+                      f"not {SCHEMA_VERSION}")
+            return
+        before, after = migrate(conn)
+        if is_new:
+            try:
+                from create_database import seed_sample_data
+                seed_sample_data(conn)
+            except Exception as e:
+                print(f"Error seeding new database: {e}")
+        elif before != after:
+            print(f"Database schema migrated from version {before} to {after}")
+    
+    def _open_connection(self):
+        """Open and configure a new connection for the calling thread"""
+        # check_same_thread is off only so close() can shut down other
+        # threads' connections; each connection is still used by one thread
+        if self._memory_uri or self.read_only or self.sites:
+            # A URI filename also lets ATTACH open the other sites with mode=ro
+            conn = sqlite3.connect(self._memory_uri or _database_uri(self.db_path, self.read_only), uri=True,
+                                   timeout=BUSY_TIMEOUT, check_same_thread=False,
+                                   cached_statements=STATEMENT_CACHE_SIZE)
         else:
-            # Check if physio_score column exists
-            cursor.execute("PRAGMA table_info(patients)")
-            columns = [column[1] for column in cursor.fetchall()]
-            
-            if 'physio_score' not in columns:
-                print("Adding missing physio_score column to patients table")
-                try:
-                    cursor.execute("ALTER TABLE patients ADD COLUMN physio_score REAL DEFAULT 0")
-                    conn.commit()
-                    print("Successfully added physio_score column")
-                except Exception as e:
-                    print(f"Error adding physio_score column: {e}")
-        
-        # Check if assessment_results table exists
-        if 'assessment_results' not in tables:
-            print("Creating missing assessment_results table")
-            cursor.execute('''
-            CREATE TABLE IF NOT EXISTS assessment_results (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                patient_id INTEGER,
-                assessment_type TEXT,
-                score REAL,
-                details TEXT,
-                assessment_date TEXT,
-                FOREIGN KEY (patient_id) REFERENCES patients (id)
-            )
-            ''')
-        
-        # Check if rehabilitation_plans table exists
-        if 'rehabilitation_plans' not in tables:
-            print("Creating missing rehabilitation_plans table")
-            cursor.execute('''
-            CREATE TABLE IF NOT EXISTS rehabilitation_plans (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                patient_id INTEGER,
-                plan_name TEXT,
-                description TEXT,
-                created_date TEXT,
-                status TEXT,
-                FOREIGN KEY (patient_id) REFERENCES patients (id)
-            )
-            ''')
-        
-        # Check if exercises table exists
-        if 'exercises' not in tables:
-            print("Creating missing exercises table")
-            cursor.execute('''
-            CREATE TABLE IF NOT EXISTS exercises (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                plan_id INTEGER,
-                exercise_name TEXT,
-                description TEXT,
-                frequency TEXT,
-                duration TEXT,
-                completed INTEGER,
-                FOREIGN KEY (plan_id) REFERENCES rehabilitation_plans (id)
-            )
-            ''')
-        
-        conn.commit()
-        conn.close()
-    
-    def _create_minimal_db(self):
-        """Create a minimal database with just the essential tables"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Create patients table
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS patients (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            age INTEGER,
-            gender TEXT,
-            speech_score REAL,
-            emoji_score REAL,
-            snake_score REAL,
-            ball_score REAL,
-            physio_score REAL
-        )
-        ''')
-        
-        # Create assessment_results table
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS assessment_results (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            patient_id INTEGER,
-            assessment_type TEXT,
-            score REAL,
-            details TEXT,
-            assessment_date TEXT,
-            FOREIGN KEY (patient_id) REFERENCES patients (id)
-        )
-        ''')
-        
-        # Add a sample patient
-        cursor.execute('''
-        INSERT INTO patients 
-        (name, age, gender, speech_score, emoji_score, snake_score, ball_score, physio_score)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', ('Sample Patient', 65, 'Male', 0, 0, 0, 0, 0))
-        
-        conn.commit()
-        conn.close()
+            conn = sqlite3.connect(self.db_path, timeout=BUSY_TIMEOUT,
+                                   check_same_thread=False,
+                                   cached_statements=STATEMENT_CACHE_SIZE)
+        self._apply_profile(conn)
+        # Attached after the profile so its journal_mode leaves the other sites alone
+        for name, schema in self._site_schemas[1:]:
+            conn.execute(f"ATTACH DATABASE ? AS {schema}", (_database_uri(self.sites[name], read_only=True),))
+        return conn
+    
+    def _apply_profile(self, conn):
+        """Apply the settings profile's pragmas to a new connection"""
+        settings = DB_PROFILES[self.profile]
+        # journal_mode is stored in the database file, the rest are per connection.
+        # An in-memory database always keeps its journal in memory.
+        if not self.read_only and self._memory_uri is None:
+            journal_mode = conn.execute(f"PRAGMA journal_mode={settings['journal_mode']}").fetchone()[0]
+            if journal_mode.upper() != settings["journal_mode"]:
+                print(f"Warning: could not set journal_mode={settings['journal_mode']}, using {journal_mode}")
+        for pragma in ("synchronous", "mmap_size", "cache_size", "temp_store",
+                       "wal_autocheckpoint", "journal_size_limit"):
+            if pragma in settings:
+                conn.execute(f"PRAGMA {pragma}={settings[pragma]}")
+        # SQLite leaves foreign keys unenforced unless asked, in every profile
+        conn.execute("PRAGMA foreign_keys=ON")
     
+    def checkpoint(self, mode="PASSIVE"):
+        """Copy WAL content back into the database file
+        
+        SQLite already runs PASSIVE checkpoints automatically every
+        wal_autocheckpoint pages. TRUNCATE also resets the WAL file and is
+        used at shutdown. It waits for readers, so don't call it from the GUI
+        thread during a session.
+        
+        Returns:
+            tuple: (busy, wal_pages, checkpointed_pages) as reported by SQLite
+        """
+        if mode not in ("PASSIVE", "FULL", "RESTART", "TRUNCATE"):
+            raise ValueError(f"Invalid checkpoint mode: {mode}")
+        return self.get_connection().execute(f"PRAGMA wal_checkpoint({mode})").fetchone()
+
+    def start_snapshot(self, target, pages=SNAPSHOT_PAGES, pause=SNAPSHOT_PAUSE, progress=None):
+        """Start copying the database to target on a background thread
+
+        Writers carry on while the copy runs (see db_snapshot). Queued writes
+        are committed and the rollups brought up to date first, so the
+        snapshot includes everything recorded so far. Open the finished
+        snapshot with DatabaseManager(target, read_only=True) to run reports
+        and exports against it.
+
+        Args:
+            target: Snapshot file to create or replace
+            pages: Pages copied per step
+            pause: Seconds slept between steps
+            progress: Optional progress(copied_pages, total_pages) callback,
+                called on the snapshot thread
+
+        Returns:
+            DatabaseSnapshot: The running thread; result() waits for its SnapshotReport
+        """
+        if self._memory_uri:
+            raise ValueError("An in-memory database can't be snapshotted")
+        if not self.read_only:
+            if self._writer is not None:
+                self._writer.flush()
+            self.refresh_rollups()
+        snapshot = DatabaseSnapshot(self.db_path, target, pages, pause, progress)
+        snapshot.start()
+        return snapshot
+
     def get_connection(self):
-        """Get a database connection"""
-        return sqlite3.connect(self.db_path)
+        """Get the calling thread's database connection, opening it on first use"""
+        holder = getattr(self._local, "holder", None)
+        if holder is None:
+            # The thread-local holder is freed when the thread exits, which
+            # drops it from the registry and closes the connection with it
+            holder = _ThreadConnection(self._open_connection())
+            self._local.holder = holder
+            with self._connections_lock:
+                self._connections.add(holder)
+        return holder.conn
+    
+    def close_thread_connection(self):
+        """Close the calling thread's connection (e.g. when a worker thread finishes)"""
+        holder = getattr(self._local, "holder", None)
+        if holder is not None:
+            self._local.holder = None
+            with self._connections_lock:
+                self._connections.discard(holder)
+            holder.conn.close()
+    
+    def close(self):
+        """Close every open connection; registered to run at interpreter shutdown"""
+        # Let queued writes commit before the connections go away
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        with self._connections_lock:
+            holders = list(self._connections)
+            self._connections.clear()
+        # Refresh query planner statistics for tables whose shape changed
+        if holders and not self.read_only:
+            try:
+                holders[0].conn.execute("PRAGMA main.optimize")
+            except Exception as e:
+                print(f"Error optimizing database: {e}")
+        # Fold the WAL back into the database file so it is left self-contained
+        if holders and not self.read_only and DB_PROFILES[self.profile]["journal_mode"] == "WAL":
+            try:
+                holders[0].conn.execute("PRAGMA main.wal_checkpoint(TRUNCATE)")
+            except Exception as e:
+                print(f"Error checkpointing database: {e}")
+        for holder in holders:
+            try:
+                holder.conn.close()
+            except Exception as e:
+                print(f"Error closing database connection: {e}")
+        self._local = threading.local()
+        # Closing the last connection to an in-memory database discards it
+        if self._memory_anchor is not None:
+            self._memory_anchor.close()
+            self._memory_anchor = None
+    
+    def invalidate_cache(self, tables=None):
+        """Drop cached reads of the given tables, or all of them
+        
+        Writes made through this manager do this automatically. Call it after
+        changing the database some other way, e.g. with raw SQL.
+        """
+        if tables is None:
+            self.cache.clear()
+        else:
+            self.cache.bump(tables)
+    
+    def cache_stats(self):
+        """Read cache hits, misses, hit rate, stale entries, evictions and size"""
+        return self.cache.stats()
+    
+    def _fetch(self, record_type, query, params=()):
+        """Run a query and wrap each row in record_type"""
+        rows = self.get_connection().execute(query, params).fetchall()
+        return list(map(record_type._make, rows))
+    
+    @cached("patients")
+    def fetch_patients(self):
+        """Get all patients as a list of PatientRecord"""
+        return self._fetch(PatientRecord, f"SELECT {', '.join(PATIENT_COLUMNS)} FROM patients")
+    
+    @cached("patients")
+    def fetch_patient(self, patient_id):
+        """Get a specific patient by ID as a PatientRecord, or None"""
+        row = self.get_connection().execute(
+            f"SELECT {', '.join(PATIENT_COLUMNS)} FROM patients WHERE id = ?",
+            (patient_id,)).fetchone()
+        return PatientRecord._make(row) if row is not None else None
+    
+    @cached("patients")
+    def search_patients(self, name, limit=SEARCH_LIMIT):
+        """Get patients whose name contains the given text as PatientRecords, best matches first"""
+        columns = ", ".join(f"p.{column}" for column in PATIENT_COLUMNS)
+        query, params = self._name_search_query(name, limit, columns)
+        return self._fetch(PatientRecord, query, params)
     
+    def patient_columns(self, columns=PATIENT_COLUMNS):
+        """Get whole patient columns as plain lists, e.g. for charts or counts
+        
+        Args:
+            columns: Names from PATIENT_COLUMNS to read
+        
+        Returns:
+            dict: Column name -> list of values, all in the same patient order
+        """
+        unknown = [column for column in columns if column not in PATIENT_COLUMNS]
+        if unknown:
+            raise ValueError(f"Unknown patient columns: {unknown}")
+        rows = self.get_connection().execute(
+            f"SELECT {', '.join(columns)} FROM patients ORDER BY id").fetchall()
+        values = list(zip(*rows)) if rows else [()] * len(columns)
+        return {column: list(column_values) for column, column_values in zip(columns, values)}
+    
+    def _patient_filters(self, gender=None, min_age=None, max_age=None, min_scores=None):
+        """WHERE conditions and parameters for the patient listing filters"""
+        conditions = []
+        params = []
+        if gender is not None:
+            conditions.append("gender = ?")
+            params.append(gender)
+        if min_age is not None:
+            conditions.append("age >= ?")
+            params.append(min_age)
+        if max_age is not None:
+            conditions.append("age <= ?")
+            params.append(max_age)
+        for column, threshold in (min_scores or {}).items():
+            if column not in SCORE_COLUMNS:
+                raise ValueError(f"Unknown score column: {column}")
+            conditions.append(f"{column} >= ?")
+            params.append(threshold)
+        return conditions, params
+    
+    @cached("patients")
+    def get_patients_page(self, cursor=None, limit=PAGE_SIZE, order_by="name", gender=None,
+                          min_age=None, max_age=None, min_scores=None, with_total=True):
+        """Get one page of patients using keyset pagination
+    
+        Each page continues after the last row of the previous one, so reading
+        page 500 costs the same as page 1, unlike LIMIT/OFFSET.
+    
+        Args:
+            cursor: next_cursor of the previous page, or None for the first page
+            limit: Maximum number of patients on the page
+            order_by: "name" to order by (name, id), or "id"
+            gender: Only patients with this gender
+            min_age: Only patients at least this old
+            max_age: Only patients at most this old
+            min_scores: Dict of score column -> minimum score, e.g. {"ball_score": 50}
+            with_total: Also count all matching patients (skip it for later pages)
+    
+        Returns:
+            PatientPage: (patients, total, next_cursor); total is None if not requested
+        """
+        if order_by not in ("name", "id"):
+            raise ValueError(f"Invalid order: {order_by}")
+        conditions, params = self._patient_filters(gender, min_age, max_age, min_scores)
+        conn = self.get_connection()
+    
+        total = None
+        if with_total:
+            where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+            total = conn.execute(f"SELECT COUNT(*) FROM patients {where}", params).fetchone()[0]
+    
+        if cursor is not None:
+            if order_by == "name":
+                conditions.append("(name, id) > (?, ?)")
+                params.extend(cursor)
+            else:
+                conditions.append("id > ?")
+                params.append(cursor)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        order = "name, id" if order_by == "name" else "id"
+        patients = self._fetch(PatientRecord, f"""
+        SELECT {', '.join(PATIENT_COLUMNS)} FROM patients
+        {where}
+        ORDER BY {order}
+        LIMIT ?
+        """, params + [limit])
+    
+        next_cursor = None
+        if len(patients) == limit:
+            last = patients[-1]
+            next_cursor = (last.name, last.id) if order_by == "name" else last.id
+        return PatientPage(patients, total, next_cursor)
+    
+    def iter_patients(self, page_size=1000, order_by="id", **filters):
+        """Iterate over all matching patients one page at a time"""
+        cursor = None
+        while True:
+            page = self.get_patients_page(cursor, page_size, order_by, with_total=False, **filters)
+            yield from page.patients
+            if page.next_cursor is None:
+                return
+            cursor = page.next_cursor
+    
+    @cached("patients")
     def get_all_patients(self):
         """Get all patients from the database as a pandas DataFrame"""
+        import pandas as pd
         conn = self.get_connection()
         query = "SELECT * FROM patients"
         df = pd.read_sql_query(query, conn)
-        conn.close()
         return df
     
+    @cached("patients")
     def get_patient_by_id(self, patient_id):
-        """Get a specific patient by ID"""
-        conn = self.get_connection()
-        query = "SELECT * FROM patients WHERE id = ?"
-        df = pd.read_sql_query(query, conn, params=(patient_id,))
-        conn.close()
-        return df.iloc[0] if not df.empty else None
+        """Get a specific patient by ID as a pandas Series"""
+        import pandas as pd
+        record = self.fetch_patient(patient_id)
+        return pd.Series(record._asdict()) if record is not None else None
+    
+    def has_name_index(self, schema="main"):
+        """Check whether the full-text patient name index exists (in an attached site's schema)"""
+        if schema not in self._has_name_index:
+            row = self.get_connection().execute(
+                f"SELECT 1 FROM {schema}.sqlite_master WHERE type = 'table' AND name = 'patients_fts'").fetchone()
+            self._has_name_index[schema] = row is not None
+        return self._has_name_index[schema]
     
-    def get_patient_by_name(self, name):
-        """Get a patient by name (approximate match)"""
+    def _name_search_query(self, name, limit, columns="p.*", schema="main"):
+        """SQL and parameters for a ranked patient name search
+        
+        Exact (case-insensitive) name matches come first, then the FTS5 bm25
+        rank. Terms too short for the trigram index fall back to LIKE.
+        """
+        if self.has_name_index(schema) and len(name.strip()) >= TRIGRAM_MIN_LENGTH:
+            # Quote the term so FTS5 treats it as one literal substring
+            match = '"' + name.strip().replace('"', '""') + '"'
+            query = f"""
+            SELECT {columns} FROM {schema}.patients_fts f
+            JOIN {schema}.patients p ON p.id = f.rowid
+            WHERE f.patients_fts MATCH ?
+            ORDER BY (p.name = ? COLLATE NOCASE) DESC, f.rank
+            LIMIT ?
+            """
+            return query, (match, name.strip(), limit)
+        query = f"""
+        SELECT {columns} FROM {schema}.patients p
+        WHERE p.name LIKE ?
+        ORDER BY (p.name = ? COLLATE NOCASE) DESC, p.name
+        LIMIT ?
+        """
+        return query, (f"%{name.strip()}%", name.strip(), limit)
+    
+    @cached("patients")
+    def get_patient_by_name(self, name, limit=SEARCH_LIMIT):
+        """Get patients whose name contains the given text, best matches first
+        
+        Args:
+            name: Text to look for anywhere in the name (case-insensitive)
+            limit: Maximum number of patients to return
+        """
+        import pandas as pd
         conn = self.get_connection()
-        query = "SELECT * FROM patients WHERE name LIKE ?"
-        df = pd.read_sql_query(query, conn, params=(f"%{name}%",))
-        conn.close()
+        query, params = self._name_search_query(name, limit)
+        df = pd.read_sql_query(query, conn, params=params)
         return df
     
     def add_patient(self, name, age, gender):
         """Add a new patient"""
         conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("""
-        INSERT INTO patients 
-        (name, age, gender, speech_score, emoji_score, snake_score, ball_score)
-        VALUES (?, ?, ?, 0, 0, 0, 0)
-        """, (name, age, gender))
-        patient_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
-        return patient_id
-    
-    def update_assessment_score(self, patient_id, assessment_type, score):
-        """Update a patient's assessment score"""
+        with conn:
+            cursor = conn.execute("""
+            INSERT INTO patients 
+            (name, age, gender, speech_score, emoji_score, snake_score, ball_score)
+            VALUES (?, ?, ?, 0, 0, 0, 0)
+            """, (name, age, gender))
+        self.cache.bump(("patients",))
+        return cursor.lastrowid
+    
+    def _score_column(self, assessment_type):
+        """patients column holding the latest score of an assessment type"""
+        score_column = f"{assessment_type.lower()}_score"
+        if score_column not in SCORE_COLUMNS:
+            raise ValueError(f"Invalid assessment type: {assessment_type}")
+        return score_column
+    
+    def _record_assessment_score(self, conn, patient_id, assessment_type, score, data=None):
+        """Set a patient's score and add it to the assessment history, without committing
+        
+        Returns:
+            bool: False if the patient doesn't exist
+        """
+        score_column = self._score_column(assessment_type)
+        query = f"UPDATE patients SET {score_column} = ? WHERE id = ?"
+        if HAS_RETURNING:
+            # RETURNING tells us whether the patient exists without a separate SELECT
+            exists = conn.execute(query + " RETURNING id", (score, patient_id)).fetchone() is not None
+        else:
+            exists = conn.execute(query, (score, patient_id)).rowcount > 0
+        if not exists:
+            print(f"ERROR: Patient with ID {patient_id} not found in database")
+            return False
+        conn.execute(f"""
+        INSERT INTO assessment_results 
+        (patient_id, assessment_type, score, details, details_json, assessment_date)
+        VALUES (?, ?, ?, ?, ?, {NOW_MS})
+        """, (patient_id, assessment_type, score, f"Assessment on {assessment_type}",
+              _details_json(data=data)))
+        return True
+    
+    def _record_assessment_scores_bulk(self, conn, records):
+        """Apply many (patient_id, assessment_type, score[, details[, data]]) records, without committing
+        
+        Returns:
+            int: Number of records stored; records for unknown patients are skipped
+        """
+        updates = {}
+        history = []
+        for record in records:
+            patient_id, assessment_type, score = record[:3]
+            details = record[3] if len(record) > 3 and record[3] is not None else f"Assessment on {assessment_type}"
+            data = record[4] if len(record) > 4 else None
+            updates.setdefault(self._score_column(assessment_type), []).append((score, patient_id))
+            history.append((patient_id, assessment_type, score, details, _details_json(data=data), patient_id))
+        
+        # One UPDATE statement per score column; executemany applies the rows
+        # in order, so the last score for a patient wins
+        for score_column, params in updates.items():
+            conn.executemany(f"UPDATE patients SET {score_column} = ? WHERE id = ?", params)
+        cursor = conn.executemany(f"""
+        INSERT INTO assessment_results 
+        (patient_id, assessment_type, score, details, details_json, assessment_date)
+        SELECT ?, ?, ?, ?, ?, {NOW_MS}
+        WHERE EXISTS (SELECT 1 FROM patients WHERE id = ?)
+        """, history)
+        return cursor.rowcount
+    
+    def _record_detailed_assessment(self, conn, patient_id, assessment_type, score, details,
+                                    category=None, data=None):
+        """Add a detailed assessment record, without committing"""
+        conn.execute(f"""
+        INSERT INTO assessment_results 
+        (patient_id, assessment_type, score, details, details_json, assessment_date)
+        VALUES (?, ?, ?, ?, ?, {NOW_MS})
+        """, (patient_id, assessment_type, score, details, _details_json(category, data)))
+        return True
+    
+    def update_assessment_score(self, patient_id, assessment_type, score, data=None):
+        """Update a patient's assessment score and record it in the history
+        
+        Args:
+            patient_id: The ID of the patient
+            assessment_type: The type of assessment (e.g., 'Snake', 'Physio')
+            score: The new score
+            data: Optional dict stored in details_json, e.g. sub-scores,
+                duration_s and frames of the session
+        
+        Returns:
+            bool: True if saved, False if the patient doesn't exist or the write failed
+        """
         try:
-            print(f"Inside db update_assessment_score - Patient ID: {patient_id}, Type: {assessment_type}, Score: {score}")
-            score_column = f"{assessment_type.lower()}_score"
-            valid_columns = ["speech_score", "emoji_score", "snake_score", "ball_score", "physio_score"]
-            
-            if score_column not in valid_columns:
-                print(f"ERROR: Invalid assessment type: {assessment_type}")
-                raise ValueError(f"Invalid assessment type: {assessment_type}")
-            
             conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            # Check if patient exists
-            cursor.execute("SELECT id FROM patients WHERE id = ?", (patient_id,))
-            patient_exists = cursor.fetchone()
-            if not patient_exists:
-                print(f"ERROR: Patient with ID {patient_id} not found in database")
-                conn.close()
-                return False
-                
-            # Update the main score in patients table
-            print(f"Updating {score_column} column with value {score} for patient ID {patient_id}")
-            query = f"UPDATE patients SET {score_column} = ? WHERE id = ?"
-            cursor.execute(query, (score, patient_id))
-            
-            # Verify the update was successful
-            rows_affected = cursor.rowcount
-            print(f"Rows affected by update: {rows_affected}")
-            
-            if rows_affected == 0:
-                print(f"WARNING: No rows were updated in the patients table")
-            
-            # Also record the assessment details
-            print(f"Recording assessment details in assessment_results table")
-            cursor.execute("""
-            INSERT INTO assessment_results 
-            (patient_id, assessment_type, score, details, assessment_date)
-            VALUES (?, ?, ?, ?, datetime('now'))
-            """, (patient_id, assessment_type, score, f"Assessment on {assessment_type}"))
-            
-            # Commit the transaction
-            conn.commit()
-            print(f"Database changes committed successfully")
-            
-            # Verify that the score was updated
-            verify_query = f"SELECT {score_column} FROM patients WHERE id = ?"
-            cursor.execute(verify_query, (patient_id,))
-            updated_score = cursor.fetchone()
-            print(f"Verification - Updated score: {updated_score}")
-            
-            conn.close()
-            return True
+            with conn:
+                saved = self._record_assessment_score(conn, patient_id, assessment_type, score, data)
+            self.cache.bump(SCORE_WRITE_TABLES)
+            return saved
         except Exception as e:
             print(f"ERROR in update_assessment_score: {str(e)}")
-            import traceback
-            traceback.print_exc()
-            if 'conn' in locals():
-                conn.rollback()
-                conn.close()
             return False
     
-    def update_detailed_assessment(self, patient_id, assessment_type, score, details, category=None):
+    def update_assessment_scores_bulk(self, records):
+        """Record many assessment scores in one transaction
+        
+        Args:
+            records: Iterable of (patient_id, assessment_type, score) tuples,
+                optionally followed by details text and a details_json dict
+        
+        Returns:
+            int: Number of records stored, or 0 if the transaction failed
+        """
+        try:
+            conn = self.get_connection()
+            with conn:
+                saved = self._record_assessment_scores_bulk(conn, records)
+            self.cache.bump(SCORE_WRITE_TABLES)
+            return saved
+        except Exception as e:
+            print(f"ERROR in update_assessment_scores_bulk: {str(e)}")
+            return 0
+    
+    def update_detailed_assessment(self, patient_id, assessment_type, score, details, category=None,
+                                   data=None):
         """Add a detailed assessment record for a patient
         
         Args:
@@ -270,114 +792,527 @@ class DatabaseManager:
             score: The numerical score for this specific assessment
             details: Additional details about this assessment
             category: Optional subcategory for the assessment
+            data: Optional dict of further structured fields for details_json
         """
         try:
             conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            # Add category to details if provided
-            full_details = details
-            if category:
-                full_details = f"[{category}] {details}"
+            with conn:
+                saved = self._record_detailed_assessment(
+                    conn, patient_id, assessment_type, score, details, category, data)
+            self.cache.bump(("assessment_results",))
+            return saved
+        except Exception as e:
+            print(f"Error adding detailed assessment: {str(e)}")
+            return False
+    
+    @property
+    def writer(self):
+        """The background DatabaseWriter, started on first use"""
+        with self._connections_lock:
+            if self._writer is None or not self._writer.is_alive():
+                self._writer = DatabaseWriter(self)
+                self._writer.start()
+            return self._writer
+    
+    def submit_assessment_score(self, patient_id, assessment_type, score, data=None):
+        """Queue update_assessment_score on the writer thread without blocking
+        
+        Returns:
+            Future: Resolves to True once committed, False if the patient doesn't exist
+        """
+        return self.writer.submit(self._record_assessment_score, patient_id, assessment_type, score,
+                                  data, tables=SCORE_WRITE_TABLES)
+    
+    def submit_assessment_scores_bulk(self, records):
+        """Queue update_assessment_scores_bulk on the writer thread without blocking
+        
+        Returns:
+            Future: Resolves to the number of records stored once committed
+        """
+        return self.writer.submit(self._record_assessment_scores_bulk, list(records),
+                                  tables=SCORE_WRITE_TABLES)
+    
+    def submit_detailed_assessment(self, patient_id, assessment_type, score, details, category=None,
+                                   data=None):
+        """Queue update_detailed_assessment on the writer thread without blocking
+        
+        Returns:
+            Future: Resolves to True once committed
+        """
+        return self.writer.submit(self._record_detailed_assessment, patient_id,
+                                  assessment_type, score, details, category, data,
+                                  tables=("assessment_results",))
+    
+    def _assessment_history_query(self, patient_id, assessment_type, category=None, columns=ASSESSMENT_SELECT,
+                                  order="DESC"):
+        # (patient_id, category, assessment_date) and (patient_id,
+        # assessment_type, assessment_date) are both indexed
+        conditions = "patient_id = ?"
+        params = (patient_id,)
+        if category:
+            conditions += " AND category = ?"
+            params += (category,)
+        if assessment_type:
+            conditions += " AND assessment_type = ?"
+            params += (assessment_type,)
+        query = f"""
+        SELECT {columns} FROM assessment_results 
+        WHERE {conditions}
+        ORDER BY assessment_date {order}
+        """
+        return query, params
+    
+    @cached("assessment_results")
+    def fetch_assessment_history(self, patient_id, assessment_type=None, category=None):
+        """Get assessment history for a patient as AssessmentRecords, newest first
+        
+        category limits the history to one details_json category, e.g. the
+        "Balance" results of a physio assessment.
+        """
+        query, params = self._assessment_history_query(patient_id, assessment_type, category)
+        return self._fetch(AssessmentRecord, query, params)
+    
+    @cached("assessment_results")
+    def get_assessments_between(self, patient_id, start, end, assessment_type=None):
+        """Get a patient's results in a date range as AssessmentRecords, oldest first
+        
+        The range is a single index range scan on (patient_id, assessment_date),
+        or on (patient_id, assessment_type, assessment_date) for one type.
+        
+        Args:
+            patient_id: ID of the patient
+            start: First instant included; anything to_epoch_ms() accepts
+            end: First instant excluded, e.g. the day after the last day wanted
+            assessment_type: Only results of this type (exact match)
             
-            # Record the assessment details
-            cursor.execute("""
-            INSERT INTO assessment_results 
-            (patient_id, assessment_type, score, details, assessment_date)
-            VALUES (?, ?, ?, ?, datetime('now'))
-            """, (patient_id, assessment_type, score, full_details))
+        Returns:
+            list: AssessmentRecords ordered by date
+        """
+        query = f"SELECT {ASSESSMENT_SELECT} FROM assessment_results WHERE patient_id = ?"
+        params = (patient_id,)
+        if assessment_type:
+            query += " AND assessment_type = ?"
+            params += (assessment_type,)
+        query += " AND assessment_date >= ? AND assessment_date < ? ORDER BY assessment_date, id"
+        params += (to_epoch_ms(start), to_epoch_ms(end))
+        return self._fetch(AssessmentRecord, query, params)
+    
+    @cached("assessment_results")
+    def get_metric_history(self, patient_id, assessment_type, metric, category=None):
+        """Get one sub-score stored under "scores" in details_json, oldest first
+        
+        The patient's results of the type (or category) are found through
+        their index, and the metric is read from each of them.
+        
+        Args:
+            patient_id: ID of the patient
+            assessment_type: Assessment type whose results carry the metric
+            metric: Key in the "scores" object, e.g. "reach"
+            category: Only results in this category
             
+        Returns:
+            list: MetricValue records for the results that have the metric
+        """
+        # Quoting the key keeps dots and spaces in metric names literal
+        path = f"$.scores.{json.dumps(metric)}"
+        query, params = self._assessment_history_query(
+            patient_id, assessment_type, category,
+            f"id, {ms_to_iso_sql('assessment_date')}, json_extract(details_json, ?)", "ASC")
+        return [value for value in self._fetch(MetricValue, query, (path,) + params)
+                if value.value is not None]
+    
+    @cached("assessment_results")
+    def fetch_assessment_summary(self, patient_id, assessment_type=None):
+        """Get count, mean, spread, best, worst and latest score per assessment type
+        
+        Reads one precomputed row per type instead of scanning the history.
+        Assessment types are matched case-insensitively.
+        
+        Returns:
+            list: AssessmentSummary records, ordered by assessment type
+        """
+        query = f"""
+        SELECT patient_id, assessment_type, count, total, total_squares,
+               min_score, max_score, latest_score, {ms_to_iso_sql('latest_date')}
+        FROM assessment_summary
+        WHERE patient_id = ?
+        """
+        params = (patient_id,)
+        if assessment_type:
+            query += " AND assessment_type = ?"
+            params += (assessment_type,)
+        query += " ORDER BY assessment_type"
+        
+        summaries = []
+        for (patient, kind, count, total, total_squares, min_score, max_score,
+             latest_score, latest_date) in self.get_connection().execute(query, params):
+            mean, stddev = _mean_stddev(count, total, total_squares)
+            trend = latest_score - mean if latest_score is not None else None
+            summaries.append(AssessmentSummary(patient, kind, count, mean, stddev, min_score,
+                                               max_score, latest_score, latest_date, trend))
+        return summaries
+    
+    def _roll_up(self, conn, where, params):
+        """Add the results matching a WHERE clause into every rollup bucket"""
+        for granularity, bucket in ROLLUP_BUCKETS.items():
+            conn.execute(f"""
+            INSERT INTO assessment_rollups
+            (patient_id, assessment_type, category, granularity, bucket,
+             count, total, min_score, max_score)
+            SELECT patient_id, assessment_type, {ROLLUP_CATEGORY}, ?, {bucket},
+                   COUNT(*), SUM(score), MIN(score), MAX(score)
+            FROM assessment_results
+            WHERE {where}
+              AND patient_id IS NOT NULL AND assessment_type IS NOT NULL
+              AND score IS NOT NULL AND {bucket} IS NOT NULL
+            GROUP BY patient_id, assessment_type COLLATE NOCASE, {ROLLUP_CATEGORY}, {bucket}
+            ON CONFLICT (patient_id, assessment_type, granularity, category, bucket) DO UPDATE SET
+                count = count + excluded.count,
+                total = total + excluded.total,
+                min_score = MIN(min_score, excluded.min_score),
+                max_score = MAX(max_score, excluded.max_score)
+            """, (granularity,) + params)
+    
+    def refresh_rollups(self):
+        """Bring the day, week and month rollups up to date
+        
+        Only results added since the last refresh are aggregated, found by
+        their id being above the stored high-water mark. Patients whose
+        already rolled-up results were changed or deleted are rebuilt.
+        
+        Returns:
+            int: Number of new results rolled up, or -1 if the refresh failed
+        """
+        conn = self.get_connection()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            high_water = conn.execute("SELECT high_water FROM rollup_state WHERE id = 1").fetchone()[0]
+            latest = conn.execute("SELECT COALESCE(MAX(id), 0) FROM assessment_results").fetchone()[0]
+            dirty = conn.execute("SELECT COUNT(*) FROM rollup_dirty_patients").fetchone()[0]
+            if dirty:
+                self._roll_up(conn, "patient_id IN (SELECT patient_id FROM rollup_dirty_patients) AND id <= ?",
+                              (high_water,))
+                conn.execute("DELETE FROM rollup_dirty_patients")
+            if latest > high_water:
+                self._roll_up(conn, "id > ? AND id <= ?", (high_water, latest))
+                conn.execute("UPDATE rollup_state SET high_water = ? WHERE id = 1", (latest,))
             conn.commit()
-            conn.close()
-            return True
-            
+            return latest - high_water if latest > high_water else 0
         except Exception as e:
-            print(f"Error adding detailed assessment: {str(e)}")
-            return False
+            print(f"Error refreshing assessment rollups: {e}")
+            if conn.in_transaction:
+                conn.rollback()
+            return -1
     
-    def get_patient_assessment_history(self, patient_id, assessment_type=None):
-        """Get assessment history for a patient"""
+    @cached("assessment_results")
+    def get_score_trend(self, patient_id, assessment_type, granularity="week", category=None,
+                        since=None, refresh=True):
+        """Get a patient's average score per day, week or month as numpy arrays
+        
+        Reads the precomputed rollups, so the cost depends on the number of
+        buckets rather than on the number of results.
+        
+        Args:
+            patient_id: ID of the patient
+            assessment_type: Assessment type, matched case-insensitively
+            granularity: "day", "week" or "month"
+            category: Only detailed results with this category, e.g. "Upper Extremity"
+            since: Only buckets starting on or after this "YYYY-MM-DD" date
+            refresh: Roll up new results first
+        
+        Returns:
+            ScoreTrend: Arrays in bucket order, all empty if there are no results
+        """
+        if granularity not in ROLLUP_BUCKETS:
+            raise ValueError(f"Invalid granularity: {granularity}")
+        if refresh and not self.read_only:
+            self.refresh_rollups()
+        
+        query = """
+        SELECT bucket, SUM(count), SUM(total), MIN(min_score), MAX(max_score)
+        FROM assessment_rollups
+        WHERE patient_id = ? AND assessment_type = ? AND granularity = ?
+        """
+        params = [patient_id, assessment_type, granularity]
+        if category is not None:
+            query += " AND category = ?"
+            params.append(category)
+        if since is not None:
+            query += " AND bucket >= ?"
+            params.append(since)
+        query += " GROUP BY bucket ORDER BY bucket"
+        return _score_trend(self.get_connection().execute(query, params).fetchall())
+    
+    # Reads across the federated sites. They bypass the read cache: the other
+    # sites' databases change without this manager knowing.
+    
+    def site_names(self):
+        """Names of the federated sites, this database's site first"""
+        return [name for name, _ in self._site_schemas]
+    
+    def _each_site(self, sites=None):
+        """(site, schema) pairs of the named sites, or of every site"""
+        if sites is None:
+            return self._site_schemas
+        unknown = set(sites) - set(self.site_names())
+        if unknown:
+            raise ValueError(f"Unknown sites: {sorted(unknown)}")
+        return [(name, schema) for name, schema in self._site_schemas if name in sites]
+    
+    def _union_sites(self, select, params=(), sites=None):
+        """One query over every site: select (with {schema} for its schema) per site, led by a site column"""
+        parts = []
+        union_params = []
+        for name, schema in self._each_site(sites):
+            parts.append(f"SELECT ? AS site, * FROM ({select.format(schema=schema)})")
+            union_params += [name, *params]
+        return " UNION ALL ".join(parts), union_params
+    
+    def search_patients_all_sites(self, name, limit=SEARCH_LIMIT, sites=None):
+        """Get patients of every site whose name contains the given text
+        
+        Each site is searched with its own name index. Exact name matches
+        come first, then the sites' best matches taken in turn: each site's
+        best, then each site's second best, and so on. Ranks from different
+        sites' indexes can't be compared, so a site with many matches doesn't
+        crowd out the others.
+        
+        Args:
+            name: Text to look for anywhere in the name (case-insensitive)
+            limit: Maximum number of patients to return
+            sites: Names of the sites to search, all of them by default
+            
+        Returns:
+            list: SitePatientRecords
+        """
         conn = self.get_connection()
+        columns = ", ".join(f"p.{column}" for column in PATIENT_COLUMNS)
+        per_site = []
+        for site, schema in self._each_site(sites):
+            query, params = self._name_search_query(name, limit, columns, schema)
+            per_site.append([SitePatientRecord(site, *row) for row in conn.execute(query, params)])
+        found = [patient for same_rank in itertools.zip_longest(*per_site)
+                 for patient in same_rank if patient is not None]
+        exact = name.strip().lower()
+        found.sort(key=lambda patient: patient.name.lower() != exact)
+        return found[:limit]
+    
+    def get_all_sites_patients(self, sites=None):
+        """Get the patients of every site as a pandas DataFrame with a leading site column"""
+        import pandas as pd
+        query, params = self._union_sites(f"SELECT {', '.join(PATIENT_COLUMNS)} FROM {{schema}}.patients",
+                                          sites=sites)
+        return pd.read_sql_query(f"{query} ORDER BY site, id", self.get_connection(), params=params)
+    
+    def fetch_assessments_all_sites(self, start, end, assessment_type=None, sites=None):
+        """Get every site's results in a date range, oldest first
         
+        Args:
+            start: First instant included; anything to_epoch_ms() accepts
+            end: First instant excluded
+            assessment_type: Only results of this type (exact match)
+            sites: Names of the sites to read, all of them by default
+            
+        Returns:
+            list: SiteAssessmentRecords; patient_id is the patient's id at their site
+        """
+        select = (f"SELECT {ASSESSMENT_SELECT} FROM {{schema}}.assessment_results "
+                  "WHERE assessment_date >= ? AND assessment_date < ?")
+        params = (to_epoch_ms(start), to_epoch_ms(end))
         if assessment_type:
-            query = """
-            SELECT * FROM assessment_results 
-            WHERE patient_id = ? AND assessment_type = ?
-            ORDER BY assessment_date DESC
-            """
-            df = pd.read_sql_query(query, conn, params=(patient_id, assessment_type))
-        else:
-            query = """
-            SELECT * FROM assessment_results 
-            WHERE patient_id = ?
-            ORDER BY assessment_date DESC
-            """
-            df = pd.read_sql_query(query, conn, params=(patient_id,))
+            select += " AND assessment_type = ?"
+            params += (assessment_type,)
+        query, params = self._union_sites(select, params, sites)
+        return self._fetch(SiteAssessmentRecord, f"{query} ORDER BY assessment_date, site, id", params)
+    
+    def fetch_summary_all_sites(self, assessment_type=None, sites=None):
+        """Get the count, mean, spread, best and worst score of each assessment type per site
+        
+        Each site adds up its own assessment_summary rows (one per patient
+        and type) and the all-sites statistics are combined from those
+        sums, so no history is scanned.
         
-        conn.close()
+        Args:
+            assessment_type: Only this type (case-insensitive)
+            sites: Names of the sites to include, all of them by default
+            
+        Returns:
+            list: SiteSummary records ordered by type, each site's followed by
+            the all-sites record with site None
+        """
+        select = """
+        SELECT assessment_type, COUNT(*), SUM(count), SUM(total), SUM(total_squares),
+               MIN(min_score), MAX(max_score)
+        FROM {schema}.assessment_summary
+        """
+        params = ()
+        if assessment_type:
+            select += " WHERE assessment_type = ?"
+            params = (assessment_type,)
+        select += " GROUP BY assessment_type COLLATE NOCASE"
+        query, params = self._union_sites(select, params, sites)
+        
+        per_type = {}
+        for row in self.get_connection().execute(query, params):
+            per_type.setdefault(row[1].lower(), []).append(row)
+        summaries = []
+        for _, rows in sorted(per_type.items()):
+            totals = [0, 0, 0.0, 0.0]
+            for site, kind, patients, count, total, total_squares, min_score, max_score in rows:
+                summaries.append(SiteSummary(site, kind, patients, count,
+                                             *_mean_stddev(count, total, total_squares), min_score, max_score))
+                totals = [a + b for a, b in zip(totals, (patients, count, total, total_squares))]
+            patients, count, total, total_squares = totals
+            summaries.append(SiteSummary(None, rows[0][1], patients, count,
+                                         *_mean_stddev(count, total, total_squares),
+                                         min(row[6] for row in rows), max(row[7] for row in rows)))
+        return summaries
+    
+    def get_score_trend_all_sites(self, assessment_type, granularity="week", category=None, since=None,
+                                  sites=None):
+        """Get the average score per day, week or month over the patients of every site
+        
+        Each site's rollups are added up per bucket and the buckets of all
+        sites combined in the same query. The attached sites' rollups can't
+        be refreshed through a read-only connection, so their results that
+        are not rolled up yet (above the high-water mark, or of patients
+        whose results changed) are bucketed straight from the history.
+        
+        Args:
+            assessment_type: Assessment type (exact match)
+            granularity: "day", "week" or "month"
+            category: Only results in this category ("" for none)
+            since: Only buckets starting on or after this "YYYY-MM-DD" date
+            sites: Names of the sites to include, all of them by default
+            
+        Returns:
+            ScoreTrend: Arrays in bucket order
+        """
+        if granularity not in ROLLUP_BUCKETS:
+            raise ValueError(f"Invalid granularity: {granularity}")
+        if not self.read_only:
+            self.refresh_rollups()
+        rolled_up = ("SELECT bucket, count, total, min_score, max_score FROM {schema}.assessment_rollups "
+                     "WHERE assessment_type = ? AND granularity = ?")
+        pending = f"""
+        SELECT {ROLLUP_BUCKETS[granularity]} AS bucket, 1, score, score, score FROM {{schema}}.assessment_results
+        WHERE assessment_type = ? AND patient_id IS NOT NULL AND score IS NOT NULL
+          AND (id > (SELECT high_water FROM {{schema}}.rollup_state WHERE id = 1)
+               OR patient_id IN (SELECT patient_id FROM {{schema}}.rollup_dirty_patients))
+        """
+        rolled_up_params = [assessment_type, granularity]
+        pending_params = [assessment_type]
+        if category is not None:
+            rolled_up += " AND category = ?"
+            pending += f" AND {ROLLUP_CATEGORY} = ?"
+            rolled_up_params.append(category)
+            pending_params.append(category)
+        if since is not None:
+            rolled_up += " AND bucket >= ?"
+            pending += f" AND {ROLLUP_BUCKETS[granularity]} >= ?"
+            rolled_up_params.append(since)
+            pending_params.append(since)
+        select = f"""
+        SELECT bucket, SUM(count) AS count, SUM(total) AS total, MIN(min_score) AS min_score,
+               MAX(max_score) AS max_score
+        FROM ({rolled_up} UNION ALL {pending})
+        GROUP BY bucket
+        """
+        query, params = self._union_sites(select, rolled_up_params + pending_params, sites)
+        return _score_trend(self.get_connection().execute(f"""
+        SELECT bucket, SUM(count), SUM(total), MIN(min_score), MAX(max_score)
+        FROM ({query})
+        GROUP BY bucket ORDER BY bucket
+        """, params).fetchall())
+    
+    @cached("rehabilitation_plans")
+    def fetch_rehabilitation_plans(self, patient_id):
+        """Get rehabilitation plans for a patient as PlanRecords, newest first"""
+        return self._fetch(PlanRecord, f"""
+        SELECT {PLAN_SELECT} FROM rehabilitation_plans 
+        WHERE patient_id = ?
+        ORDER BY created_date DESC
+        """, (patient_id,))
+    
+    @cached("exercises")
+    def fetch_plan_exercises(self, plan_id):
+        """Get exercises for a rehabilitation plan as ExerciseRecords"""
+        return self._fetch(ExerciseRecord, f"""
+        SELECT {', '.join(EXERCISE_COLUMNS)} FROM exercises 
+        WHERE plan_id = ?
+        """, (plan_id,))
+    
+    @cached("assessment_results")
+    def get_patient_assessment_history(self, patient_id, assessment_type=None, category=None):
+        """Get assessment history for a patient"""
+        import pandas as pd
+        conn = self.get_connection()
+        query, params = self._assessment_history_query(patient_id, assessment_type, category)
+        df = pd.read_sql_query(query, conn, params=params)
         return df
     
+    @cached("rehabilitation_plans")
     def get_rehabilitation_plans(self, patient_id):
         """Get rehabilitation plans for a patient"""
+        import pandas as pd
         conn = self.get_connection()
-        query = """
-        SELECT * FROM rehabilitation_plans 
+        query = f"""
+        SELECT {PLAN_SELECT} FROM rehabilitation_plans 
         WHERE patient_id = ?
         ORDER BY created_date DESC
         """
         df = pd.read_sql_query(query, conn, params=(patient_id,))
-        conn.close()
         return df
     
+    @cached("exercises")
     def get_exercises_for_plan(self, plan_id):
         """Get exercises for a specific rehabilitation plan"""
+        import pandas as pd
         conn = self.get_connection()
         query = """
         SELECT * FROM exercises 
         WHERE plan_id = ?
         """
         df = pd.read_sql_query(query, conn, params=(plan_id,))
-        conn.close()
         return df
     
     def create_rehabilitation_plan(self, patient_id, plan_name, description):
         """Create a new rehabilitation plan for a patient"""
         conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("""
-        INSERT INTO rehabilitation_plans 
-        (patient_id, plan_name, description, created_date, status)
-        VALUES (?, ?, ?, datetime('now'), 'Active')
-        """, (patient_id, plan_name, description))
-        plan_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
-        return plan_id
+        with conn:
+            cursor = conn.execute(f"""
+            INSERT INTO rehabilitation_plans 
+            (patient_id, plan_name, description, created_date, status)
+            VALUES (?, ?, ?, {NOW_MS}, 'Active')
+            """, (patient_id, plan_name, description))
+        self.cache.bump(("rehabilitation_plans",))
+        return cursor.lastrowid
     
     def add_exercise_to_plan(self, plan_id, exercise_name, description, frequency, duration):
         """Add an exercise to a rehabilitation plan"""
         conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("""
-        INSERT INTO exercises 
-        (plan_id, exercise_name, description, frequency, duration, completed)
-        VALUES (?, ?, ?, ?, ?, 0)
-        """, (plan_id, exercise_name, description, frequency, duration))
-        exercise_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
-        return exercise_id
+        with conn:
+            cursor = conn.execute("""
+            INSERT INTO exercises 
+            (plan_id, exercise_name, description, frequency, duration, completed)
+            VALUES (?, ?, ?, ?, ?, 0)
+            """, (plan_id, exercise_name, description, frequency, duration))
+        self.cache.bump(("exercises",))
+        return cursor.lastrowid
     
     def toggle_exercise_completion(self, exercise_id):
         """Toggle an exercise's completion status"""
         conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        # First get current status
-        cursor.execute("SELECT completed FROM exercises WHERE id = ?", (exercise_id,))
-        result = cursor.fetchone()
-        
-        if result:
+        with conn:
+            cursor = conn.cursor()
+            
+            # First get current status
+            cursor.execute("SELECT completed FROM exercises WHERE id = ?", (exercise_id,))
+            result = cursor.fetchone()
+            
+            if not result:
+                return None
+            
             current_status = result[0]
             new_status = 1 if current_status == 0 else 0
             
@@ -386,62 +1321,61 @@ class DatabaseManager:
             SET completed = ?
             WHERE id = ?
             """, (new_status, exercise_id))
-            
-            conn.commit()
-            conn.close()
-            return new_status
-        else:
-            conn.close()
-            return None
+        self.cache.bump(("exercises",))
+        return new_status
     
     def export_patient_data_to_csv(self, output_path="patients_data.csv"):
-        """Export all patient data to a CSV file for compatibility with legacy code"""
-        df = self.get_all_patients()
-        # Rename columns to match the expected format in the legacy code
-        column_mapping = {
-            'name': 'Name', 
-            'age': 'Age', 
-            'gender': 'Gender', 
-            'speech_score': 'Speech Score', 
-            'emoji_score': 'Emoji Score', 
-            'snake_score': 'Snake Score', 
-            'ball_score': 'Ball Score'
-        }
-        df = df.rename(columns=column_mapping)
-        # Select only the columns needed for compatibility
-        columns_to_export = list(column_mapping.values())
-        df[columns_to_export].to_csv(output_path, index=False)
+        """Export all patient data to a CSV file for compatibility with legacy code
+        
+        Patients are streamed a page at a time; see db_export for filtered,
+        history and background exports.
+        """
+        from db_export import export_patients_csv
+        export_patients_csv(self, output_path)
         return output_path
     
     def delete_patient(self, patient_id):
-        """Delete a patient from the database by ID"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        """Delete a patient from the database by ID
         
+        Assessment results, rehabilitation plans and their exercises are
+        removed by the ON DELETE CASCADE foreign keys.
+        """
         try:
-            # Delete related assessment results first
-            cursor.execute("DELETE FROM assessment_results WHERE patient_id = ?", (patient_id,))
-            
-            # Delete related rehabilitation plans and exercises
-            cursor.execute("SELECT id FROM rehabilitation_plans WHERE patient_id = ?", (patient_id,))
-            plan_ids = [row[0] for row in cursor.fetchall()]
-            
-            for plan_id in plan_ids:
-                cursor.execute("DELETE FROM exercises WHERE plan_id = ?", (plan_id,))
-            
-            cursor.execute("DELETE FROM rehabilitation_plans WHERE patient_id = ?", (patient_id,))
-            
-            # Now delete the patient
-            cursor.execute("DELETE FROM patients WHERE id = ?", (patient_id,))
-            
-            conn.commit()
+            conn = self.get_connection()
+            with conn:
+                conn.execute("DELETE FROM patients WHERE id = ?", (patient_id,))
+            # The cascade reaches every table
+            self.cache.clear()
             return True
         except Exception as e:
             print(f"Error deleting patient: {e}")
-            conn.rollback()
             return False
-        finally:
-            conn.close()
+    
+    def delete_patients(self, patient_ids):
+        """Delete many patients and everything that belongs to them in one transaction
+        
+        Args:
+            patient_ids: Iterable of patient IDs, e.g. for a data-retention purge
+        
+        Returns:
+            int: Number of patients deleted, or 0 if the transaction failed
+        """
+        patient_ids = list(patient_ids)
+        deleted = 0
+        try:
+            conn = self.get_connection()
+            with conn:
+                # Chunked to stay under SQLite's limit on bound parameters
+                for start in range(0, len(patient_ids), DELETE_CHUNK_SIZE):
+                    chunk = patient_ids[start:start + DELETE_CHUNK_SIZE]
+                    placeholders = ", ".join("?" * len(chunk))
+                    cursor = conn.execute(f"DELETE FROM patients WHERE id IN ({placeholders})", chunk)
+                    deleted += cursor.rowcount
+            self.cache.clear()
+            return deleted
+        except Exception as e:
+            print(f"Error deleting patients: {e}")
+            return 0
 
 # Create a singleton instance for easy import throughout the application
 db = DatabaseManager()
@@ -459,4 +1393,4 @@ if __name__ == "__main__":
         print(f"Patient: {patient['name']}")
         
         history = db.get_patient_assessment_history(patient_id)
-        print(f"Assessment history: {len(history)} records") 
\ No newline at end of file
+        print(f"Assessment history: {len(history)} records") 
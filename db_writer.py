@@ -0,0 +1,175 @@
+"""
+Single writer thread for the NeuroWell database.
+
+Score and assessment writes used to run synchronously on whichever thread
+finished first (game threads at the end of a session, the GUI thread for the
+physio assessment), each paying for its own commit. DatabaseWriter owns one
+connection and takes write commands from a queue. Commands that arrive within
+a short window share a single transaction, and every command gets a
+concurrent.futures.Future that resolves once its transaction has committed.
+
+Each command runs inside its own SAVEPOINT, so one failing command is rolled
+back and reported on its future without undoing the rest of the batch.
+"""
+
+import time
+import queue
+import threading
+from concurrent.futures import Future
+
+# Collect commands for up to this many seconds after the first one arrives
+BATCH_WINDOW = 0.05
+# Never put more than this many commands in one transaction
+MAX_BATCH = 500
+
+_STOP = object()
+
+
+class DatabaseWriter(threading.Thread):
+    """Background thread that applies queued write commands in batched transactions"""
+
+    def __init__(self, manager, batch_window=BATCH_WINDOW, max_batch=MAX_BATCH):
+        """Initialize the writer
+
+        Args:
+            manager: DatabaseManager whose database the writer commits to
+            batch_window: Seconds to wait for more commands before committing
+            max_batch: Maximum number of commands per transaction
+        """
+        super().__init__(daemon=True, name="DatabaseWriter")
+        self.manager = manager
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.commands = queue.Queue()
+        self.submitted = 0
+        self.committed = 0
+        self.failed = 0
+        self.transactions = 0
+
+    def submit(self, command, *args, tables=()):
+        """Queue a write command without waiting for it
+
+        Args:
+            command: Callable run as command(conn, *args) inside the batch
+                transaction. It must not commit or roll back itself.
+            tables: Tables the command writes. The manager's cached reads of
+                them are invalidated after the commit, before the future resolves.
+
+        Returns:
+            Future: Resolves to the command's return value after the commit,
+            or to its exception if it failed
+        """
+        future = Future()
+        self.submitted += 1
+        self.commands.put((future, command, args, tables))
+        return future
+
+    def flush(self, timeout=None):
+        """Block until every command queued so far has been committed"""
+        self.submit(lambda conn: None).result(timeout)
+
+    def close(self):
+        """Commit the queued commands and stop the thread"""
+        if self.is_alive():
+            self.commands.put(_STOP)
+            self.join()
+
+    def stats(self):
+        """Command and transaction counts since the writer started"""
+        return {
+            "submitted": self.submitted,
+            "committed": self.committed,
+            "failed": self.failed,
+            "transactions": self.transactions,
+            "pending": self.commands.qsize(),
+        }
+
+    def run(self):
+        try:
+            while True:
+                batch, stop = self._next_batch()
+                if batch:
+                    self._apply(batch)
+                if stop:
+                    break
+        finally:
+            self.manager.close_thread_connection()
+
+    def _next_batch(self):
+        """Wait for a command, then gather whatever else arrives within the window
+
+        Returns:
+            tuple: (list of queued commands, True if the writer should stop)
+        """
+        item = self.commands.get()
+        if item is _STOP:
+            return [], True
+        batch = [item]
+        deadline = time.monotonic() + self.batch_window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self.commands.get(timeout=remaining) if remaining > 0 else self.commands.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _apply(self, batch):
+        """Run a batch of commands in one transaction and resolve their futures"""
+        conn = self.manager.get_connection()
+        results = []
+        written = set()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for future, command, args, tables in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                conn.execute("SAVEPOINT command")
+                try:
+                    value = command(conn, *args)
+                except Exception as e:
+                    conn.execute("ROLLBACK TO command")
+                    conn.execute("RELEASE command")
+                    future.set_exception(e)
+                    self.failed += 1
+                    continue
+                conn.execute("RELEASE command")
+                results.append((future, value))
+                written.update(tables)
+            conn.commit()
+            self.transactions += 1
+        except Exception as e:
+            print(f"Error committing database writes: {e}")
+            if conn.in_transaction:
+                conn.rollback()
+            # Nothing in the batch was committed
+            for future, _, _, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+                    self.failed += 1
+            return
+
+        # Readers woken by the futures must not get results cached before the commit
+        if written:
+            self.manager.invalidate_cache(written)
+        for future, value in results:
+            future.set_result(value)
+        self.committed += len(results)
+
+
+def print_write_result(future, description):
+    """Print whether a queued write was saved once its transaction finishes"""
+    def report(done):
+        if done.cancelled():
+            print(f"Cancelled saving {description}")
+        elif done.exception() is not None:
+            print(f"Failed to save {description}: {done.exception()}")
+        elif done.result() is False:
+            print(f"Failed to save {description}")
+        else:
+            print(f"Saved {description}")
+    future.add_done_callback(report)
+    return future
@@ -565,17 +565,19 @@ class EmojiGameUI(QWidget):
             # Import the database utility
             from db_utils import db
             
+            from db_writer import print_write_result
+            
             # Get patient data matching the name
-            patient_data = db.get_patient_by_name(patient_name)
+            patients = db.search_patients(patient_name)
             
-            if not patient_data.empty:
-                # Get the first matching patient's ID
-                patient_id = patient_data.iloc[0]['id']
+            if patients:
+                # Get the best matching patient's ID
+                patient_id = patients[0].id
                 print(f"Found patient ID: {patient_id}")
                 
-                # Update the assessment score in the database
-                db.update_assessment_score(patient_id, "emoji", score)
-                print(f"Successfully updated emoji score to {score} for patient ID {patient_id}")
+                # Queue the score for the database writer so the game never waits on disk
+                print_write_result(db.submit_assessment_score(patient_id, "emoji", score),
+                                   f"emoji score {score} for patient ID {patient_id}")
                 return True
             else:
                 print(f"Error: No patient found with name {patient_name}")
@@ -10,6 +10,8 @@ from PyQt5.QtGui import QPixmap, QFont, QImage
 import time
 import gc
 from cvzone.HandTrackingModule import HandDetector
+from hand_tracking import GatedHandDetector, SkeletonRenderer, print_gate_stats
+from session_recorder import start_session_recording
 import os
 from patient_dropdown import PatientDropdown
 
@@ -132,8 +134,11 @@ class VideoThread(QThread):
     def __init__(self):
         super().__init__()
         self.running = False
+        self.recorder = None
         self.game = None
         self.detector = None
+        # Draws the detected hand skeleton, set enabled=False for headless scoring
+        self.skeleton = SkeletonRenderer()
         self.patient_id = None
         self.patient_name = None
         # Add buffer for smoother display
@@ -144,7 +149,7 @@ class VideoThread(QThread):
         try:
             print("Initializing hand detector...")
             # Increase detection confidence and enable maximum hand tracking
-            self.detector = HandDetector(detectionCon=0.5, maxHands=1)
+            self.detector = GatedHandDetector(HandDetector(detectionCon=0.5, maxHands=1))
             print("Hand detector initialized successfully")
         except Exception as e:
             print(f"Error initializing hand detector: {e}")
@@ -221,6 +226,11 @@ class VideoThread(QThread):
         target_frame_time = 1.0 / 30  # Target 30 fps
         last_good_frame = None  # Store the last good frame
         
+        # Optional session recording, fed from the frame signal inside this thread
+        self.recorder = start_session_recording("Snake", self.patient_name)
+        if self.recorder:
+            self.change_pixmap_signal.connect(self.recorder.submit, Qt.DirectConnection)
+        
         self.running = True
         print("Starting game loop...")
         while self.running:
@@ -292,8 +302,9 @@ class VideoThread(QThread):
                 
                 try:
                     if self.detector is not None:
-                        # Explicitly set draw parameter to True for better visualization
-                        hands, img = self.detector.findHands(img, flipType=False, draw=True)
+                        # Detect without drawing, then draw the skeleton separately
+                        hands = self.detector.detect(img, flipType=False)
+                        self.skeleton.draw(img, hands)
                         
                         if hands:
                             # Get the position of the index finger
@@ -355,7 +366,8 @@ class VideoThread(QThread):
                 self.game_over_signal.emit(self.game.score)
                 
                 # Update the patient's score in database
-                self.update_snake_score(self.patient_id, self.game.score)
+                self.update_snake_score(self.patient_id, self.game.score,
+                                        {"duration_s": round(elapsed_time, 1), "frames": frame_count})
                 
                 # Add game over text to the image
                 cv2.putText(img, "GAME OVER!", (WEBCAM_WIDTH//2 - 100, WEBCAM_HEIGHT//2), 
@@ -380,24 +392,32 @@ class VideoThread(QThread):
             time.sleep(0.01)
         
         # Release resources
+        if self.recorder:
+            self.change_pixmap_signal.disconnect(self.recorder.submit)
+            self.recorder.close()
+            self.recorder = None
+        
         print("Releasing camera resources...")
         cap.release()
+        print_gate_stats("Snake game", self.detector)
+        # Release the database connection this thread used for the score update
+        from db_utils import db
+        db.close_thread_connection()
         print("Game thread finished")
     
     def stop(self):
         self.running = False
         self.wait()
     
-    def update_snake_score(self, patient_id, score):
-        """Update the patient's snake game score in the database"""
+    def update_snake_score(self, patient_id, score, data=None):
+        """Update the patient's snake game score in the database, with optional session data"""
         try:
             from db_utils import db
+            from db_writer import print_write_result
             
-            # Update score directly by patient ID
-            if db.update_assessment_score(patient_id, "Snake", score):
-                print(f"Successfully updated Snake score to {score} for patient ID {patient_id}")
-            else:
-                print(f"Failed to update Snake score for patient ID {patient_id}")
+            # Queue the score for the database writer so the game thread never waits on disk
+            print_write_result(db.submit_assessment_score(patient_id, "Snake", score, data),
+                               f"Snake score {score} for patient ID {patient_id}")
         except Exception as e:
             print(f"Error updating snake score: {e}")
     
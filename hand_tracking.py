@@ -0,0 +1,221 @@
+"""
+Shared hand tracking helpers for the camera-based assessments.
+
+MotionGate decides from a cheap downsampled frame difference whether the scene
+changed enough to be worth running the hand detector again. GatedHandDetector
+wraps a cvzone HandDetector with the gate, reusing the last landmarks while the
+patient holds still and refreshing them at a minimum interval. SkeletonRenderer
+draws the returned landmarks separately from detection.
+"""
+
+import time
+import cv2
+import numpy as np
+
+# Defaults for the motion gate
+GATE_SCALE = 0.125  # Compare frames at 1/8 resolution (80x60 for a 640x480 camera)
+GATE_PIXEL_THRESHOLD = 25  # Grey-level change for a pixel to count as moving
+GATE_MOTION_THRESHOLD = 0.01  # Fraction of moving pixels that triggers detection
+GATE_MAX_SKIP_INTERVAL = 0.5  # Always refresh landmarks at least this often (seconds)
+
+
+class MotionGate:
+    """Skip hand detection on frames that barely differ from the last detected one"""
+
+    def __init__(self, motion_threshold=GATE_MOTION_THRESHOLD,
+                 pixel_threshold=GATE_PIXEL_THRESHOLD, scale=GATE_SCALE,
+                 max_skip_interval=GATE_MAX_SKIP_INTERVAL):
+        """Initialize the gate
+
+        Args:
+            motion_threshold: Fraction (0-1) of changed pixels needed to run detection
+            pixel_threshold: Grey-level difference for a pixel to count as changed
+            scale: Downsampling factor applied before differencing
+            max_skip_interval: Maximum seconds between two detector runs
+        """
+        self.motion_threshold = motion_threshold
+        self.pixel_threshold = pixel_threshold
+        self.scale = scale
+        self.max_skip_interval = max_skip_interval
+        self.reference = None
+        self.last_run_time = 0.0
+        self.run_count = 0
+        self.skip_count = 0
+
+    def _small_gray(self, frame):
+        """Downsampled greyscale copy of the frame used for differencing"""
+        small = cv2.resize(frame, None, fx=self.scale, fy=self.scale,
+                           interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return small
+
+    def motion_fraction(self, small):
+        """Fraction of pixels that changed since the last detected frame"""
+        diff = cv2.absdiff(small, self.reference)
+        _, moving = cv2.threshold(diff, self.pixel_threshold, 255, cv2.THRESH_BINARY)
+        return cv2.countNonZero(moving) / float(moving.size)
+
+    def should_detect(self, frame, now=None):
+        """Return True if the detector should run on this frame"""
+        now = time.monotonic() if now is None else now
+        small = self._small_gray(frame)
+
+        run = (self.reference is None
+               or self.reference.shape != small.shape
+               or now - self.last_run_time >= self.max_skip_interval
+               or self.motion_fraction(small) > self.motion_threshold)
+
+        if run:
+            # Compare future frames against the one we detected on, so slow
+            # drift still adds up and triggers a refresh
+            self.reference = small
+            self.last_run_time = now
+            self.run_count += 1
+        else:
+            self.skip_count += 1
+        return run
+
+    def reset(self):
+        """Forget the reference frame so the next frame is always detected"""
+        self.reference = None
+
+    def stats(self):
+        """Detector runs versus skipped frames for this session"""
+        total = self.run_count + self.skip_count
+        return {
+            "run": self.run_count,
+            "skipped": self.skip_count,
+            "skip_ratio": self.skip_count / total if total else 0.0,
+        }
+
+
+class GatedHandDetector:
+    """cvzone HandDetector wrapper that only runs detection when the scene moves
+
+    Detection and drawing are separate: detect() never touches the frame, and
+    the caller draws the returned landmarks with a SkeletonRenderer (or not at
+    all for headless scoring).
+    """
+
+    def __init__(self, detector, gate=None):
+        """Wrap a HandDetector
+
+        Args:
+            detector: The cvzone HandDetector instance to gate
+            gate: Optional MotionGate, a default one is created if not given
+        """
+        self.detector = detector
+        self.gate = gate if gate is not None else MotionGate()
+        self.last_hands = []
+
+    def detect(self, img, flipType=True):
+        """Find hands without drawing, reusing the last landmarks on static frames
+
+        Returns:
+            list: cvzone hand dicts ('lmList', 'bbox', 'center', 'type') with an
+            extra 'landmarks' entry holding the (21, 2) int32 pixel coordinates
+        """
+        if not self.gate.should_detect(img):
+            return self.last_hands
+
+        result = self.detector.findHands(img, draw=False, flipType=flipType)
+        # cvzone returns (hands, img) only when drawing, but be tolerant of both
+        hands = result[0] if isinstance(result, tuple) else result
+        for hand in hands:
+            hand["landmarks"] = np.array(hand["lmList"], dtype=np.int32)[:, :2]
+        self.last_hands = hands
+        return hands
+
+    def findHands(self, img, draw=True, flipType=True):
+        """Same contract as HandDetector.findHands, drawn with the lean skeleton renderer"""
+        hands = self.detect(img, flipType=flipType)
+        if draw:
+            DEFAULT_RENDERER.draw(img, hands)
+        return hands, img
+
+    def stats(self):
+        """Detector runs versus skipped frames for this session"""
+        return self.gate.stats()
+
+    def __getattr__(self, name):
+        # Everything else (fingersUp, findDistance, ...) goes to the real detector
+        return getattr(self.detector, name)
+
+
+class SkeletonRenderer:
+    """Draw hand skeletons with a single batched cv2.polylines call"""
+
+    def __init__(self, enabled=True, line_color=(0, 255, 0), line_thickness=2,
+                 point_color=(255, 0, 255), point_radius=5, tips_only=True,
+                 draw_bbox=False, bbox_color=(255, 0, 255)):
+        """Initialize the renderer
+
+        Args:
+            enabled: Set to False to skip all drawing (headless scoring)
+            line_color: BGR color of the bone lines
+            line_thickness: Thickness of the bone lines
+            point_color: BGR color of the landmark dots
+            point_radius: Radius of the landmark dots, 0 to draw no dots
+            tips_only: Only draw dots on the wrist and fingertips
+            draw_bbox: Also draw the bounding box around each hand
+            bbox_color: BGR color of the bounding box
+        """
+        self.enabled = enabled
+        self.line_color = line_color
+        self.line_thickness = line_thickness
+        self.point_color = point_color
+        self.point_radius = point_radius
+        self.point_ids = FINGERTIP_IDS if tips_only else list(range(21))
+        self.draw_bbox = draw_bbox
+        self.bbox_color = bbox_color
+
+    def draw(self, img, hands):
+        """Draw the skeletons of the given hands onto img in place"""
+        if not self.enabled or not hands:
+            return img
+
+        chains = []
+        for hand in hands:
+            landmarks = hand.get("landmarks")
+            if landmarks is None or len(landmarks) < 21:
+                continue
+            chains.extend(landmarks[chain] for chain in HAND_CHAINS)
+        if not chains:
+            return img
+
+        cv2.polylines(img, chains, False, self.line_color, self.line_thickness)
+
+        for hand in hands:
+            landmarks = hand.get("landmarks")
+            if landmarks is None or len(landmarks) < 21:
+                continue
+            if self.point_radius > 0:
+                for x, y in landmarks[self.point_ids]:
+                    cv2.circle(img, (int(x), int(y)), self.point_radius, self.point_color, cv2.FILLED)
+            if self.draw_bbox and "bbox" in hand:
+                x, y, w, h = hand["bbox"]
+                cv2.rectangle(img, (x - 20, y - 20), (x + w + 20, y + h + 20), self.bbox_color, 2)
+        return img
+
+
+# MediaPipe hand landmarks as polyline chains: one per finger plus the palm
+HAND_CHAINS = [
+    np.array([0, 1, 2, 3, 4]),        # Thumb
+    np.array([0, 5, 6, 7, 8]),        # Index finger
+    np.array([9, 10, 11, 12]),        # Middle finger
+    np.array([13, 14, 15, 16]),       # Ring finger
+    np.array([0, 17, 18, 19, 20]),    # Pinky
+    np.array([5, 9, 13, 17]),         # Knuckles across the palm
+]
+FINGERTIP_IDS = [0, 4, 8, 12, 16, 20]
+
+DEFAULT_RENDERER = SkeletonRenderer()
+
+
+def print_gate_stats(name, detector):
+    """Print how many detector runs the motion gate saved in a session"""
+    if isinstance(detector, GatedHandDetector):
+        stats = detector.stats()
+        print(f"{name} motion gate: {stats['run']} detections, {stats['skipped']} skipped "
+              f"({stats['skip_ratio'] * 100:.1f}% of frames)")
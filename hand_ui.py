@@ -9,6 +9,8 @@ import pandas as pd
 import os
 import time
 from cvzone.HandTrackingModule import HandDetector
+from hand_tracking import GatedHandDetector, SkeletonRenderer, print_gate_stats
+from session_recorder import start_session_recording
 
 # Constants for webcam
 WEBCAM_WIDTH = 640
@@ -22,7 +24,10 @@ class HandTrackingThread(QThread):
     def __init__(self):
         super().__init__()
         self.running = False
+        self.recorder = None
         self.patient_name = ""
+        # Draws the detected hand skeleton, set enabled=False for headless scoring
+        self.skeleton = SkeletonRenderer()
         self.score = 0
         self.landmarks_detected = 0
         self.start_time = 0
@@ -34,7 +39,7 @@ class HandTrackingThread(QThread):
         # Initialize hand detector
         try:
             print("Initializing hand detector...")
-            self.detector = HandDetector(detectionCon=0.8, maxHands=2)
+            self.detector = GatedHandDetector(HandDetector(detectionCon=0.8, maxHands=2))
             print("Hand detector initialized successfully")
         except Exception as e:
             print(f"Error initializing hand detector: {e}")
@@ -67,6 +72,11 @@ class HandTrackingThread(QThread):
             
         # Initialize variables
         self.start_time = time.time()
+        # Optional session recording, fed from the frame signal inside this thread
+        self.recorder = start_session_recording("Hand", self.patient_name)
+        if self.recorder:
+            self.change_pixmap_signal.connect(self.recorder.submit, Qt.DirectConnection)
+        
         self.running = True
         last_frame_time = time.time()
         target_frame_time = 1.0 / 30  # Target 30 fps
@@ -112,8 +122,9 @@ class HandTrackingThread(QThread):
             # Flip image for natural interaction
             img = cv2.flip(img, 1)
             
-            # Detect hands
-            hands, img = self.detector.findHands(img, draw=True)
+            # Detect hands, then draw the skeleton separately
+            hands = self.detector.detect(img)
+            self.skeleton.draw(img, hands)
             
             # Update frame counter
             self.total_frames += 1
@@ -203,8 +214,14 @@ class HandTrackingThread(QThread):
             self.change_pixmap_signal.emit(img)
         
         # Release resources
+        if self.recorder:
+            self.change_pixmap_signal.disconnect(self.recorder.submit)
+            self.recorder.close()
+            self.recorder = None
+        
         print("Releasing camera resources...")
         cap.release()
+        print_gate_stats("Hand tracking", self.detector)
         print("Hand tracking thread finished")
     
     def stop(self):
@@ -1,13 +1,39 @@
 import os
-import pandas as pd
 from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLabel, QPushButton, 
                             QLineEdit, QComboBox, QGroupBox, QFormLayout, QTableWidget, 
                             QTableWidgetItem, QHeaderView, QSplitter, QFileDialog, 
                             QMessageBox, QTabWidget, QFrame, QGridLayout, QSpacerItem,
-                            QSizePolicy, QDialog, QScrollArea)
-from PyQt5.QtCore import Qt, pyqtSignal
+                            QSizePolicy, QDialog, QScrollArea, QProgressDialog)
+from PyQt5.QtCore import Qt, pyqtSignal, QThread
 from PyQt5.QtGui import QPixmap, QFont, QIcon, QIntValidator
-from db_utils import db  # Import the database utility
+from db_utils import db, PAGE_SIZE  # Import the database utility
+from db_export import export_patients_csv, export_history_csv, export_history_npz
+
+class ExportThread(QThread):
+    """Runs a db_export function off the GUI thread and reports its progress"""
+    progress_signal = pyqtSignal(int, int)
+    finished_signal = pyqtSignal(int)
+    error_signal = pyqtSignal(str)
+    
+    def __init__(self, export, output_path, **filters):
+        super().__init__()
+        self.export = export
+        self.output_path = output_path
+        self.filters = filters
+    
+    def report_progress(self, done, total):
+        self.progress_signal.emit(done, total)
+        # Stop between chunks when the user cancels
+        return not self.isInterruptionRequested()
+    
+    def run(self):
+        try:
+            count = self.export(db, self.output_path, self.report_progress, **self.filters)
+            self.finished_signal.emit(count)
+        except Exception as e:
+            self.error_signal.emit(str(e))
+        finally:
+            db.close_thread_connection()
 
 class HomeUI(QWidget):
     # Signal for navigation
@@ -16,6 +42,7 @@ class HomeUI(QWidget):
     def __init__(self, parent=None):
         super().__init__(parent)
         self.parent = parent
+        self.export_thread = None
         self.init_ui()
     
     def init_ui(self):
@@ -277,6 +304,9 @@ class HomeUI(QWidget):
         """)
         # Connect double-click event
         self.all_patients_table.cellDoubleClicked.connect(self.show_patient_details)
+        # Fetch the next page of patients when the table is scrolled to the bottom
+        self.next_patients_cursor = None
+        self.all_patients_table.verticalScrollBar().valueChanged.connect(self.on_patients_table_scrolled)
 
         # Add table to the scroll area's container
         table_container_layout.addWidget(self.all_patients_table)
@@ -293,7 +323,12 @@ class HomeUI(QWidget):
         export_csv_button.setObjectName("primary")
         export_csv_button.clicked.connect(self.download_csv)
         
+        export_history_button = QPushButton("Export Assessment History")
+        export_history_button.setObjectName("primary")
+        export_history_button.clicked.connect(self.download_history)
+        
         export_layout.addWidget(export_csv_button)
+        export_layout.addWidget(export_history_button)
         
         patient_layout.addLayout(export_layout)
         
@@ -365,13 +400,12 @@ class HomeUI(QWidget):
             
             print("Attempting to load patients from database...")
             
-            # Get all patients from database
-            df = db.get_all_patients()
+            # Get the first page of patients; more are fetched while scrolling
+            page = db.get_patients_page(limit=PAGE_SIZE)
             
-            print(f"Retrieved {len(df)} patients from database")
-            print(f"DataFrame columns: {df.columns.tolist()}")
+            print(f"Retrieved {len(page.patients)} of {page.total} patients from database")
             
-            if df.empty:
+            if not page.total:
                 print("Warning: No patients found in database")
                 # Create a sample patient if database is empty
                 print("Adding a sample patient...")
@@ -379,10 +413,10 @@ class HomeUI(QWidget):
                 if sample_id:
                     print(f"Added sample patient with ID: {sample_id}")
                     # Fetch patients again after adding sample
-                    df = db.get_all_patients()
+                    page = db.get_patients_page(limit=PAGE_SIZE)
             
             # If we still have very few rows, add some test patients to demonstrate scrolling
-            if len(df) < 10:
+            if page.total < 10:
                 print("Adding test patients to demonstrate scrolling...")
                 for i in range(1, 15):  # Add several test patients
                     test_id = db.add_patient(f"Test Patient {i}", 30 + i, "Female" if i % 2 else "Male")
@@ -390,70 +424,17 @@ class HomeUI(QWidget):
                         print(f"Added test patient with ID: {test_id}")
                 
                 # Reload patients
-                df = db.get_all_patients()
+                page = db.get_patients_page(limit=PAGE_SIZE)
             
             # Update metrics
-            self.update_metrics(df)
-            
-            # Clear existing table data
-            self.all_patients_table.setRowCount(0)
-            
-            # Define columns to display and their order
-            display_columns = ['name', 'age', 'gender', 'speech_score', 'emoji_score', 'snake_score', 'ball_score']
+            self.update_metrics(page.total)
             
-            # Show the actual row count for debugging
-            print(f"Setting table to show {len(df)} rows")
-            
-            # Ensure the table has enough rows allocated
-            self.all_patients_table.setRowCount(len(df))
-            
-            # Populate table with data
-            for i, row in df.iterrows():
-                row_position = i  # Use the index directly since we pre-allocated rows
-                
-                # Add each column value in the right order
-                for j, col_name in enumerate(display_columns):
-                    if col_name in row:
-                        # Get value and handle None/NaN values
-                        value = row[col_name]
-                        
-                        if pd.isna(value) or value is None:
-                            display_value = ""
-                        elif col_name.endswith('_score') and pd.notna(value):
-                            try:
-                                if value == int(value):
-                                    display_value = str(int(value))
-                                else:
-                                    display_value = f"{value:.1f}"
-                            except:
-                                display_value = str(value)
-                        else:
-                            display_value = str(value)
-                        
-                        # Create table item
-                        item = QTableWidgetItem(display_value)
-                        
-                        # Center numeric columns
-                        if col_name in ['age'] or col_name.endswith('_score'):
-                            item.setTextAlignment(Qt.AlignCenter)
-                        
-                        self.all_patients_table.setItem(row_position, j, item)
-                
-                # Debug print each row as it's added
-                print(f"Added row {row_position}: {row['name']}")
-            
-            # Ensure the table updates its display
-            self.all_patients_table.resizeRowsToContents()
-            self.all_patients_table.viewport().update()
+            print(f"Setting table to show {len(page.patients)} rows")
+            self.populate_patient_table(page.patients)
+            self.next_patients_cursor = page.next_cursor
             
             # Display final row count
             print(f"Final table row count: {self.all_patients_table.rowCount()}")
-            
-            # Update first metric card with actual patient count
-            for widget in self.findChildren(QLabel):
-                if widget.objectName() == "dashboard_value" and widget.text() == "Loading...":
-                    widget.setText(str(len(df)))
-                    break
         
         except Exception as e:
             print(f"Error loading patient data: {str(e)}")
@@ -461,12 +442,76 @@ class HomeUI(QWidget):
             traceback.print_exc()
             QMessageBox.warning(self, "Error", f"Error loading data: {str(e)}")
     
-    def update_metrics(self, df):
+    def load_more_patients(self):
+        """Append the next page of patients to the table"""
+        if self.next_patients_cursor is None:
+            return
+        try:
+            page = db.get_patients_page(self.next_patients_cursor, PAGE_SIZE, with_total=False)
+            self.next_patients_cursor = page.next_cursor
+            self.populate_patient_table(page.patients, append=True)
+        except Exception as e:
+            self.next_patients_cursor = None
+            print(f"Error loading more patients: {str(e)}")
+    
+    def on_patients_table_scrolled(self, value):
+        """Load the next page once the table is scrolled close to the bottom"""
+        scroll_bar = self.all_patients_table.verticalScrollBar()
+        if self.next_patients_cursor is not None and value >= scroll_bar.maximum() - 5:
+            self.load_more_patients()
+    
+    def populate_patient_table(self, patients, append=False):
+        """Fill the patients table from a list of PatientRecord
+        
+        Args:
+            patients: Records to show
+            append: Add the records below the current rows instead of replacing them
+        """
+        # Define columns to display and their order
+        display_columns = ['name', 'age', 'gender', 'speech_score', 'emoji_score', 'snake_score', 'ball_score']
+        
+        # Allocate all rows up front
+        first_row = self.all_patients_table.rowCount() if append else 0
+        self.all_patients_table.setRowCount(first_row)
+        self.all_patients_table.setRowCount(first_row + len(patients))
+        
+        for row_position, patient in enumerate(patients, first_row):
+            # Add each column value in the right order
+            for j, col_name in enumerate(display_columns):
+                value = getattr(patient, col_name)
+                
+                if value is None:
+                    display_value = ""
+                elif col_name.endswith('_score'):
+                    try:
+                        if value == int(value):
+                            display_value = str(int(value))
+                        else:
+                            display_value = f"{value:.1f}"
+                    except:
+                        display_value = str(value)
+                else:
+                    display_value = str(value)
+                
+                # Create table item
+                item = QTableWidgetItem(display_value)
+                
+                # Center numeric columns
+                if col_name in ['age'] or col_name.endswith('_score'):
+                    item.setTextAlignment(Qt.AlignCenter)
+                
+                self.all_patients_table.setItem(row_position, j, item)
+        
+        # Ensure the table updates its display
+        self.all_patients_table.resizeRowsToContents()
+        self.all_patients_table.viewport().update()
+    
+    def update_metrics(self, patient_count):
         """Update the dashboard metrics based on data"""
         # Find top-level widgets in the UI
         for widget in self.findChildren(QLabel):
             if widget.objectName() == "dashboard_value" and widget.text() == "Loading...":
-                widget.setText(str(len(df)))
+                widget.setText(str(patient_count))
                 break
     
     def show_add_patient_dialog(self):
@@ -559,58 +604,15 @@ class HomeUI(QWidget):
         
         try:
             # Get patient data matching the search text
-            patient_data = db.get_patient_by_name(search_text)
+            patient_data = db.search_patients(search_text)
             
-            if patient_data.empty:
+            if not patient_data:
                 QMessageBox.information(self, "Search Results", f"No patients found matching '{search_text}'.")
                 return
             
-            # Clear existing table data
-            self.all_patients_table.setRowCount(0)
-            
-            # Define columns to display and their order
-            display_columns = ['name', 'age', 'gender', 'speech_score', 'emoji_score', 'snake_score', 'ball_score']
-            
             print(f"Search found {len(patient_data)} matching patients")
-            
-            # Ensure the table has enough rows allocated
-            self.all_patients_table.setRowCount(len(patient_data))
-            
-            # Populate table with filtered data
-            for i, row in patient_data.iterrows():
-                row_position = i  # Use the index directly since we pre-allocated rows
-                
-                # Add each column value in the right order
-                for j, col_name in enumerate(display_columns):
-                    if col_name in row:
-                        # Get value and handle None/NaN values
-                        value = row[col_name]
-                        
-                        if pd.isna(value) or value is None:
-                            display_value = ""
-                        elif col_name.endswith('_score') and pd.notna(value):
-                            try:
-                                if value == int(value):
-                                    display_value = str(int(value))
-                                else:
-                                    display_value = f"{value:.1f}"
-                            except:
-                                display_value = str(value)
-                        else:
-                            display_value = str(value)
-                        
-                        # Create table item
-                        item = QTableWidgetItem(display_value)
-                        
-                        # Center numeric columns
-                        if col_name in ['age'] or col_name.endswith('_score'):
-                            item.setTextAlignment(Qt.AlignCenter)
-                        
-                        self.all_patients_table.setItem(row_position, j, item)
-            
-            # Ensure the table updates its display
-            self.all_patients_table.resizeRowsToContents()
-            self.all_patients_table.viewport().update()
+            self.next_patients_cursor = None
+            self.populate_patient_table(patient_data)
             
             # Update message
             QMessageBox.information(self, "Search Results", f"Found {len(patient_data)} patient(s) matching '{search_text}'.")
@@ -622,17 +624,63 @@ class HomeUI(QWidget):
             QMessageBox.warning(self, "Error", f"Error searching for patients: {str(e)}")
     
     def download_csv(self):
-        try:
-            # Open file dialog to select save location
-            file_path, _ = QFileDialog.getSaveFileName(self, "Save CSV File", "", "CSV Files (*.csv)")
-            
-            if file_path:
-                # Export from database to CSV
-                db.export_patient_data_to_csv(file_path)
-                QMessageBox.information(self, "Success", f"CSV file saved to {file_path}")
+        # Open file dialog to select save location
+        file_path, _ = QFileDialog.getSaveFileName(self, "Save CSV File", "", "CSV Files (*.csv)")
         
-        except Exception as e:
-            QMessageBox.warning(self, "Error", f"Error saving CSV file: {str(e)}")
+        if file_path:
+            # Export from database to CSV in the background
+            self.start_export(export_patients_csv, file_path, "patients")
+    
+    def download_history(self):
+        file_path, selected_filter = QFileDialog.getSaveFileName(
+            self, "Save Assessment History", "", "CSV Files (*.csv);;NumPy Arrays (*.npz)")
+        
+        if file_path:
+            if selected_filter.startswith("NumPy") and not file_path.endswith(".npz"):
+                file_path += ".npz"
+            if file_path.endswith(".npz"):
+                self.start_export(export_history_npz, file_path, "assessment results")
+            else:
+                self.start_export(export_history_csv, file_path, "assessment results")
+    
+    def start_export(self, export, file_path, description):
+        """Run an export on a background thread with a cancellable progress dialog"""
+        if self.export_thread is not None and self.export_thread.isRunning():
+            QMessageBox.information(self, "Export Running", "Please wait for the current export to finish.")
+            return
+        
+        progress_dialog = QProgressDialog(f"Exporting {description}...", "Cancel", 0, 0, self)
+        progress_dialog.setWindowTitle("Export")
+        progress_dialog.setWindowModality(Qt.WindowModal)
+        progress_dialog.setMinimumDuration(500)
+        
+        thread = ExportThread(export, file_path)
+        
+        def on_progress(done, total):
+            # QProgressDialog works in int, so large exports are shown in thousands
+            scale = 1000 if total > 1_000_000 else 1
+            progress_dialog.setMaximum(max(total // scale, 1))
+            progress_dialog.setValue(min(done // scale, total // scale))
+            progress_dialog.setLabelText(f"Exporting {description}: {done:,} of {total:,}")
+        
+        def on_finished(count):
+            progress_dialog.close()
+            if thread.isInterruptionRequested():
+                QMessageBox.information(self, "Export Cancelled",
+                                        f"Export stopped after {count:,} {description}; {file_path} is incomplete.")
+            else:
+                QMessageBox.information(self, "Success", f"Exported {count:,} {description} to {file_path}")
+        
+        def on_error(message):
+            progress_dialog.close()
+            QMessageBox.warning(self, "Error", f"Error saving export file: {message}")
+        
+        thread.progress_signal.connect(on_progress)
+        thread.finished_signal.connect(on_finished)
+        thread.error_signal.connect(on_error)
+        progress_dialog.canceled.connect(thread.requestInterruption)
+        self.export_thread = thread
+        thread.start()
     
     def show_patient_details(self, row, column):
         """Show detailed information for a patient when their row is double-clicked"""
@@ -641,14 +689,14 @@ class HomeUI(QWidget):
         
         try:
             # Get patient data
-            patient_data = db.get_patient_by_name(patient_name)
+            patient_data = db.search_patients(patient_name)
             
-            if patient_data.empty:
+            if not patient_data:
                 QMessageBox.warning(self, "Error", f"Could not find patient details for {patient_name}.")
                 return
             
-            # Get the first matching patient
-            patient = patient_data.iloc[0]
+            # Get the best matching patient (exact name matches come first)
+            patient = patient_data[0]._asdict()
             
             # Create a detail dialog
             dialog = QDialog(self)
@@ -685,7 +733,7 @@ class HomeUI(QWidget):
                 patient['snake_score'], 
                 patient['ball_score']
             ]
-            valid_scores = [s for s in scores if pd.notna(s) and s > 0]
+            valid_scores = [s for s in scores if s is not None and s > 0]
             
             if valid_scores:
                 avg_score = sum(valid_scores) / len(valid_scores)
@@ -694,6 +742,21 @@ class HomeUI(QWidget):
             scores_group.setLayout(scores_layout)
             layout.addWidget(scores_group)
             
+            # Per-assessment statistics from the precomputed summary table
+            summaries = db.fetch_assessment_summary(patient['id'])
+            if summaries:
+                history_group = QGroupBox("Assessment History")
+                history_layout = QFormLayout()
+                for summary in summaries:
+                    trend = "" if summary.trend is None else f", trend {summary.trend:+.1f}"
+                    history_layout.addRow(
+                        f"{summary.assessment_type.capitalize()}:",
+                        QLabel(f"{summary.count} sessions, mean {summary.mean:.1f} "
+                               f"(\u00b1{summary.stddev:.1f}), best {summary.max_score:.1f}, "
+                               f"latest {summary.latest_score:.1f}{trend}"))
+                history_group.setLayout(history_layout)
+                layout.addWidget(history_group)
+            
             # Action buttons
             button_layout = QHBoxLayout()
             
@@ -1,6 +1,11 @@
 from PyQt5.QtWidgets import QComboBox, QWidget, QVBoxLayout, QLabel, QHBoxLayout
 from PyQt5.QtCore import pyqtSignal, Qt
 
+# Patients fetched per page; the rest load from a "Load more" entry
+PAGE_SIZE = 200
+# Item data of the "Load more" entry
+LOAD_MORE = -2
+
 class PatientDropdown(QWidget):
     """
     A reusable patient dropdown component for the NeuroWell application.
@@ -10,6 +15,9 @@ class PatientDropdown(QWidget):
     
     def __init__(self, parent=None, label_text="Select Patient:", show_label=True):
         super().__init__(parent)
+        self.next_cursor = None
+        # Patients selected before their page was loaded, shown at the top of the list
+        self.preloaded_ids = set()
         self.init_ui(label_text, show_label)
         self.load_patients()
         
@@ -39,26 +47,66 @@ class PatientDropdown(QWidget):
         try:
             from db_utils import db
             
-            # Get all patients
-            df = db.get_all_patients()
+            # Get the first page of patients as plain records
+            page = db.get_patients_page(limit=PAGE_SIZE, with_total=False)
             
             # Clear current items
+            self.patient_combo.blockSignals(True)
             self.patient_combo.clear()
+            self.preloaded_ids.clear()
             
             # Add a default option
             self.patient_combo.addItem("-- Select Patient --", -1)
+            self.patient_combo.blockSignals(False)
             
-            # Add each patient to the dropdown
-            for _, row in df.iterrows():
-                self.patient_combo.addItem(f"{row['name']} (ID: {row['id']})", row['id'])
+            self.add_page(page)
             
         except Exception as e:
             print(f"Error loading patients into dropdown: {str(e)}")
     
+    def add_page(self, page):
+        """Append a page of patients, followed by a "Load more" entry if there are more"""
+        self.patient_combo.blockSignals(True)
+        # Drop the previous "Load more" entry
+        last = self.patient_combo.count() - 1
+        if last > 0 and self.patient_combo.itemData(last) == LOAD_MORE:
+            self.patient_combo.removeItem(last)
+        
+        # Add each patient to the dropdown, except those already shown at the top
+        for patient in page.patients:
+            if patient.id in self.preloaded_ids:
+                continue
+            self.patient_combo.addItem(f"{patient.name} (ID: {patient.id})", patient.id)
+        
+        self.next_cursor = page.next_cursor
+        if self.next_cursor is not None:
+            self.patient_combo.addItem("-- Load more patients --", LOAD_MORE)
+        self.patient_combo.blockSignals(False)
+    
+    def load_more(self):
+        """Fetch the next page of patients into the dropdown"""
+        if self.next_cursor is None:
+            return
+        try:
+            from db_utils import db
+            self.add_page(db.get_patients_page(self.next_cursor, PAGE_SIZE, with_total=False))
+        except Exception as e:
+            self.next_cursor = None
+            print(f"Error loading more patients into dropdown: {str(e)}")
+    
     def on_patient_selected(self, index):
         """Handle patient selection"""
         if index <= 0:  # Skip the default option
             return
+        
+        if self.patient_combo.itemData(index) == LOAD_MORE:
+            # Keep the selection on the placeholder and reopen the list with the new page
+            self.patient_combo.blockSignals(True)
+            self.patient_combo.setCurrentIndex(0)
+            self.patient_combo.blockSignals(False)
+            self.load_more()
+            self.patient_combo.showPopup()
+            return
             
         # Get the patient ID from the selected item's data
         patient_id = self.patient_combo.itemData(index)
@@ -71,11 +119,28 @@ class PatientDropdown(QWidget):
         self.patient_selected.emit(patient_id, patient_name)
     
     def set_patient(self, patient_id):
-        """Set the dropdown to a specific patient by ID"""
-        for i in range(self.patient_combo.count()):
-            if self.patient_combo.itemData(i) == patient_id:
-                self.patient_combo.setCurrentIndex(i)
-                break
+        """Set the dropdown to a specific patient by ID
+        
+        A patient whose page hasn't been loaded yet is looked up on its own
+        and added at the top of the list, instead of loading every page
+        before theirs.
+        """
+        index = self.patient_combo.findData(patient_id)
+        if index < 0:
+            try:
+                from db_utils import db
+                patient = db.fetch_patient(patient_id)
+            except Exception as e:
+                print(f"Error looking up patient {patient_id} for dropdown: {str(e)}")
+                return
+            if patient is None:
+                return
+            self.patient_combo.blockSignals(True)
+            self.patient_combo.insertItem(1, f"{patient.name} (ID: {patient.id})", patient.id)
+            self.patient_combo.blockSignals(False)
+            self.preloaded_ids.add(patient.id)
+            index = 1
+        self.patient_combo.setCurrentIndex(index)
     
     def get_selected_patient_id(self):
         """Get the currently selected patient ID"""
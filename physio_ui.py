@@ -3,12 +3,15 @@ from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLabel, QPushBut
                             QListWidget, QComboBox, QProgressBar, QSlider, QFrame, QSizePolicy)
 from PyQt5.QtCore import Qt, pyqtSignal, QTimer
 from PyQt5.QtGui import QPixmap, QFont
-import pandas as pd
 import numpy as np
 import os
-import random
 from patient_dropdown import PatientDropdown
 
+# Number of recent weeks shown in the progress report
+PROGRESS_WEEKS = 5
+# Improvement in percentage points set as the next goal
+PROGRESS_GOAL_STEP = 5
+
 class PhysioUI(QWidget):
     # Signal for navigation
     navigate_to_signal = pyqtSignal(str)
@@ -532,14 +535,17 @@ class PhysioUI(QWidget):
             # Calculate total score as average of all category scores
             total_score = sum(self.rom_scores.values()) / len(self.rom_scores)
             
-            # Update the patient's physio score in the database
-            db.update_assessment_score(patient_id, "Physio", total_score)
-            
-            # Record details for each category
+            # Queue the physio score and one detail record per category; the
+            # writer commits them together in a single transaction
+            futures = [db.submit_assessment_score(patient_id, "Physio", total_score,
+                                                  {"scores": dict(self.rom_scores)})]
             for category, score in self.rom_scores.items():
                 detail = f"{category} ROM Assessment: {score}%"
-                # Add more detailed assessment record
-                db.update_detailed_assessment(patient_id, "Physio", score, detail, category)
+                futures.append(db.submit_detailed_assessment(patient_id, "Physio", score, detail, category))
+            
+            # Wait for the commit so the confirmation below is accurate
+            if not all(future.result(timeout=10) for future in futures):
+                raise RuntimeError(f"Patient ID {patient_id} not found")
             
             QMessageBox.information(self, "Success", f"Assessment data saved successfully for {patient_name}")
             
@@ -631,66 +637,51 @@ class PhysioUI(QWidget):
             from db_utils import db
             
             # Get patient data from database matching the name
-            patient_data = db.get_patient_by_name(patient_name)
+            patient_data = db.search_patients(patient_name, limit=1)
             
-            if patient_data.empty:
+            if not patient_data:
                 QMessageBox.warning(self, "Patient Not Found", f"No patient found with name containing '{patient_name}'.")
                 return
                 
             # Get first matching patient
-            patient = patient_data.iloc[0]
+            patient = patient_data[0]
             
             # Create progress report
-            progress_text = f"<h3>Progress Report for {patient['name']}</h3>"
-            progress_text += f"<p><b>Age:</b> {patient['age']}</p>"
-            progress_text += f"<p><b>Gender:</b> {patient['gender']}</p>"
-            
-            # Function to generate random progress data
-            def generate_progress_data():
-                initial = random.randint(30, 50)
-                progress = []
-                for i in range(5):
-                    value = initial + i * random.randint(5, 10)
-                    value = min(value, 100)  # Cap at 100
-                    progress.append(value)
-                return progress
-                
-            # Example progress data (would be loaded from a database in a real app)
-            upper_extremity_progress = generate_progress_data()
-            lower_extremity_progress = generate_progress_data()
-            trunk_core_progress = generate_progress_data()
+            progress_text = f"<h3>Progress Report for {patient.name}</h3>"
+            progress_text += f"<p><b>Age:</b> {patient.age}</p>"
+            progress_text += f"<p><b>Gender:</b> {patient.gender}</p>"
             
-            # Create progress bars
-            progress_text += "<h4>Upper Extremity Progress</h4>"
-            for i, value in enumerate(upper_extremity_progress):
-                progress_text += f"<p>Week {i+1}: <meter value='{value}' min='0' max='100'></meter> {value}%</p>"
+            # Weekly averages of each ROM category, read from the rollups
+            db.refresh_rollups()
+            goals_text = ""
+            for category in self.rom_scores:
+                trend = db.get_score_trend(patient.id, "Physio", "week", category=category, refresh=False)
+                progress_text += f"<h4>{category} Progress</h4>"
+                if len(trend.bucket) == 0:
+                    progress_text += "<p>No assessments recorded yet</p>"
+                    continue
                 
-            progress_text += "<h4>Lower Extremity Progress</h4>"
-            for i, value in enumerate(lower_extremity_progress):
-                progress_text += f"<p>Week {i+1}: <meter value='{value}' min='0' max='100'></meter> {value}%</p>"
+                for week, value in zip(trend.bucket[-PROGRESS_WEEKS:], trend.mean[-PROGRESS_WEEKS:]):
+                    value = round(float(value))
+                    progress_text += f"<p>Week of {week}: <meter value='{value}' min='0' max='100'></meter> {value}%</p>"
                 
-            progress_text += "<h4>Trunk/Core Progress</h4>"
-            for i, value in enumerate(trunk_core_progress):
-                progress_text += f"<p>Week {i+1}: <meter value='{value}' min='0' max='100'></meter> {value}%</p>"
+                # Project the goal from the slope of the recent weekly averages
+                latest = round(float(trend.mean[-1]))
+                goal = min(100, latest + PROGRESS_GOAL_STEP)
+                recent = slice(-PROGRESS_WEEKS, None)
+                weeks = (trend.bucket[recent] - trend.bucket[recent][0]).astype(np.int64) / 7
+                slope = np.polyfit(weeks, trend.mean[recent], 1)[0] if len(weeks) > 1 else 0
+                if goal <= latest:
+                    goals_text += f"<p>{category}: {latest}% (goal reached)</p>"
+                elif slope > 0:
+                    weeks_to_goal = int(np.ceil((goal - latest) / slope))
+                    goals_text += f"<p>{category}: {latest}% → {goal}% (in {weeks_to_goal} weeks)</p>"
+                else:
+                    goals_text += f"<p>{category}: {latest}% → {goal}% (not yet improving)</p>"
                 
             # Add projected goals
-            progress_text += "<h4>Projected Goals</h4>"
-            
-            # Calculate latest values from progress data
-            latest_upper = upper_extremity_progress[-1]
-            latest_lower = lower_extremity_progress[-1]
-            latest_trunk = trunk_core_progress[-1]
-            
-            # Calculate goal values (aim for 5-10% improvement)
-            goal_upper = min(100, latest_upper + random.randint(5, 10))
-            goal_lower = min(100, latest_lower + random.randint(5, 10))
-            goal_trunk = min(100, latest_trunk + random.randint(5, 10))
-            
-            # Add goals with projected timeframe
-            weeks_to_goal = random.randint(2, 4)
-            progress_text += f"<p>Upper Extremity: {latest_upper}% → {goal_upper}% (in {weeks_to_goal} weeks)</p>"
-            progress_text += f"<p>Lower Extremity: {latest_lower}% → {goal_lower}% (in {weeks_to_goal} weeks)</p>"
-            progress_text += f"<p>Trunk/Core: {latest_trunk}% → {goal_trunk}% (in {weeks_to_goal} weeks)</p>"
+            if goals_text:
+                progress_text += "<h4>Projected Goals</h4>" + goals_text
             
             # Set the HTML content
             self.progress_display.setText(progress_text)
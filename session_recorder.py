@@ -0,0 +1,174 @@
+"""
+Optional video recording of assessment sessions for clinical review.
+
+The game threads hand their annotated frames to a SessionRecorder, which only
+puts them on a bounded queue. A background encoder thread writes the frames
+into fixed-length video segments and keeps a time index (index.json) so a
+reviewer can jump to any moment of the session. When the disk can't keep up
+the queue drops frames instead of stalling the game, and the drops are counted
+and written to the index.
+
+Recording is off unless the NEUROWELL_RECORDINGS_DIR environment variable
+points to a directory.
+"""
+
+import os
+import re
+import json
+import time
+import queue
+import threading
+from datetime import datetime
+import cv2
+
+RECORDINGS_DIR = os.environ.get("NEUROWELL_RECORDINGS_DIR")
+RECORD_FPS = 30  # Nominal frame rate written to the video headers
+SEGMENT_SECONDS = 10  # Length of each video segment
+QUEUE_SIZE = 60  # About two seconds of frames at 30 fps
+FOURCC = "MJPG"  # Cheap to encode and seeks frame-accurately
+
+_STOP = object()
+
+
+class SessionRecorder(threading.Thread):
+    """Background encoder thread fed through a bounded, non-blocking frame queue"""
+
+    def __init__(self, output_dir, fps=RECORD_FPS, segment_seconds=SEGMENT_SECONDS,
+                 queue_size=QUEUE_SIZE):
+        """Initialize the recorder
+
+        Args:
+            output_dir: Directory for this session's segments and index
+            fps: Nominal frame rate of the written videos
+            segment_seconds: Length of each segment file in seconds
+            queue_size: Maximum number of frames waiting to be encoded
+        """
+        super().__init__(daemon=True)
+        self.output_dir = output_dir
+        self.fps = fps
+        self.segment_seconds = segment_seconds
+        self.frames = queue.Queue(maxsize=queue_size)
+        self.start_time = None
+        self.submitted = 0
+        self.dropped = 0
+        self.written = 0
+        self.segments = []
+        self.writer = None
+
+    def submit(self, frame):
+        """Queue an annotated frame for encoding without ever blocking the caller
+
+        The frame must not be modified after it is submitted.
+        """
+        if self.start_time is None:
+            self.start_time = time.monotonic()
+        self.submitted += 1
+        try:
+            self.frames.put_nowait((time.monotonic() - self.start_time, frame))
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        """Flush the queued frames, finish the last segment and write the index"""
+        # The sentinel must get through even when the queue is full
+        if self.is_alive():
+            self.frames.put(_STOP)
+            self.join()
+        print(f"Session recording saved to {self.output_dir}: {self.written} frames written, "
+              f"{self.dropped} dropped of {self.submitted}")
+        return self.stats()
+
+    def stats(self):
+        """Frame counts for this recording"""
+        return {
+            "submitted": self.submitted,
+            "written": self.written,
+            "dropped": self.dropped,
+            "segments": len(self.segments),
+        }
+
+    def run(self):
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            while True:
+                item = self.frames.get()
+                if item is _STOP:
+                    break
+                timestamp, frame = item
+                self._write(timestamp, frame)
+        except Exception as e:
+            print(f"Error recording session video: {e}")
+        finally:
+            self._finish_segment()
+            self._write_index()
+
+    def _write(self, timestamp, frame):
+        """Write one frame, starting a new segment when the current one is full"""
+        segment = self.segments[-1] if self.segments else None
+        if (segment is None or self.writer is None
+                or timestamp - segment["start_time"] >= self.segment_seconds):
+            self._finish_segment()
+            self._start_segment(timestamp, frame)
+            segment = self.segments[-1]
+
+        self.writer.write(frame)
+        segment["timestamps"].append(round(timestamp, 3))
+        segment["end_time"] = round(timestamp, 3)
+        self.written += 1
+
+    def _start_segment(self, timestamp, frame):
+        """Open the video file for the next segment"""
+        filename = f"segment_{len(self.segments):03d}.avi"
+        height, width = frame.shape[:2]
+        self.writer = cv2.VideoWriter(os.path.join(self.output_dir, filename),
+                                      cv2.VideoWriter_fourcc(*FOURCC), self.fps, (width, height))
+        self.segments.append({
+            "file": filename,
+            "first_frame": self.written,
+            "start_time": round(timestamp, 3),
+            "end_time": round(timestamp, 3),
+            "timestamps": [],
+        })
+
+    def _finish_segment(self):
+        if self.writer is not None:
+            self.writer.release()
+            self.writer = None
+
+    def _write_index(self):
+        """Write the seek index: per segment, its time range and every frame's timestamp"""
+        index = {
+            "fps": self.fps,
+            "segment_seconds": self.segment_seconds,
+            "submitted_frames": self.submitted,
+            "written_frames": self.written,
+            "dropped_frames": self.dropped,
+            "segments": self.segments,
+        }
+        try:
+            with open(os.path.join(self.output_dir, "index.json"), "w") as f:
+                json.dump(index, f, indent=2)
+        except Exception as e:
+            print(f"Error writing recording index: {e}")
+
+
+def start_session_recording(game_name, patient_name=None, recordings_dir=None):
+    """Start a recorder for a game session if recording is enabled
+
+    Returns:
+        SessionRecorder or None if recording is disabled
+    """
+    recordings_dir = recordings_dir or RECORDINGS_DIR
+    if not recordings_dir:
+        return None
+
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    parts = [stamp, game_name]
+    if patient_name:
+        parts.append(str(patient_name))
+    session_name = re.sub(r"[^A-Za-z0-9_-]+", "_", "_".join(parts))
+
+    recorder = SessionRecorder(os.path.join(recordings_dir, session_name))
+    recorder.start()
+    print(f"Recording {game_name} session to {recorder.output_dir}")
+    return recorder
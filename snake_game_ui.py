@@ -12,6 +12,8 @@ from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLabel, QPushBut
 from PyQt5.QtCore import Qt, pyqtSignal, QTimer, QThread, pyqtSlot
 from PyQt5.QtGui import QPixmap, QFont, QImage
 from cvzone.HandTrackingModule import HandDetector
+from hand_tracking import GatedHandDetector, SkeletonRenderer, print_gate_stats
+from session_recorder import start_session_recording
 
 # Set a higher resolution for the webcam for better visibility
 WEBCAM_WIDTH = 640
@@ -109,8 +111,11 @@ class VideoThread(QThread):
     def __init__(self):
         super().__init__()
         self.running = False
+        self.recorder = None
         self.game = None
         self.detector = None
+        # Draws the detected hand skeleton, set enabled=False for headless scoring
+        self.skeleton = SkeletonRenderer()
         self.patient_id = None
         self.patient_name = None
         # Add buffer for smoother display
@@ -122,7 +127,7 @@ class VideoThread(QThread):
         # Initialize detector with improved settings for better accuracy
         try:
             print("Initializing hand detector...")
-            self.detector = HandDetector(detectionCon=0.7, maxHands=1)
+            self.detector = GatedHandDetector(HandDetector(detectionCon=0.7, maxHands=1))
             print("Hand detector initialized successfully")
         except Exception as e:
             print(f"Error initializing hand detector: {e}")
@@ -208,6 +213,11 @@ class VideoThread(QThread):
         # Create static UI elements
         self.create_static_overlays()
         
+        # Optional session recording, fed from the frame signal inside this thread
+        self.recorder = start_session_recording("Snake", self.patient_name)
+        if self.recorder:
+            self.change_pixmap_signal.connect(self.recorder.submit, Qt.DirectConnection)
+        
         self.running = True
         print("Starting game loop...")
         while self.running:
@@ -269,14 +279,9 @@ class VideoThread(QThread):
                 
                 try:
                     if self.detector is not None:
-                        # Create a clean frame for hand detection
-                        detection_frame = img.copy()
-                        
-                        # Explicitly set draw parameter to True for better visualization
-                        hands, detection_frame = self.detector.findHands(detection_frame, flipType=False, draw=True)
-                        
-                        # Use the detection result frame
-                        img = detection_frame
+                        # Detect on the frame as-is, then draw the skeleton separately
+                        hands = self.detector.detect(img, flipType=False)
+                        self.skeleton.draw(img, hands)
                         
                         if hands:
                             # Get the position of the index finger
@@ -400,7 +405,8 @@ class VideoThread(QThread):
                 if not self.game_over_shown:
                     # Update the patient's score in database
                     print(f"Updating score for patient ID: {self.patient_id} with score: {self.game.score}")
-                    self.update_snake_score(self.patient_id, self.game.score)
+                    self.update_snake_score(self.patient_id, self.game.score,
+                                            {"duration_s": round(elapsed_time, 1), "frames": frame_count})
                     
                     # Send game over signal
                     print(f"Emitting game_over_signal with score: {self.game.score}")
@@ -418,8 +424,17 @@ class VideoThread(QThread):
             frame_count += 1
         
         # Release resources
+        if self.recorder:
+            self.change_pixmap_signal.disconnect(self.recorder.submit)
+            self.recorder.close()
+            self.recorder = None
+        
         print("Releasing camera resources...")
         cap.release()
+        print_gate_stats("Snake game", self.detector)
+        # Release the database connection this thread used for the score update
+        from db_utils import db
+        db.close_thread_connection()
         print("Game thread finished")
     
     def stop(self):
@@ -432,17 +447,16 @@ class VideoThread(QThread):
         self.base_frame = None
         gc.collect()  # Force garbage collection
     
-    def update_snake_score(self, patient_id, score):
-        """Update the patient's snake game score in the database"""
+    def update_snake_score(self, patient_id, score, data=None):
+        """Update the patient's snake game score in the database, with optional session data"""
         try:
             print(f"Updating snake score for patient ID: {patient_id} with score: {score}")
             from db_utils import db
+            from db_writer import print_write_result
             
-            # Update score directly using patient ID
-            if db.update_assessment_score(patient_id, "Snake", score):
-                print(f"Successfully updated Snake score to {score} for patient ID {patient_id}")
-            else:
-                print(f"Failed to update Snake score for patient ID {patient_id}")
+            # Queue the score for the database writer so the game thread never waits on disk
+            print_write_result(db.submit_assessment_score(patient_id, "Snake", score, data),
+                               f"Snake score {score} for patient ID {patient_id}")
         except Exception as e:
             print(f"Error updating snake score: {e}")
             import traceback
@@ -0,0 +1,22 @@
+"""Tests for the read cache"""
+
+import contextlib
+import io
+
+from db_utils import DatabaseManager
+
+
+def test_changing_a_returned_page_leaves_the_cached_page_alone(tmp_path):
+    with contextlib.redirect_stdout(io.StringIO()):
+        manager = DatabaseManager(tmp_path / "cache.db")
+    try:
+        page = manager.get_patients_page(limit=5, with_total=False)
+        expected = list(page.patients)
+        page.patients.clear()
+
+        hits = manager.cache_stats()["hits"]
+        again = manager.get_patients_page(limit=5, with_total=False)
+        assert manager.cache_stats()["hits"] == hits + 1
+        assert again.patients == expected
+    finally:
+        manager.close()
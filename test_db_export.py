@@ -0,0 +1,28 @@
+"""Tests for the streaming exports"""
+
+import contextlib
+import io
+
+from db_export import NPZ_MISSING_ID, export_history_npz, load_history_npz
+from db_utils import DatabaseManager
+
+
+def test_npz_export_writes_a_missing_patient_id_as_the_sentinel(tmp_path):
+    with contextlib.redirect_stdout(io.StringIO()):
+        manager = DatabaseManager(tmp_path / "export.db")
+    try:
+        conn = manager.get_connection()
+        # Migration 4 keeps results whose patient_id is NULL
+        conn.execute("INSERT INTO assessment_results (patient_id, assessment_type, score, assessment_date) "
+                     "VALUES (NULL, 'Snake', 42.0, 1700000000000)")
+        conn.commit()
+        total = conn.execute("SELECT COUNT(*) FROM assessment_results").fetchone()[0]
+
+        assert export_history_npz(manager, tmp_path / "history.npz") == total
+        columns = load_history_npz(tmp_path / "history.npz")
+        orphans = columns["patient_id"] == NPZ_MISSING_ID
+        assert orphans.sum() == 1
+        assert columns["score"][orphans].tolist() == [42.0]
+        assert (columns["patient_id"][~orphans] > 0).all()
+    finally:
+        manager.close()
@@ -0,0 +1,67 @@
+"""Tests for the schema migrations and the triggers they create"""
+
+import contextlib
+import io
+import sqlite3
+
+from db_migrations import migrate, rebuild_assessment_summary
+from db_utils import DatabaseManager
+
+
+def _migrated():
+    conn = sqlite3.connect(":memory:", isolation_level=None)
+    with contextlib.redirect_stdout(io.StringIO()):
+        migrate(conn)
+    conn.execute("PRAGMA foreign_keys=ON")
+    conn.execute("INSERT INTO patients (id, name) VALUES (1, 'Test Patient')")
+    return conn
+
+
+def _summary(conn):
+    return conn.execute("""
+    SELECT lower(assessment_type), count, min_score, max_score, latest_score, latest_result_id
+    FROM assessment_summary ORDER BY 1
+    """).fetchall()
+
+
+def test_summary_recompute_matches_every_spelling_of_a_type():
+    conn = _migrated()
+    conn.executemany(
+        "INSERT INTO assessment_results (patient_id, assessment_type, score, assessment_date) VALUES (1, ?, ?, ?)",
+        [("Ball", 10.0, 1000), ("BALL", 11.0, 2000), ("bAll", 30.0, 3000), ("Ball", 20.0, 4000)])
+
+    # Removing the lowest and then the latest "Ball" result recomputes min
+    # and latest, which are now "BALL" and "bAll" results
+    conn.execute("DELETE FROM assessment_results WHERE score = 10")
+    conn.execute("DELETE FROM assessment_results WHERE score = 20")
+    after_triggers = _summary(conn)
+    rebuild_assessment_summary(conn)
+
+    assert after_triggers == _summary(conn)
+    assert after_triggers == [("ball", 2, 11.0, 30.0, 30.0, 3)]
+
+
+def test_results_added_after_the_date_migration_are_rolled_up(tmp_path):
+    # A version 7 database whose newest results were deleted after a rollup refresh
+    path = tmp_path / "v7.db"
+    conn = sqlite3.connect(path)
+    with contextlib.redirect_stdout(io.StringIO()):
+        migrate(conn, 7)
+    conn.execute("INSERT INTO patients (id, name) VALUES (1, 'Test Patient')")
+    conn.executemany(
+        "INSERT INTO assessment_results (patient_id, assessment_type, score, assessment_date) VALUES (1, 'Snake', ?, ?)",
+        [(50.0 + day, f"2024-01-0{day} 10:00:00") for day in range(1, 6)])
+    conn.execute("UPDATE rollup_state SET high_water = 5")
+    conn.execute("DELETE FROM assessment_results WHERE id > 3")
+    conn.commit()
+    conn.close()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        manager = DatabaseManager(path)
+    try:
+        assert manager.update_assessment_score(1, "Snake", 90.0)
+        new_id = manager.get_connection().execute("SELECT MAX(id) FROM assessment_results").fetchone()[0]
+        assert new_id == 6
+        assert 90.0 in manager.get_score_trend(1, "Snake", "day").max_score.tolist()
+    finally:
+        manager.close()
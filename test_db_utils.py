@@ -0,0 +1,46 @@
+"""Tests for DatabaseManager"""
+
+import contextlib
+import io
+
+from db_utils import DatabaseManager
+
+
+def test_new_database_file_is_seeded(tmp_path):
+    manager = DatabaseManager(tmp_path / "new.db")
+    try:
+        assert len(manager.fetch_patients()) == 10
+    finally:
+        manager.close()
+
+
+def test_existing_database_file_is_not_seeded_again(tmp_path):
+    path = tmp_path / "existing.db"
+    DatabaseManager(path).close()
+    manager = DatabaseManager(path)
+    try:
+        assert len(manager.fetch_patients()) == 10
+    finally:
+        manager.close()
+
+
+def _site(path, names):
+    with contextlib.redirect_stdout(io.StringIO()):
+        manager = DatabaseManager(path)
+        for name in names:
+            manager.add_patient(name, 60, "Female")
+    manager.close()
+
+
+def test_search_all_sites_takes_matches_from_every_site(tmp_path):
+    _site(tmp_path / "north.db", [f"Ann Smith {n}" for n in range(10)])
+    _site(tmp_path / "south.db", ["Bob Smith", "Cy Smith"])
+    with contextlib.redirect_stdout(io.StringIO()):
+        manager = DatabaseManager(tmp_path / "north.db", site="north", sites={"south": tmp_path / "south.db"})
+    try:
+        found = manager.search_patients_all_sites("Smith", limit=4)
+    finally:
+        manager.close()
+
+    assert len(found) == 4
+    assert [patient.site for patient in found].count("south") == 2